@@ -0,0 +1,167 @@
+"""
+Prompt evaluation time per chat turn with the old and the stable prompt layout.
+
+"inline" sends the instructions with the documentation source filled in
+part way through them, followed by the history, documentation and question,
+as one prompt like the chat did before. "system" sends the same
+instructions as a fixed system message with only the per-turn parts after
+it, so Ollama can reuse the evaluated prefix of the previous turn. Both use
+the same context window, so only the layout differs. Needs a running Ollama
+with the model installed, run from the repository root:
+
+    python benchmarks/prompt_cache.py
+    python benchmarks/prompt_cache.py --model gemma3:12b --turns 8 --json prompt_cache.json
+"""
+
+import json
+import random
+import statistics
+
+import ollama
+
+from argparse import ArgumentParser
+from IntuneBuddy.config import KEEP_ALIVE, NUM_CTX, question_template, system_template
+from IntuneBuddy.context import CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET
+from IntuneBuddy.history import ConversationHistory
+
+MODES = ["inline", "system"]
+QUESTIONS = [
+    "How do I enroll macOS devices with Automated Device Enrollment?",
+    "Which platforms support compliance policies?",
+    "How can I deploy a PowerShell script to Windows devices?",
+    "What does error 0x80180014 mean during enrollment?",
+    "How do I assign an app to a device group?",
+    "Can I wipe a lost iPhone remotely?",
+    "How do I configure Windows Hello for Business?",
+    "What is the difference between required and available apps?",
+]
+WORDS = (
+    "device enrollment policy profile compliance configuration assignment group "
+    "platform windows macos ios android app deployment script setting tenant "
+    "user autopilot update ring certificate wipe retire sync report admin center"
+).split()
+
+
+def documentation(turn, tokens, seed):
+    """Pseudo documentation of about tokens tokens, different every turn."""
+    rng = random.Random(seed * 1000 + turn)
+    text = []
+    while len(" ".join(text)) < tokens * CHARS_PER_TOKEN:
+        text.append(rng.choice(WORDS))
+    return " ".join(text), f"protect/topic-{turn}"
+
+
+def turn_inputs(question, history, docs, source):
+    return {
+        "history": history,
+        "Intune_docs": docs,
+        "metadata_source": source,
+        "question": question,
+    }
+
+
+def run_turn(client, mode, model, inputs, options, keep_alive):
+    if mode == "inline":
+        # The source sat in the link instructions, so the prompt changed there
+        instructions = system_template().replace("<source>", inputs["metadata_source"])
+        response = client.generate(
+            model=model,
+            prompt=instructions + question_template().format(**inputs),
+            options=options,
+            keep_alive=keep_alive,
+        )
+        answer = response["response"]
+    else:
+        response = client.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_template()},
+                {"role": "user", "content": question_template().format(**inputs)},
+            ],
+            options=options,
+            keep_alive=keep_alive,
+        )
+        answer = response["message"]["content"]
+    return answer, response["prompt_eval_count"], response["prompt_eval_duration"]
+
+
+def run(client, mode, model, turns, context_tokens, max_tokens, keep_alive, seed):
+    options = {"num_ctx": NUM_CTX, "num_predict": max_tokens, "seed": seed}
+    history = ConversationHistory()
+    results = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        docs, source = documentation(turn, context_tokens, seed)
+        inputs = turn_inputs(question, history.render(), docs, source)
+        answer, evaluated, duration = run_turn(
+            client, mode, model, inputs, options, keep_alive
+        )
+        history.add(question, answer)
+        results.append(
+            {
+                "turn": turn + 1,
+                "prompt_eval_tokens": evaluated,
+                "prompt_eval_ms": round(duration / 1e6, 1),
+            }
+        )
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default="gemma3:12b")
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--context-tokens", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument(
+        "--max-tokens", type=int, default=64, help="Tokens generated per turn."
+    )
+    parser.add_argument("--keep-alive", default=KEEP_ALIVE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    client = ollama.Client()
+    report = {}
+    for mode in MODES:
+        report[mode] = run(
+            client,
+            mode,
+            args.model,
+            args.turns,
+            args.context_tokens,
+            args.max_tokens,
+            args.keep_alive,
+            args.seed,
+        )
+
+    print(
+        f"{'turn':<6}" + "".join(f"{mode + ' ms':>14}{'tokens':>8}" for mode in MODES)
+    )
+    for turn in range(args.turns):
+        print(
+            f"{turn + 1:<6}"
+            + "".join(
+                f"{report[mode][turn]['prompt_eval_ms']:>14.1f}"
+                f"{report[mode][turn]['prompt_eval_tokens']:>8}"
+                for mode in MODES
+            )
+        )
+    # The first turn of each mode has nothing to reuse
+    for mode in MODES:
+        later = [result["prompt_eval_ms"] for result in report[mode][1:]]
+        if later:
+            print(
+                f"{mode}: mean prompt eval after the first turn {statistics.mean(later):.1f} ms"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"model": args.model, "num_ctx": NUM_CTX, "results": report},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
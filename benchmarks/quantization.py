@@ -0,0 +1,180 @@
+"""
+Recall@8 and latency of the read-only export with and without quantization.
+
+The baseline is the ranking of the current retriever: an exact float search
+for the synthetic corpus, or Chroma itself with --chroma. Run from the
+repository root:
+
+    python benchmarks/quantization.py
+    python benchmarks/quantization.py --chroma --queries 200
+"""
+
+import os
+import json
+import time
+import tempfile
+import numpy as np
+
+from argparse import ArgumentParser
+from IntuneBuddy.readonly import IVF_NPROBE, ReadOnlyVectorStore, export_index
+
+K = 8
+MODES = [None, "int8", "binary"]
+SCANNED = {None: "vectors.npy", "int8": "int8.npy", "binary": "binary.npy"}
+VECTOR_FILES = ["vectors.npy", "int8.npy", "scale.npy", "binary.npy", "float16.npy"]
+
+
+class InMemoryCollection:
+    """Minimal stand-in for Chroma's get() over a vector matrix."""
+
+    def __init__(self, ids, vectors):
+        self.ids = ids
+        self.vectors = vectors
+
+    def get(self, include, limit, offset):
+        ids = self.ids[offset : offset + limit]
+        return {
+            "ids": ids,
+            "documents": [""] * len(ids),
+            "metadatas": [{}] * len(ids),
+            "embeddings": self.vectors[offset : offset + limit],
+        }
+
+
+def synthetic_corpus(count, dim, topics, seed):
+    """Normalized vectors scattered around topic centers, like doc chunks."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, count)]
+    vectors += 0.6 * rng.normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [f"chunk-{i}" for i in range(count)], vectors
+
+
+def chroma_corpus():
+    from IntuneBuddy.vector import open_vector_store
+
+    vector_store = open_vector_store()
+    data = vector_store.get(include=["embeddings"])
+    return vector_store, list(data["ids"]), np.asarray(data["embeddings"], np.float32)
+
+
+def make_queries(vectors, count, seed):
+    """Perturbed corpus vectors, so queries are near but not on a chunk."""
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.choice(len(vectors), count, replace=False)]
+    noise = rng.normal(size=picks.shape).astype(np.float32) / np.sqrt(picks.shape[1])
+    queries = picks + 0.3 * noise
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(ids, vectors, queries):
+    results = []
+    for query in queries:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        results.append({ids[i] for i in np.argsort(distances)[:K]})
+    return results
+
+
+def chroma_top_k(vector_store, queries):
+    return [
+        {
+            doc.id
+            for doc, _ in vector_store.similarity_search_by_vector_with_relevance_scores(
+                query.tolist(), k=K
+            )
+        }
+        for query in queries
+    ]
+
+
+def directory_size(directory, names=None):
+    """Bytes of the named files in directory, or of all of them."""
+    names = os.listdir(directory) if names is None else names
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in names
+        if os.path.exists(os.path.join(directory, name))
+    )
+
+
+def run(ids, vectors, queries, baseline, nprobe):
+    collection = InMemoryCollection(ids, vectors)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantization in MODES:
+            directory = os.path.join(tmp, str(quantization))
+            export_index(collection, directory, quantization=quantization)
+            store = ReadOnlyVectorStore(directory, embeddings=None, nprobe=nprobe)
+
+            latencies = []
+            recalls = []
+            for query, expected in zip(queries, baseline):
+                start = time.perf_counter()
+                hits = store.similarity_search_by_vector_with_relevance_scores(
+                    query, k=K
+                )
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len({doc.id for doc, _ in hits} & expected) / K)
+            store.close()
+
+            results.append(
+                {
+                    "quantization": quantization or "float32",
+                    "recall_at_8": round(float(np.mean(recalls)), 4),
+                    "p50_ms": round(float(np.median(latencies)) * 1000, 3),
+                    # The whole export, chunk texts included
+                    "disk_bytes": directory_size(directory),
+                    "vector_bytes": directory_size(directory, VECTOR_FILES),
+                    # The matrix the IVF lists are scanned in
+                    "scanned_bytes": directory_size(directory, [SCANNED[quantization]]),
+                }
+            )
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--chroma", action="store_true", help="Use the local vector store."
+    )
+    parser.add_argument("--count", type=int, default=20000, help="Synthetic chunks.")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    if args.chroma:
+        vector_store, ids, vectors = chroma_corpus()
+        queries = make_queries(vectors, args.queries, args.seed)
+        baseline = chroma_top_k(vector_store, queries)
+    else:
+        ids, vectors = synthetic_corpus(args.count, args.dim, 200, args.seed)
+        queries = make_queries(vectors, args.queries, args.seed)
+        baseline = exact_top_k(ids, vectors, queries)
+
+    results = run(ids, vectors, queries, baseline, args.nprobe)
+    print(
+        f"{'mode':<10}{'recall@8':>10}{'p50 ms':>10}"
+        f"{'disk MB':>10}{'vector MB':>12}{'scanned MB':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['quantization']:<10}{result['recall_at_8']:>10.3f}"
+            f"{result['p50_ms']:>10.2f}{result['disk_bytes'] / 2**20:>10.1f}"
+            f"{result['vector_bytes'] / 2**20:>12.1f}"
+            f"{result['scanned_bytes'] / 2**20:>12.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"chunks": len(ids), "queries": len(queries), "results": results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Ingestion, retrieval and chat loop benchmarks on a synthetic corpus.
+
+Everything runs against the markdown corpus and the fake embedder and chat
+model of benchmarks/synthetic.py, so no network, Ollama or IntuneDocs
+checkout is needed and runs are comparable over time. Measures:
+
+- scan: hashing and splitting the docs with get_intune_docs, and a rescan
+  where every file is unchanged
+- insert: embedding and storing the chunks with add_documents_in_batches
+- retrieval: p50/p95 latency of the hybrid retriever at several corpus
+  sizes, on Chroma and on the read-only export
+- chat: time the chat engine spends per question outside the model
+
+Run from the repository root:
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --sizes 1000,10000 --json bench.json
+    python benchmarks/suite.py --only retrieval chat
+"""
+
+import os
+
+# Chroma would otherwise send telemetry
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import sys
+import json
+import time
+import asyncio
+import platform
+import tempfile
+import numpy as np
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+from synthetic import (
+    FakeChain,
+    FakeEmbeddings,
+    iter_corpus,
+    make_questions,
+    write_corpus,
+)
+from IntuneBuddy.chunking import split_markdown
+from IntuneBuddy.context import ContextPacker, RERANK_FETCH_K
+from IntuneBuddy.engine import ChatEngine
+from IntuneBuddy.history import ConversationHistory
+from IntuneBuddy.ingest import FileDone, build_documents, iter_markdown_files
+from IntuneBuddy.lexical import LexicalIndex
+from IntuneBuddy.readonly import ReadOnlyVectorStore, export_index
+from IntuneBuddy.retrieval import HybridRetriever
+from IntuneBuddy.scope import infer_scope
+from IntuneBuddy.service import RetrieverService
+from IntuneBuddy.vector import (
+    COLLECTION_NAME,
+    add_documents_in_batches,
+    get_intune_docs,
+)
+
+BENCHMARKS = ["scan", "insert", "retrieval", "chat"]
+
+
+def percentiles(seconds):
+    """p50 and p95 in milliseconds."""
+    p50, p95 = np.percentile(np.asarray(seconds) * 1000, [50, 95])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3)}
+
+
+def open_chroma(directory, embeddings):
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        persist_directory=directory,
+        embedding_function=embeddings,
+    )
+
+
+def synthetic_documents(chunks, seed):
+    """
+    Split docs of the corpus in memory until there are chunks Documents.
+
+    Returns the Documents and the number of docs they came from.
+    """
+    documents = []
+    docs = 0
+    for relative_path, text in iter_corpus(seed):
+        if len(documents) >= chunks:
+            break
+        documents += build_documents(
+            relative_path, split_markdown(text), "intune-service"
+        )
+        docs += 1
+    return documents[:chunks], docs
+
+
+def bench_scan(tmp, args):
+    base_dir = write_corpus(os.path.join(tmp, "docs"), args.files, args.seed)
+    files = list(iter_markdown_files([base_dir]))
+    size = sum(os.path.getsize(path) for path, _ in files)
+
+    file_index = {}
+    start = time.perf_counter()
+    chunks = 0
+    for item in get_intune_docs(file_index, files):
+        if isinstance(item, FileDone):
+            file_index[item.relative_path] = item.file_hash
+        else:
+            chunks += 1
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    unchanged = sum(1 for _ in get_intune_docs(file_index, files))
+    rescan = time.perf_counter() - start
+
+    return {
+        "files": len(files),
+        "chunks": chunks,
+        "megabytes": round(size / 2**20, 3),
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(files) / elapsed, 1),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "mb_per_s": round(size / 2**20 / elapsed, 2),
+        "rescan_seconds": round(rescan, 3),
+        "rescan_items": unchanged,
+    }
+
+
+def bench_insert(tmp, args):
+    base_dir = write_corpus(os.path.join(tmp, "insert-docs"), args.files, args.seed)
+    files = list(iter_markdown_files([base_dir]))
+    # Split up front, so only embedding and storing is timed
+    items = list(get_intune_docs({}, files))
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    vector_store = open_chroma(os.path.join(tmp, "insert-db"), embeddings)
+
+    file_index = {}
+    start = time.perf_counter()
+    committed, failed = add_documents_in_batches(
+        vector_store, iter(items), file_index, show_progress=False
+    )
+    elapsed = time.perf_counter() - start
+    chunks = sum(1 for item in items if not isinstance(item, FileDone))
+
+    return {
+        "chunks": chunks,
+        "files": len(committed),
+        "failed": len(failed),
+        "embedding_calls": embeddings.calls,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 1),
+    }
+
+
+def build_index(tmp, chunks, embeddings, seed):
+    """
+    Chroma store, lexical index and read-only export of chunks Documents.
+
+    Returns them with the number of docs indexed.
+    """
+    documents, docs = synthetic_documents(chunks, seed)
+    directory = os.path.join(tmp, f"retrieval-{chunks}")
+    vector_store = open_chroma(os.path.join(directory, "chroma_db"), embeddings)
+    for i in range(0, len(documents), 4000):
+        vector_store.add_documents(documents[i : i + 4000])
+    lexical_index = LexicalIndex(os.path.join(directory, "lexical_index.db"))
+    lexical_index.add(documents)
+    export_index(vector_store, os.path.join(directory, "readonly_index"))
+    readonly = ReadOnlyVectorStore(
+        os.path.join(directory, "readonly_index"), embeddings
+    )
+    return vector_store, readonly, lexical_index, docs
+
+
+def bench_retrieval(tmp, args):
+    embeddings = FakeEmbeddings()
+    results = []
+    for size in args.sizes:
+        vector_store, readonly, lexical_index, docs = build_index(
+            tmp, size, embeddings, args.seed
+        )
+        questions = make_questions(args.queries, docs, args.seed)
+        query_embeddings = embeddings.embed_queries(questions)
+        for backend, store in [("chroma", vector_store), ("readonly", readonly)]:
+            retriever = HybridRetriever(store, lexical_index, k=RERANK_FETCH_K)
+            packer = ContextPacker(store)
+            retrieve, pack, hits = [], [], 0
+            for question, embedding in zip(questions, query_embeddings):
+                # Within the platform the question names, as the chat does
+                start = time.perf_counter()
+                documents = retriever.invoke(question, embedding, infer_scope(question))
+                retrieved = time.perf_counter()
+                packer.pack(question, embedding, documents)
+                retrieve.append(retrieved - start)
+                hits += len(documents)
+                pack.append(time.perf_counter() - retrieved)
+            results.append(
+                {
+                    "chunks": size,
+                    "backend": backend,
+                    "mean_hits": round(hits / len(questions), 2),
+                    "retrieve": percentiles(retrieve),
+                    "pack": percentiles(pack),
+                }
+            )
+        readonly.close()
+        lexical_index.close()
+    return results
+
+
+def bench_chat(tmp, args):
+    embeddings = FakeEmbeddings()
+    vector_store, readonly, lexical_index, docs = build_index(
+        tmp, args.chat_chunks, embeddings, args.seed
+    )
+    readonly.close()
+    # Serve the prepared index without opening a generation from disk
+    service = RetrieverService(refresh=False)
+    service.vector_store = vector_store
+    service.retriever = HybridRetriever(vector_store, lexical_index, k=RERANK_FETCH_K)
+    service.packer = ContextPacker(vector_store)
+    service._ready.set()
+
+    engine = ChatEngine(FakeChain(args.answer_tokens), service, ConversationHistory())
+    questions = make_questions(args.queries, docs, args.seed)
+
+    async def run():
+        timings = {"prepare": [], "answer": [], "record": [], "total": []}
+        for question in questions:
+            start = time.perf_counter()
+            turn = await engine.prepare(question)
+            prepared = time.perf_counter()
+            result, _, _ = await engine.answer(turn, on_text=lambda text: None)
+            answered = time.perf_counter()
+            engine.record(turn, result)
+            end = time.perf_counter()
+            timings["prepare"].append(prepared - start)
+            timings["answer"].append(answered - prepared)
+            timings["record"].append(end - answered)
+            timings["total"].append(end - start)
+        await engine.close()
+        return timings
+
+    timings = asyncio.run(run())
+    lexical_index.close()
+    return {
+        "chunks": args.chat_chunks,
+        "answer_tokens": args.answer_tokens,
+        **{name: percentiles(values) for name, values in timings.items()},
+    }
+
+
+def print_results(results):
+    if "scan" in results:
+        scan = results["scan"]
+        print(
+            f"scan       {scan['files']} files, {scan['chunks']} chunks: "
+            f"{scan['files_per_s']} files/s, {scan['chunks_per_s']} chunks/s, "
+            f"{scan['mb_per_s']} MB/s, unchanged rescan {scan['rescan_seconds']} s"
+        )
+    if "insert" in results:
+        insert = results["insert"]
+        print(
+            f"insert     {insert['chunks']} chunks: {insert['chunks_per_s']} chunks/s "
+            f"in {insert['embedding_calls']} embedding calls"
+        )
+    for result in results.get("retrieval", []):
+        print(
+            f"retrieval  {result['chunks']:>7} chunks {result['backend']:<9}"
+            f"p50 {result['retrieve']['p50_ms']:>8.2f} ms  "
+            f"p95 {result['retrieve']['p95_ms']:>8.2f} ms  "
+            f"(+ pack p50 {result['pack']['p50_ms']:.2f} ms, "
+            f"{result['mean_hits']} hits)"
+        )
+    if "chat" in results:
+        chat = results["chat"]
+        print(
+            f"chat       per question p50 {chat['total']['p50_ms']:.2f} ms "
+            f"p95 {chat['total']['p95_ms']:.2f} ms "
+            f"(prepare p50 {chat['prepare']['p50_ms']:.2f} ms, "
+            f"answer p50 {chat['answer']['p50_ms']:.2f} ms)"
+        )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--files", type=int, default=500, help="Synthetic doc files.")
+    parser.add_argument(
+        "--sizes",
+        type=lambda text: [int(size) for size in text.split(",")],
+        default=[1000, 5000, 20000],
+        help="Comma separated corpus sizes in chunks for the retrieval benchmark.",
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--chat-chunks", type=int, default=5000, help="Corpus size of the chat loop."
+    )
+    parser.add_argument(
+        "--answer-tokens", type=int, default=300, help="Tokens per fake answer."
+    )
+    parser.add_argument(
+        "--embed-latency",
+        type=float,
+        default=0.0,
+        help="Seconds per fake embedding call in the insert benchmark.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    benchmarks = {
+        "scan": bench_scan,
+        "insert": bench_insert,
+        "retrieval": bench_retrieval,
+        "chat": bench_chat,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in BENCHMARKS:
+            if name in args.only:
+                print(f"Running {name}...", file=sys.stderr)
+                results[name] = benchmarks[name](tmp, args)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.platform(),
+                    "config": {
+                        key: value for key, value in vars(args).items() if key != "json"
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Synthetic memdocs corpus and deterministic stand-ins for Ollama.
+
+Used by benchmarks/suite.py so runs need no network, no Ollama and no
+IntuneDocs checkout, and compare the same work every time.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import numpy as np
+
+from itertools import count, islice
+from langchain_core.embeddings import Embeddings
+
+from IntuneBuddy.lexical import tokenize
+
+AREAS = ["enrollment", "apps", "configuration", "protect", "fundamentals"]
+PLATFORMS = ["windows", "macos", "ios", "android", ""]
+# Filler words, common enough that the lexical index skips them
+WORDS = (
+    "device enrollment policy profile compliance configuration assignment group "
+    "platform app deployment script setting tenant admin center certificate "
+    "update ring conditional access user license wipe retire sync report "
+    "endpoint security baseline firewall antivirus encryption bitlocker "
+    "filevault company portal managed installer catalog restriction token "
+    "supervised kiosk shared personal corporate owned work profile"
+).split()
+SYLLABLES = "ka lo mi nu pe ra si to vu xe ba co di fu ga he jo ly".split()
+# Rare terms, like setting names, each doc is about TOPIC_SIZE of them
+TERMS = sorted({"".join(random.Random(i).choices(SYLLABLES, k=4)) for i in range(4000)})
+TERM_SET = set(TERMS)
+TOPIC_SIZE = 3
+
+
+def doc_topic(i, seed=0):
+    """Return the rare terms doc i of the corpus is about."""
+    return random.Random(f"{seed}-{i}").sample(TERMS, TOPIC_SIZE)
+
+
+def doc_path(i):
+    """Return the relative path of doc i, its name carries area and platform."""
+    area = AREAS[i % len(AREAS)]
+    platform = PLATFORMS[i % len(PLATFORMS)]
+    return f"{area}/{area}-{platform or 'overview'}-{i}.md"
+
+
+def _sentence(rng, topic):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    words.insert(rng.randrange(len(words)), rng.choice(topic))
+    if rng.random() < 0.2:
+        # Error codes, found by the lexical index
+        words.append(f"0x8018{rng.randint(0, 9999):04d}")
+    return " ".join(words).capitalize() + "."
+
+
+def markdown_file(rng, title, topic):
+    """A doc with front matter, headings, lists, code and an include."""
+    lines = [
+        "---",
+        f"title: {title}",
+        f"ms.date: {rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025",
+        "ms.topic: how-to",
+        "---",
+        "",
+        f"# {title}",
+        "",
+        " ".join(_sentence(rng, topic) for _ in range(3)),
+        "",
+        "[!INCLUDE [banner](../includes/banner.md)]",
+    ]
+    for section in range(rng.randint(3, 6)):
+        lines += ["", f"## {rng.choice(WORDS).title()} {section + 1}", ""]
+        for _ in range(rng.randint(1, 4)):
+            paragraph = (_sentence(rng, topic) for _ in range(rng.randint(2, 6)))
+            lines += [" ".join(paragraph), ""]
+        if rng.random() < 0.5:
+            lines += [f"### {rng.choice(WORDS).title()} steps", ""]
+            lines += [
+                f"{n}. {_sentence(rng, topic)}" for n in range(1, rng.randint(3, 6))
+            ]
+        if rng.random() < 0.3:
+            lines += ["", "```powershell", "# Not a heading", "Get-Device", "```"]
+    return "\n".join(lines) + "\n"
+
+
+def iter_corpus(seed=0):
+    """Yield (relative_path, text) of the docs of the corpus, without end."""
+    rng = random.Random(seed)
+    for i in count():
+        yield doc_path(i), markdown_file(rng, f"Guide {i}", doc_topic(i, seed))
+
+
+def write_corpus(directory, files, seed=0):
+    """Write the first files docs under directory/intune-service, returns the base dir."""
+    base_dir = os.path.join(directory, "intune-service")
+    for relative_path, text in islice(iter_corpus(seed), files):
+        path = os.path.join(base_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+    return base_dir
+
+
+def make_questions(count, docs, seed=0):
+    """Questions about two topic terms of one of the first docs docs."""
+    rng = random.Random(seed + 1)
+    questions = []
+    for _ in range(count):
+        i = rng.randrange(docs)
+        first, second = rng.sample(doc_topic(i, seed), 2)
+        platform = PLATFORMS[i % len(PLATFORMS)]
+        on = f" on {platform}" if platform else ""
+        questions.append(f"How do I configure {first} with {second}{on}?")
+    return questions
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings, texts sharing terms end up close.
+
+    Topic terms weigh more than filler, the way a real model puts questions
+    near the chunks about the same setting. latency seconds are slept per
+    call to stand in for the embedding model.
+    """
+
+    def __init__(self, dim=384, latency=0.0, filler_weight=0.1):
+        self.dim = dim
+        self.latency = latency
+        self.filler_weight = filler_weight
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term in tokenize(text):
+            digest = hashlib.blake2b(term.encode(), digest_size=8).digest()
+            weight = 1.0 if term in TERM_SET else self.filler_weight
+            vector[int.from_bytes(digest, "little") % self.dim] += weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+class FakeChain:
+    """Chat chain that streams a fixed answer, token_delay seconds per token."""
+
+    def __init__(self, tokens=200, token_delay=0.0):
+        self.tokens = ["Intune ", "supports ", "this. "] * (tokens // 3)
+        self.token_delay = token_delay
+
+    def invoke(self, inputs):
+        return "".join(self.tokens)
+
+    async def ainvoke(self, inputs):
+        return self.invoke(inputs)
+
+    async def astream(self, inputs):
+        for token in self.tokens:
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
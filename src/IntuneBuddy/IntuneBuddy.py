@@ -2,29 +2,36 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import asyncio
 import pyperclip
 
-from langchain_ollama.llms import OllamaLLM
+from langchain_ollama import ChatOllama
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from rich.console import Console
 from rich.markdown import Markdown
 from rich import print
 from rich.panel import Panel
-from prompt_toolkit import prompt
+from rich.live import Live
+from prompt_toolkit import PromptSession
 from prompt_toolkit.styles import Style
 from prompt_toolkit.history import InMemoryHistory
+from prompt_toolkit.patch_stdout import patch_stdout
 from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
 from .utils import (
-    retry_chain_invoke,
-    ensure_model_installed,
+    run_startup_checks,
     clean_output,
-    stop_models,
-    ensure_ollama_installed,
-    ensure_git_installed,
+    doc_link,
 )
 from .config import (
     CONFIG_FILE,
-    template,
+    KEEP_ALIVE,
+    NUM_CTX,
+    system_template,
+    question_template,
+    summary_template,
     ascii_art,
     get_user_emoji,
     get_user_color,
@@ -32,13 +39,374 @@ from .config import (
     config_file_exists,
     handle_question,
 )
+from .cache import AnswerCache
+from .engine import ChatEngine, cancel_on_interrupt
+from .history import ConversationHistory
+from .models import (
+    DEFAULT_RESIDENCY,
+    RESIDENCY_POLICIES,
+    ModelResidency,
+    duration_seconds,
+)
+from .generations import current_index_file, vector_store_exists
+from .paths import answer_cache_file, sessions_dir
+from .scope import PLATFORMS, Scope, parse_scope
+from .service import RetrieverService
 
 sys.path.insert(0, os.path.dirname(__file__))
 
 
+async def stream_answer(engine, turn, console, buddy_string):
+    """
+    Render the answer while it is being generated.
+
+    Returns the answer, the number of generations and the time to the first
+    token.
+    """
+    console.print(buddy_string)
+    with Live(
+        Markdown(""),
+        console=console,
+        refresh_per_second=12,
+        vertical_overflow="visible",
+    ) as live:
+        return await engine.answer(turn, lambda text: live.update(Markdown(text)))
+
+
+def parse_keep_alive(value):
+    """Ollama takes a duration such as 30m, or a number of seconds where -1 means forever."""
+    try:
+        return int(value)
+    except ValueError:
+        # Raises for anything that isn't a duration
+        duration_seconds(value)
+        return value
+
+
+def chat_model(model_name, keep_alive=KEEP_ALIVE):
+    # Every request uses the same options, Ollama reloads the model when they differ
+    return ChatOllama(model=model_name, keep_alive=keep_alive, num_ctx=NUM_CTX)
+
+
+def build_chain(model_name, keep_alive=KEEP_ALIVE):
+    """
+    Build the answer chain, the output is streamed as text.
+
+    The instructions are a fixed system message ahead of the per-turn
+    history, documentation and question, so the prompt starts the same every
+    turn and Ollama only evaluates what changed.
+    """
+    model = chat_model(model_name, keep_alive)
+
+    chat_prompt = ChatPromptTemplate.from_messages(
+        [("system", system_template()), ("human", question_template())]
+    )
+
+    return chat_prompt | model | StrOutputParser()
+
+
+def build_summarizer(model_name, keep_alive=KEEP_ALIVE):
+    """Return a function that folds conversation turns into a running summary."""
+    model = chat_model(model_name, keep_alive)
+
+    summary_prompt = ChatPromptTemplate.from_template(summary_template())
+
+    chain = summary_prompt | model | StrOutputParser()
+
+    def summarize(summary, turns):
+        return clean_output(
+            chain.invoke({"summary": summary or "None", "turns": turns})
+        )
+
+    return summarize
+
+
+def scope_from_args(args):
+    """Return the Scope of --platform and --area, None to infer it from each question."""
+    return Scope(args.platform, args.area) if args.platform or args.area else None
+
+
+def model_residency(args):
+    return ModelResidency(
+        args.model, "mxbai-embed-large", args.residency, args.keep_alive
+    )
+
+
+def run_batch_command(args):
+    """Answer a JSONL file of questions without starting the chat."""
+    from .batch import read_questions, run_batch
+    from .context import CONTEXT_TOKEN_BUDGET, RERANK_FETCH_K, ContextPacker
+    from .vector import (
+        download_vector_store,
+        get_retriever,
+        open_readonly_vector_store,
+        open_vector_store,
+        set_embedding_keep_alive,
+        sync_index,
+    )
+
+    # Read the questions first, preparing the index may ask for input
+    try:
+        input_file = (
+            sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+        )
+    except OSError as e:
+        print(f"[red]Failed to open {args.input}: {e.strerror}[/red]", file=sys.stderr)
+        sys.exit(1)
+    try:
+        questions = list(read_questions(input_file))
+    except ValueError as e:
+        print(f"[red]{e}[/red]", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+    if not vector_store_exists() and input_file is sys.stdin:
+        # stdin carried the questions, there is nothing left to answer a prompt
+        print(
+            "[red]No documentation index found, run `intune-buddy sync` first.[/red]",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    residency = model_residency(args)
+    set_embedding_keep_alive(residency.embedding_keep_alive)
+    # Keep stdout free for the answers while the index is prepared
+    with redirect_stdout(sys.stderr):
+        if not vector_store_exists() and not download_vector_store():
+            sync_index()
+        vector_store = (
+            open_readonly_vector_store(args.quantize)
+            if args.read_only
+            else open_vector_store()
+        )
+
+    try:
+        output_file = (
+            sys.stdout
+            if args.output == "-"
+            else open(args.output, "w", encoding="utf-8")
+        )
+    except OSError as e:
+        print(f"[red]Failed to open {args.output}: {e.strerror}[/red]", file=sys.stderr)
+        sys.exit(1)
+    try:
+        run_batch(
+            build_chain(args.model, residency.keep_alive),
+            get_retriever(vector_store, k=RERANK_FETCH_K),
+            questions,
+            output_file,
+            concurrency=args.concurrency,
+            model=args.model,
+            answer_cache=(
+                None
+                if args.no_cache
+                else AnswerCache(answer_cache_file, current_index_file)
+            ),
+            packer=ContextPacker(
+                vector_store, args.context_tokens or CONTEXT_TOKEN_BUDGET
+            ),
+            scope=scope_from_args(args),
+        )
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+        with redirect_stdout(sys.stderr):
+            residency.release()
+
+
+def run_serve_command(args):
+    """Answer questions over HTTP until interrupted."""
+    from .server import AnswerService, make_server
+
+    residency = model_residency(args)
+    if not vector_store_exists():
+        from .vector import download_vector_store, set_embedding_keep_alive, sync_index
+
+        set_embedding_keep_alive(residency.embedding_keep_alive)
+        if not download_vector_store():
+            sync_index()
+
+    # One index and one chain shared by every request
+    retriever = RetrieverService(
+        refresh=not args.no_refresh,
+        warm_up=True,
+        read_only=args.read_only,
+        quantization=args.quantize,
+        context_tokens=args.context_tokens,
+        keep_alive=residency.keep_alive,
+    ).start()
+    residency.warm_up()
+    service = AnswerService(
+        build_chain(args.model, residency.keep_alive),
+        retriever,
+        model=args.model,
+        answer_cache=(
+            None
+            if args.no_cache
+            else AnswerCache(answer_cache_file, current_index_file)
+        ),
+        concurrency=args.concurrency,
+    )
+    try:
+        server = make_server(service, args.host, args.port, verbose=args.debug)
+    except OSError as e:
+        print(f"[red]Failed to listen on {args.host}:{args.port}: {e}[/red]")
+        sys.exit(1)
+
+    print(
+        f"[bright_cyan]🌐 Intune Buddy is listening on http://{args.host}:{args.port} "
+        f"(Ctrl+C to stop).[/bright_cyan]"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[bright_cyan]Stopping the server...[/bright_cyan]")
+    finally:
+        server.server_close()
+        service.close()
+    residency.release()
+
+
 def main():
     args = ArgumentParser()
 
+    args.add_argument(
+        "command",
+        nargs="?",
+        choices=["chat", "sync", "batch", "serve"],
+        default="chat",
+        help=(
+            "'chat' starts the chat (default), 'sync' updates the documentation index and exits, "
+            "'batch' answers the questions in --input and writes them to --output, "
+            "'serve' answers questions over HTTP."
+        ),
+    )
+
+    args.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address 'serve' listens on (default 127.0.0.1).",
+    )
+
+    args.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="Port 'serve' listens on (default 8080).",
+    )
+
+    args.add_argument(
+        "--input",
+        "-i",
+        type=str,
+        default="-",
+        help="JSONL file with questions for 'batch', '-' reads from stdin (default).",
+    )
+
+    args.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="-",
+        help="JSONL file to write answers to for 'batch', '-' writes to stdout (default).",
+    )
+
+    args.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help=(
+            "Number of questions generated at once in 'batch' and 'serve'. "
+            "Ollama only runs them in parallel up to its OLLAMA_NUM_PARALLEL setting."
+        ),
+    )
+
+    args.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Don't refresh the documentation index in the background when chatting.",
+    )
+
+    args.add_argument(
+        "--platform",
+        choices=PLATFORMS,
+        help="Only search the documentation for this platform and docs for every platform.",
+    )
+
+    args.add_argument(
+        "--area",
+        help="Only search this documentation area, e.g. 'enrollment' or 'apps'.",
+    )
+
+    args.add_argument(
+        "--read-only",
+        action="store_true",
+        help=(
+            "Answer from a memory-mapped export of the index instead of Chroma, "
+            "without refreshing it. The export is created on first use and updated by 'sync'."
+        ),
+    )
+
+    args.add_argument(
+        "--quantize",
+        choices=["none", "int8", "binary"],
+        default=None,
+        help=(
+            "Store the read-only export as int8 (4x smaller), binary codes re-ranked with "
+            "float16 (2x smaller), or 'none' for float32. Defaults to the quantization of the existing export."
+        ),
+    )
+
+    args.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        help=(
+            "Approximate number of tokens of documentation put in the prompt (default 1500). "
+            "Smaller budgets answer faster."
+        ),
+    )
+
+    args.add_argument(
+        "--session",
+        type=str,
+        default=None,
+        help=(
+            "Name of the chat session to resume or start. Sessions are saved between runs, "
+            "a new one named after the current time is started by default."
+        ),
+    )
+
+    args.add_argument(
+        "--keep-alive",
+        type=parse_keep_alive,
+        default=KEEP_ALIVE,
+        help=(
+            f"How long Ollama keeps the models and the prompt cache loaded after the last question "
+            f"(default {KEEP_ALIVE}), e.g. 10m, 1h or -1 to keep them loaded."
+        ),
+    )
+
+    args.add_argument(
+        "--residency",
+        choices=RESIDENCY_POLICIES,
+        default=DEFAULT_RESIDENCY,
+        help=(
+            "What happens to the models when Intune Buddy exits: 'keep' keeps them loaded for "
+            "--keep-alive so the next start is fast (default), 'unload' unloads them, "
+            "'server' leaves it to Ollama's OLLAMA_KEEP_ALIVE setting."
+        ),
+    )
+
+    args.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="Load the embedding model at startup so the first question isn't slowed down by it.",
+    )
+
     args.add_argument(
         "--debug",
         "-d",
@@ -54,31 +422,73 @@ def main():
         help="Specify the model to use. Default is 'gemma3:12b'.",
     )
 
-    args = args.parse_args()
+    args.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't answer from or add to the cache of previous answers.",
+    )
 
-    ensure_git_installed()
-    # check if ollama is installed
-    ensure_ollama_installed()
+    args.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Show answers once they are complete instead of streaming them.",
+    )
 
-    ensure_model_installed(args.model)
-    ensure_model_installed("mxbai-embed-large")
+    args = args.parse_args()
+
+    # check that git, ollama and the models are installed
+    run_startup_checks(args.model, "mxbai-embed-large")
+
+    if args.command == "sync":
+        from .vector import download_vector_store, set_embedding_keep_alive, sync_index
+
+        set_embedding_keep_alive(model_residency(args).embedding_keep_alive)
+        if not vector_store_exists():
+            download_vector_store()
+        sync_index()
+        return
+
+    if args.command == "batch":
+        run_batch_command(args)
+        return
+
+    if args.command == "serve":
+        run_serve_command(args)
+        return
+
+    residency = model_residency(args)
+    refresh = not args.no_refresh
+    if not vector_store_exists():
+        from .vector import download_vector_store, set_embedding_keep_alive, sync_index
+
+        set_embedding_keep_alive(residency.embedding_keep_alive)
+        # A fresh build takes a while, run it in the foreground with progress
+        if not download_vector_store():
+            sync_index()
+            refresh = False
+
+    retriever = RetrieverService(
+        refresh=refresh,
+        warm_up=args.warm_up,
+        read_only=args.read_only,
+        quantization=args.quantize,
+        context_tokens=args.context_tokens,
+        keep_alive=residency.keep_alive,
+    ).start()
+    # Loads the chat model while the index opens and the banner is shown
+    residency.warm_up()
+    answer_cache = (
+        None if args.no_cache else AnswerCache(answer_cache_file, current_index_file)
+    )
 
     user_emoji = get_user_emoji() if config_file_exists() else "🧑"
     user_name = get_user_name() if config_file_exists() else "You"
     user_color = get_user_color() if config_file_exists() else "yellow"
 
-    from .vector import retreiver
-
-    model = OllamaLLM(model=args.model)
+    chain = build_chain(args.model, residency.keep_alive)
 
     console = Console()
 
-    chat_template = template()
-
-    chat_prompt = ChatPromptTemplate.from_template(chat_template)
-
-    chain = chat_prompt | model
-
     buddy_string = "[bold blue]🤖 Buddy:[/bold blue]"
 
     ascii_art()
@@ -88,61 +498,150 @@ def main():
     print("I will help you find information about Intune using the documentation.")
     print("You can ask any question related to Intune.")
     print("\n")
+    print("To choose which docs are searched, type e.g. 'set scope macos enrollment'.")
     print("To quit, type 'q' or 'bye'.\n")
     if args.debug:
         print(
             "\n[yellow]Debug mode is enabled. Debug information will be displayed.[/yellow]"
         )
 
-    history = []
-    prompt_history = InMemoryHistory()
+    session = args.session or datetime.now().strftime("%Y%m%d-%H%M%S")
+    history = ConversationHistory(
+        os.path.join(sessions_dir, f"{session}.json"),
+        summarizer=build_summarizer(args.model, residency.keep_alive),
+    )
+    if len(history):
+        print(
+            f"[bright_cyan]📂 Resumed session '{session}' with {len(history)} recent turns.[/bright_cyan]\n"
+        )
+    engine = ChatEngine(
+        chain,
+        retriever,
+        history,
+        answer_cache,
+        args.model,
+        scope=scope_from_args(args),
+    )
 
     try:
-        while True:
-            print()
-            try:
-                style = Style.from_dict(
-                    {
-                        "prompt": f"bold {user_color}",  # color the prompt
-                    }
-                )
-            except ValueError:
-                print(
-                    f"[red]Invalid color '{user_color}' specified. Using default color.[/red]\n"
-                )
-                style = Style.from_dict({"prompt": "bold yellow"})
+        asyncio.run(
+            chat(
+                args,
+                engine,
+                console,
+                buddy_string,
+                user_name,
+                user_emoji,
+                user_color,
+            )
+        )
+        print(f"\n{buddy_string} Goodbye!\n")
+    except (KeyboardInterrupt, EOFError):
+        print(f"{buddy_string} Operation cancelled by user. Exiting gracefully... 👋")
 
-            question = prompt(
-                f"{user_emoji} {user_name}: ", style=style, history=prompt_history
+    history.close()
+    residency.release()
+
+
+def handle_scope_command(words, engine, buddy_string):
+    """
+    Show or change which part of the documentation is searched.
+
+    "show scope" shows it, "set scope auto" infers the platform from each
+    question, "set scope all" searches everything and e.g. "set scope macos
+    enrollment" restricts the search to a platform, area or docs tree.
+    """
+    words = words.strip().lower()
+    if words == "auto":
+        engine.scope = None
+    elif words == "all":
+        engine.scope = Scope()
+    elif words:
+        try:
+            engine.scope = parse_scope(words)
+        except ValueError as e:
+            print(f"\n[red]{e}[/red]")
+            return
+    current = "inferred from each question" if engine.scope is None else engine.scope
+    print(f"\n{buddy_string} Searching documentation: {current}")
+
+
+async def chat(args, engine, console, buddy_string, user_name, user_emoji, user_color):
+    """
+    Run the chat until the user quits.
+
+    Ctrl-C while a question is answered only cancels that answer, at the
+    prompt it ends the chat.
+    """
+    retriever = engine.retriever
+    history = engine.history
+    session = PromptSession(history=InMemoryHistory())
+
+    while True:
+        print()
+        try:
+            style = Style.from_dict(
+                {
+                    "prompt": f"bold {user_color}",  # color the prompt
+                }
+            )
+        except ValueError:
+            print(
+                f"[red]Invalid color '{user_color}' specified. Using default color.[/red]\n"
+            )
+            style = Style.from_dict({"prompt": "bold yellow"})
+
+        # Keep messages from the background index refresh above the prompt
+        with patch_stdout():
+            question = (
+                await session.prompt_async(f"{user_emoji} {user_name}: ", style=style)
             ).strip()
-            if question.lower() in ["q", "bye"]:
-                print(f"\n{buddy_string} Goodbye!\n")
-                # stop running ollama model
-                stop_models(args.model, "mxbai-embed-large")
-                break
-
-            if question.lower() == "copy":
-                if not history:
-                    print(f"\n{buddy_string} No conversation history to copy.")
-                    continue
-                pyperclip.copy(history[-1])
-                print(f"\n{buddy_string} Last message copied to clipboard.")
-                continue
+        if question.lower() in ["q", "bye"]:
+            await engine.close()
+            return
 
-            config_commands = [
-                "set emoji",
-                "set name",
-                "set color",
-                "clear config",
-                "show config",
-                "config help",
-            ]
-
-            if question.lower() in config_commands:
-                user_name, user_emoji, user_color = handle_question(
-                    question.lower(), buddy_string, user_name, user_emoji, user_color
-                )
+        if question.lower() == "copy":
+            if not len(history):
+                print(f"\n{buddy_string} No conversation history to copy.")
                 continue
+            pyperclip.copy(history.last_answer())
+            print(f"\n{buddy_string} Last message copied to clipboard.")
+            continue
+
+        if question.lower() == "show scope":
+            handle_scope_command("", engine, buddy_string)
+            continue
+        if question.lower().startswith("set scope "):
+            handle_scope_command(question[len("set scope") :], engine, buddy_string)
+            continue
+
+        config_commands = [
+            "set emoji",
+            "set name",
+            "set color",
+            "clear config",
+            "show config",
+            "config help",
+        ]
+
+        if question.lower() in config_commands:
+            user_name, user_emoji, user_color = handle_question(
+                question.lower(), buddy_string, user_name, user_emoji, user_color
+            )
+            continue
+
+        try:
+            if not retriever.is_ready():
+                with console.status(
+                    "Waiting for the documentation index...", spinner="dots"
+                ):
+                    try:
+                        await cancel_on_interrupt(asyncio.to_thread(retriever.wait))
+                    except Exception:
+                        print(
+                            "[red]The documentation index is not available. Try running 'Intune-buddy sync'.[/red]"
+                        )
+                        sys.exit(1)
 
             with console.status("Searching documentation...", spinner="dots"):
                 if args.debug:
@@ -155,68 +654,55 @@ def main():
                         )
                     )
                 print()
-                docs = retreiver.invoke(question)
-                if args.debug:
-                    for doc in docs:
-                        console.print(
-                            Panel.fit(
-                                Markdown(
-                                    f"Document: {doc.metadata['source']}\n\n {doc.page_content[:500]}"
-                                ),
-                                title="Debug Info",
-                                title_align="left",
-                                border_style="yellow",
-                            )
-                        )
+                turn = await cancel_on_interrupt(engine.prepare(question))
 
-                Intune_docs = "\n\n".join(doc.page_content for doc in docs)
-                result = chain.invoke(
-                    {
-                        "Intune_docs": Intune_docs,
-                        "question": question,
-                        "history": history,
-                        "metadata_source": (
-                            docs[0].metadata["source"].removesuffix(".md")
-                            if len(docs) > 0
-                            else ""
-                        ),
-                    }
-                )
-                result = clean_output(result)
+            if turn.cached:
+                cached_question, result = turn.cached
+                if args.debug:
+                    print(
+                        f"[yellow]⚡ Answer served from cache (asked as: {cached_question})[/yellow]"
+                    )
+                console.print(buddy_string, end=" ")
+                console.print(Markdown(result))
+                engine.record(turn, result)
+                continue
 
-                fallback_response = (
-                    "I don’t have access to the relevant Intune documentation to answer your question accurately. "
-                    "Please provide the documentation or refine your question."
-                )
+            if args.debug:
+                for doc in turn.docs:
+                    console.print(
+                        Panel.fit(
+                            Markdown(
+                                f"Document: {doc_link(doc)}\n\n {doc.page_content[:500]}"
+                            ),
+                            title="Debug Info",
+                            title_align="left",
+                            border_style="yellow",
+                        )
+                    )
 
-                result, retries = retry_chain_invoke(
-                    chain,
-                    {
-                        "Intune_docs": Intune_docs,
-                        "question": question,
-                        "history": history,
-                        "metadata_source": (
-                            docs[0].metadata["source"].removesuffix(".md")
-                            if docs
-                            else ""
-                        ),
-                    },
-                    fallback_response,
+            if args.no_stream:
+                with console.status("Thinking...", spinner="dots"):
+                    result, generations, first_token = await cancel_on_interrupt(
+                        engine.answer(turn)
+                    )
+                console.print(buddy_string, end=" ")
+                console.print(Markdown(result))
+            else:
+                result, generations, first_token = await cancel_on_interrupt(
+                    stream_answer(engine, turn, console, buddy_string)
                 )
-
-                if retries > 0 and args.debug:
-                    print(f"[yellow]⚠️ Retried {retries} times.[/yellow]")
-
-            console.print(buddy_string, end=" ")
-            console.print(Markdown(result))
-            history.append(f"User: {question}")
-            history.append(f"Buddy: {result}")
-
-    except KeyboardInterrupt:
-        print(f"{buddy_string} Operation cancelled by user. Exiting gracefully... 👋")
-        # stop running ollama model
-        stop_models(args.model, "mxbai-embed-large")
-        sys.exit(0)
+        except asyncio.CancelledError:
+            print("\n[yellow]Answer cancelled.[/yellow]")
+            continue
+
+        if args.debug:
+            print(f"[yellow]🧮 Generations: {generations}[/yellow]")
+            if generations > 1:
+                print(f"[yellow]⚠️ Retried {generations - 1} times.[/yellow]")
+            if first_token is not None:
+                print(f"[yellow]⏱️ Time to first token: {first_token:.2f}s[/yellow]")
+
+        engine.record(turn, result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from rich.console import Console
+from rich.progress import (
+    Progress,
+    SpinnerColumn,
+    BarColumn,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from .config import FALLBACK_RESPONSE
+from .retrieval import search_in_scope
+from .scope import infer_scope
+from .utils import chain_inputs, retry_chain_invoke
+
+# Constants
+BATCH_CONCURRENCY = 4
+
+
+def read_questions(lines):
+    """
+    Parse JSONL questions.
+
+    Each line is either an object with a "question" and an optional "id", or
+    a plain JSON string. Blank lines are skipped, the line number is used as
+    id when none is given.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}") from e
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not str(item.get("question", "")).strip():
+            raise ValueError(f"Line {number} has no question.")
+        item.setdefault("id", number)
+        yield item
+
+
+def format_sources(hits):
+    sources = []
+    for doc, score in hits:
+        source = {"source": doc.metadata["source"], "score": round(score, 4)}
+        if doc.metadata.get("anchor"):
+            source["anchor"] = doc.metadata["anchor"]
+        sources.append(source)
+    return sources
+
+
+def answer_question(chain, item, hits, fallback_response=FALLBACK_RESPONSE):
+    """Generate the answer record for a question and its retrieved hits."""
+    docs = [doc for doc, _ in hits]
+    result, generations = retry_chain_invoke(
+        chain, chain_inputs(item["question"], docs, ""), fallback_response
+    )
+    return {
+        **item,
+        "answer": result,
+        "sources": format_sources(hits),
+        "generations": generations,
+        "cached": False,
+    }
+
+
+def run_batch(
+    chain,
+    retriever,
+    questions,
+    output,
+    concurrency=BATCH_CONCURRENCY,
+    model=None,
+    answer_cache=None,
+    packer=None,
+    scope=None,
+):
+    """
+    Answer questions in bulk and write one JSON record per line to output.
+
+    All questions are embedded with a single embed_queries call, searched
+    up front with the hybrid retriever and, when a packer is given,
+    re-ranked into its context budget. Generation then runs on concurrency
+    threads against Ollama. Records are written in input order as soon as
+    they are ready, a question whose generation fails gets a record with
+    its error instead. scope restricts the search like in the chat, with
+    None it is inferred from each question. Returns the number of answered
+    questions.
+    """
+    items = list(questions)
+    if not items:
+        return 0
+    console = Console(stderr=True)
+    with console.status("Searching documentation...", spinner="dots"):
+        question_embeddings = retriever.vector_store.embeddings.embed_queries(
+            [item["question"] for item in items]
+        )
+        all_hits = [
+            search_in_scope(retriever, item["question"], embedding, scope)
+            for item, embedding in zip(items, question_embeddings)
+        ]
+        if packer:
+            all_hits = [
+                packer.pack(item["question"], embedding, [doc for doc, _ in hits])
+                for item, embedding, hits in zip(items, question_embeddings, all_hits)
+            ]
+
+    def process(item, embedding, hits):
+        # Cached answers are keyed by the scope the question is searched in
+        question_scope = infer_scope(item["question"]) if scope is None else scope
+        cached = (
+            answer_cache.lookup(model, embedding, question_scope)
+            if answer_cache
+            else None
+        )
+        if cached:
+            return {
+                **item,
+                "answer": cached[1],
+                "sources": format_sources(hits),
+                "generations": 0,
+                "cached": True,
+            }
+        record = answer_question(chain, item, hits)
+        if answer_cache and record["answer"] != FALLBACK_RESPONSE:
+            answer_cache.store(
+                model,
+                item["question"],
+                embedding,
+                record["answer"],
+                [source["source"] for source in record["sources"]],
+                question_scope,
+            )
+        return record
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.completed}/{task.total}"),
+        TimeElapsedColumn(),
+        console=console,
+    ) as progress:
+        task = progress.add_task(
+            "[bright_cyan]Answering questions...", total=len(items)
+        )
+        failed = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(process, item, embedding, hits)
+                for item, embedding, hits in zip(items, question_embeddings, all_hits)
+            ]
+            for item, future in zip(items, futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # A failed generation must not lose the other answers
+                    record = {**item, "error": str(e)}
+                    failed += 1
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                progress.update(task, advance=1)
+
+    if failed:
+        console.print(
+            f"[yellow]{failed} of {len(items)} questions could not be answered, "
+            "their records have an error.[/yellow]"
+        )
+    return len(items) - failed
@@ -0,0 +1,312 @@
+import os
+import json
+import array
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+# Constants
+QUERY_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.95
+# Bump when chunking or prompts change in a way that invalidates old answers
+ANSWER_CACHE_VERSION = "3"
+
+
+def text_hash(text):
+    """Return the SHA256 hash of a text chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text):
+    """Collapse case and whitespace so repeats of a question share an embedding."""
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (embedding model, chunk text hash).
+
+    Vectors are stored as float32 blobs in a SQLite database so unchanged
+    chunks can reuse their embedding instead of calling Ollama again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        """Return a dict of hash -> vector for the hashes found in the cache."""
+        found = {}
+        hashes = list(set(hashes))
+        with self._lock:
+            # Stay below SQLite's default limit of host parameters
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                rows = self._conn.execute(
+                    "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                    f"({', '.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = array.array("f", blob).tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Store (hash, vector) pairs for model."""
+        rows = [
+            (model, key, array.array("f", vector).tobytes()) for key, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves vectors from an EmbeddingCache.
+
+    Chunks are keyed by their exact text. Queries are keyed by their
+    normalized text in a separate namespace of the cache, with an in-memory
+    LRU in front so a repeated question doesn't touch SQLite either.
+    """
+
+    def __init__(
+        self, embeddings, cache, model=None, query_cache_size=QUERY_CACHE_SIZE
+    ):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or embeddings.model
+        self.hits = 0
+        self.misses = 0
+        self.query_hits = 0
+        self.query_misses = 0
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = list(zip(missing.keys(), embedded))
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        """Embed questions, only calling the model for the ones never seen before."""
+        keys = [text_hash(normalize_query(text)) for text in texts]
+        vectors = {}
+        with self._queries_lock:
+            for key in keys:
+                if key in self._queries:
+                    self._queries.move_to_end(key)
+                    vectors[key] = self._queries[key]
+
+        query_model = f"{self.model}:query"
+        unseen = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if unseen:
+            vectors.update(self.cache.get_many(query_model, unseen))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self.query_hits += len(texts) - len(missing)
+        self.query_misses += len(missing)
+
+        if missing:
+            # Ollama embeds queries and documents the same way, so all misses
+            # go to the model in one call
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = list(zip(missing.keys(), embedded))
+            self.cache.put_many(query_model, new_vectors)
+            vectors.update(new_vectors)
+
+        with self._queries_lock:
+            for key in keys:
+                self._queries[key] = vectors[key]
+                self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+        return [vectors[key] for key in keys]
+
+    def warm_up(self):
+        """Load the embedding model so the first question doesn't wait for it."""
+        self.embeddings.embed_query("Intune")
+
+
+class AnswerCache:
+    """
+    Persistent semantic cache of generated answers.
+
+    Answers are keyed by chat model, index version, the Scope the question
+    was retrieved within and the embedding of the question, a lookup is a
+    hit when a stored question of the same scope is at least threshold
+    cosine-similar. Each entry records the hash of the source files it was
+    answered from and is dropped once file_index records a change to any of
+    them. index_file is the path of file_index, or a function returning
+    it when the index can move to a new generation.
+    """
+
+    def __init__(self, path, index_file, threshold=ANSWER_CACHE_THRESHOLD):
+        self.path = path
+        self.index_file = index_file
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, "
+            "model TEXT NOT NULL, "
+            "version TEXT NOT NULL, "
+            "question TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, "
+            "answer TEXT NOT NULL, "
+            "sources TEXT NOT NULL, "
+            "scope TEXT NOT NULL DEFAULT '')"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(answers)")]
+        if "scope" not in columns:
+            # Created before answers were keyed by scope
+            self._conn.execute(
+                "ALTER TABLE answers ADD COLUMN scope TEXT NOT NULL DEFAULT ''"
+            )
+        self._conn.commit()
+        self._matrices = {}
+        self._file_index = {}
+        self._file_index_version = None
+
+    def _load(self, model, scope):
+        """Return (ids, normalized embedding matrix) for model and scope, cached in memory."""
+        key = (model, ANSWER_CACHE_VERSION, _scope_key(scope))
+        if key not in self._matrices:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM answers "
+                "WHERE model = ? AND version = ? AND scope = ?",
+                key,
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            vectors = [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+            matrix = np.vstack(vectors) if vectors else np.empty((0, 0), np.float32)
+            self._matrices[key] = (ids, matrix)
+        return self._matrices[key]
+
+    def _current_hashes(self):
+        """Return file_index, reloaded only when the file or its generation has changed."""
+        index_file = self.index_file() if callable(self.index_file) else self.index_file
+        try:
+            mtime = os.path.getmtime(index_file)
+        except (OSError, TypeError):
+            return {}
+        if (index_file, mtime) != self._file_index_version:
+            with open(index_file, "r") as f:
+                self._file_index = json.load(f)
+            self._file_index_version = (index_file, mtime)
+        return self._file_index
+
+    def lookup(self, model, embedding, scope=None):
+        """Return (question, answer) of the closest fresh entry within scope, or None."""
+        query = _normalize(embedding)
+        with self._lock:
+            ids, matrix = self._load(model, scope)
+            if not ids or matrix.shape[1] != query.shape[0]:
+                return None
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            entry_id = ids[best]
+            question, answer, sources = self._conn.execute(
+                "SELECT question, answer, sources FROM answers WHERE id = ?",
+                (entry_id,),
+            ).fetchone()
+            current = self._current_hashes()
+            if any(current.get(path) != h for path, h in json.loads(sources).items()):
+                self._delete(model, entry_id, scope)
+                return None
+            return question, answer
+
+    def store(self, model, question, embedding, answer, sources, scope=None):
+        """Store an answer within scope along with the current hashes of its source files."""
+        current = self._current_hashes()
+        source_hashes = {path: current.get(path) for path in sources}
+        vector = _normalize(embedding)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers "
+                "(model, version, question, embedding, answer, sources, scope) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    model,
+                    ANSWER_CACHE_VERSION,
+                    question,
+                    vector.tobytes(),
+                    answer,
+                    json.dumps(source_hashes),
+                    _scope_key(scope),
+                ),
+            )
+            self._conn.commit()
+            key = (model, ANSWER_CACHE_VERSION, _scope_key(scope))
+            if key in self._matrices:
+                ids, matrix = self._matrices[key]
+                matrix = np.vstack([matrix, vector]) if ids else vector[None, :]
+                self._matrices[key] = (ids + [cursor.lastrowid], matrix)
+
+    def _delete(self, model, entry_id, scope):
+        self._conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+        self._conn.commit()
+        self._matrices.pop((model, ANSWER_CACHE_VERSION, _scope_key(scope)), None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _scope_key(scope):
+    """Return the text a Scope is stored as, "" for all documentation."""
+    return json.dumps(list(scope)) if scope else ""
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
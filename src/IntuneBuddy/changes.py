@@ -0,0 +1,111 @@
+import os
+import subprocess
+
+from typing import NamedTuple
+
+from .ingest import normalize_path
+
+
+class DocChanges(NamedTuple):
+    """Doc files changed between two commits of the docs repo."""
+
+    changed: list  # (file_path, relative_path) of added, modified or renamed files
+    removed: list  # relative paths of deleted or renamed-away files
+
+
+def get_head_commit(repo_dir):
+    """Return the commit hash of HEAD in repo_dir, or None if it can't be read."""
+    try:
+        output = subprocess.run(
+            ["git", "-C", repo_dir, "rev-parse", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def _split_path(repo_path, prefixes):
+    """Map a repo-relative path to (base_dir, relative_path) or None."""
+    for base_dir, prefix in prefixes:
+        if repo_path.startswith(prefix):
+            return base_dir, repo_path[len(prefix) :]
+    return None
+
+
+def parse_name_status(output):
+    """
+    Parse `git diff --name-status -z` output.
+
+    Returns a list of (status, old_path, new_path) tuples, where old_path is
+    None unless the entry is a rename or copy.
+    """
+    fields = output.split("\0")
+    entries = []
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i][0]
+        if status in ("R", "C"):
+            entries.append((status, fields[i + 1], fields[i + 2]))
+            i += 3
+        else:
+            entries.append((status, None, fields[i + 1]))
+            i += 2
+    return entries
+
+
+def git_changes(repo_dir, base_dirs, since, until="HEAD"):
+    """
+    Return the DocChanges between two commits, limited to base_dirs.
+
+    Returns None if git can't produce the diff, e.g. because the recorded
+    commit is not part of the local history anymore. Callers should fall back
+    to hashing every file in that case.
+    """
+    prefixes = [
+        (base_dir, normalize_path(os.path.relpath(base_dir, repo_dir)) + "/")
+        for base_dir in base_dirs
+    ]
+    try:
+        output = subprocess.run(
+            [
+                "git",
+                "-C",
+                repo_dir,
+                "diff",
+                "--name-status",
+                "-z",
+                "-M",
+                f"{since}..{until}",
+                "--",
+                *(prefix for _, prefix in prefixes),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+
+    changed = []
+    removed = []
+    for status, old_path, new_path in parse_name_status(output.stdout):
+        if old_path is not None and status == "R" and old_path.endswith(".md"):
+            old = _split_path(old_path, prefixes)
+            if old:
+                removed.append(old[1])
+        if not new_path.endswith(".md"):
+            continue
+        new = _split_path(new_path, prefixes)
+        if not new:
+            continue
+        base_dir, relative_path = new
+        if status == "D":
+            removed.append(relative_path)
+        else:
+            changed.append((os.path.join(base_dir, relative_path), relative_path))
+
+    return DocChanges(changed, removed)
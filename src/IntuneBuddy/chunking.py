@@ -0,0 +1,139 @@
+import re
+
+from typing import NamedTuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Constants
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Bump when chunks or their metadata come out differently, so the next sync
+# splits every file again
+CHUNKER_VERSION = "3"
+HEADING_SEPARATOR = " > "
+
+FRONT_MATTER_PATTERN = re.compile(r"\A---\n(.*?)\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t]*#*[ \t]*$")
+FENCE_PATTERN = re.compile(r"^[ \t]*(```|~~~)")
+# [!INCLUDE [name](../includes/file.md)] directives, the include files are
+# indexed on their own
+INCLUDE_PATTERN = re.compile(r"^[ \t]*\[!INCLUDE[^\n]*\][ \t]*$", re.MULTILINE)
+COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+EXPLICIT_ANCHOR_PATTERN = re.compile(r"\s*\{#([\w-]+)\}$")
+
+section_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+)
+
+
+class Chunk(NamedTuple):
+    """A piece of a doc file with the metadata of the section it came from."""
+
+    text: str
+    metadata: dict
+
+
+def parse_front_matter(text):
+    """
+    Split YAML front matter off a markdown file.
+
+    Only the flat "key: value" pairs memdocs uses are read, which is enough
+    for the title and ms.date. Returns (front_matter, body).
+    """
+    match = FRONT_MATTER_PATTERN.match(text)
+    if not match:
+        return {}, text
+    front_matter = {}
+    for line in match.group(1).splitlines():
+        if line[:1].isspace() or ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        front_matter[key.strip()] = value.strip().strip("'\"")
+    return front_matter, text[match.end() :]
+
+
+def heading_anchor(heading):
+    """Return the #anchor Learn gives a heading."""
+    explicit = EXPLICIT_ANCHOR_PATTERN.search(heading)
+    if explicit:
+        return explicit.group(1)
+    # Drop links and inline markup, keep their text
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", heading)
+    text = re.sub(r"[^\w\s-]", "", text.lower())
+    return re.sub(r"\s", "-", text.strip())
+
+
+def heading_text(heading):
+    return EXPLICIT_ANCHOR_PATTERN.sub("", heading).strip()
+
+
+def split_sections(body):
+    """
+    Split markdown into sections at its headings.
+
+    Yields (heading_path, anchor, text) where heading_path lists the
+    headings above the section, outermost first. Headings inside code
+    blocks are left alone.
+    """
+    path = []
+    anchor = ""
+    lines = []
+    fence = None
+
+    for line in body.splitlines():
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            if fence is None:
+                fence = fence_match.group(1)
+            elif fence_match.group(1) == fence:
+                fence = None
+        heading = HEADING_PATTERN.match(line) if fence is None else None
+        if heading is None:
+            lines.append(line)
+            continue
+
+        yield list(path), anchor, "\n".join(lines)
+        level = len(heading.group(1))
+        path = [item for item in path if item[0] < level]
+        path.append((level, heading_text(heading.group(2))))
+        anchor = heading_anchor(heading.group(2))
+        lines = []
+
+    yield list(path), anchor, "\n".join(lines)
+
+
+def split_markdown(text):
+    """
+    Split a memdocs markdown file into Chunks along its heading hierarchy.
+
+    Front matter, include directives and comments are dropped. Each section
+    is split on its own so no chunk spans two sections, and every chunk
+    starts with the heading path of its section so it can be found and
+    understood on its own. Chunks record the title, ms.date, heading path
+    and anchor of their section.
+    """
+    front_matter, body = parse_front_matter(text)
+    body = COMMENT_PATTERN.sub("", INCLUDE_PATTERN.sub("", body))
+    title = front_matter.get("title", "")
+    ms_date = front_matter.get("ms.date", "")
+
+    chunks = []
+    for path, anchor, section in split_sections(body):
+        section = section.strip()
+        if not section:
+            # A heading directly followed by a sub heading
+            continue
+        headings = [heading for _, heading in path]
+        if not title and headings and path[0][0] == 1:
+            title = headings[0]
+        heading_path = HEADING_SEPARATOR.join(headings)
+        metadata = {
+            "title": title,
+            "ms_date": ms_date,
+            "heading": heading_path,
+            "anchor": anchor,
+        }
+        for piece in section_splitter.split_text(section):
+            content = f"{heading_path}\n\n{piece}" if heading_path else piece
+            chunks.append(Chunk(content, metadata))
+    return chunks
@@ -8,8 +8,27 @@ CONFIG_FILE = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "userconfig.json"
 )
 
+FALLBACK_RESPONSE = (
+    "I don’t have access to the relevant Intune documentation to answer your question accurately. "
+    "Please provide the documentation or refine your question."
+)
+
+
+# How long Ollama keeps the chat model and its prompt cache loaded after a request
+KEEP_ALIVE = "30m"
+# Context window for the chat model. Ollama drops the start of prompts that
+# don't fit, which would cut the system instructions and void the prompt cache.
+NUM_CTX = 8192
+
+
+def system_template():
+    """
+    Instructions sent as the system message of every chat turn.
 
-def template():
+    The text is the same for every turn so Ollama can reuse the evaluated
+    prompt of the previous turn, everything that changes goes in
+    question_template().
+    """
     template = """
     You are a macOS, iOS/iPadOS, Windows, and Android expert managing a large fleet of devices. You specialize in Intune and will be asked questions about it.
 
@@ -21,7 +40,7 @@ def template():
 
     When providing links:
     - Always provide a link to the documentation relevant to the question.
-    - The URL is typically in the format https://learn.microsoft.com/en-us/intune/{metadata_source}. If {metadata_source} is unavailable or unclear, use the general Intune documentation page: https://learn.microsoft.com/en-us/mem/intune/.
+    - The URL is typically in the format https://learn.microsoft.com/en-us/intune/<source>, where <source> is the documentation source given with the question. If the source is unavailable or unclear, use the general Intune documentation page: https://learn.microsoft.com/en-us/mem/intune/.
 
     IMPORTANT:
     - You must not invent features, elements, keys, or commands that are not explicitly documented. If the code you are suggesting is not present in the documentation, do not provide it.
@@ -43,14 +62,39 @@ def template():
     
     If the answer is considered extremely basic and universally accepted Intune behavior (e.g., “Can I assign a policy to a device group?”), you may respond using common sense, but you must clearly state: “This information is based on general Intune behavior and not from the provided documentation.”
 
-    Here is the previous history of the conversation: {history}. If no history is provided, assume this is the start of the conversation.
-    Here is the relevant Intune documentation: {Intune_docs}. If no documentation is provided, respond: "I don’t have access to the relevant Intune documentation to answer your question accurately. Please provide the documentation or refine your question."
+    Each question comes with the previous history of the conversation, the relevant Intune documentation and its source. If no history is provided, assume this is the start of the conversation. If no documentation is provided, respond: "I don’t have access to the relevant Intune documentation to answer your question accurately. Please provide the documentation or refine your question."
+    """
+
+    return template
+
+
+def question_template():
+    template = """
+    Here is the previous history of the conversation: {history}
+    Here is the relevant Intune documentation: {Intune_docs}
+    Documentation source: {metadata_source}
     The question to answer is: "{question}"
     """
 
     return template
 
 
+def summary_template():
+    template = """
+    You maintain a short running summary of a conversation between a user and Intune Buddy, an assistant for Microsoft Intune.
+
+    Update the summary with the new conversation turns below. Keep the facts the user shared about themselves and their environment (e.g., name, company, platforms, policies), the topics asked about and the conclusions that were reached. Leave out greetings, links and step-by-step details.
+
+    Answer with the updated summary only, in at most 150 words.
+
+    Current summary: {summary}
+    New conversation turns:
+    {turns}
+    """
+
+    return template
+
+
 def ascii_art():
     logo = r"""
  ___       _                    ____            _     _       
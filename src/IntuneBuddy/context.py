@@ -0,0 +1,127 @@
+import math
+import numpy as np
+
+from .lexical import tokenize
+
+# Constants
+CONTEXT_TOKEN_BUDGET = 1500
+# Rough size of a token for English Markdown, avoids loading a tokenizer
+CHARS_PER_TOKEN = 4
+# Number of chunks retrieved before re-ranking picks what fits the budget
+RERANK_FETCH_K = 16
+LEXICAL_WEIGHT = 0.3
+# Share of a chunk's word shingles found in a better chunk that makes it a duplicate
+DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def lexical_overlap(query_terms, text):
+    """Share of the query terms that occur in text."""
+    if not query_terms:
+        return 0.0
+    return len(query_terms & set(tokenize(text))) / len(query_terms)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def cosine_similarities(query, vectors):
+    query = np.asarray(query, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return vectors @ query / np.where(norms > 0, norms, 1)
+
+
+class ContextPacker:
+    """
+    Re-rank retrieved chunks and pack the best of them into a token budget.
+
+    Chunks are scored by the cosine similarity of their stored embedding to
+    the question plus the share of question terms they contain, so no model
+    is called. Chunks mostly contained in a better one, such as the
+    overlapping neighbours the splitter produces, are dropped before the
+    rest are added best first until the budget is used.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        lexical_weight=LEXICAL_WEIGHT,
+        duplicate_threshold=DUPLICATE_THRESHOLD,
+    ):
+        self.vector_store = vector_store
+        self.token_budget = token_budget
+        self.lexical_weight = lexical_weight
+        self.duplicate_threshold = duplicate_threshold
+
+    def _stored_embeddings(self, documents):
+        data = self.vector_store.get(
+            ids=[doc.id for doc in documents], include=["embeddings"]
+        )
+        by_id = dict(zip(data["ids"], data["embeddings"]))
+        return [by_id.get(doc.id) for doc in documents]
+
+    def score(self, question, embedding, documents):
+        """Return (document, score) pairs sorted best first."""
+        if not documents:
+            return []
+        query_terms = {term for term in tokenize(question) if len(term) > 2}
+        vectors = self._stored_embeddings(documents)
+        known = [i for i, vector in enumerate(vectors) if vector is not None]
+        similarities = np.zeros(len(documents), dtype=np.float32)
+        if known:
+            similarities[known] = cosine_similarities(
+                embedding, [vectors[i] for i in known]
+            )
+
+        scored = []
+        for document, similarity in zip(documents, similarities):
+            overlap = lexical_overlap(query_terms, document.page_content)
+            score = (
+                1 - self.lexical_weight
+            ) * similarity + self.lexical_weight * overlap
+            scored.append((document, float(score)))
+        return sorted(scored, key=lambda item: item[1], reverse=True)
+
+    def pack(self, question, embedding, documents):
+        """Return the (document, score) pairs to put in the prompt, best first."""
+        packed = []
+        kept_shingles = []
+        used = 0
+        for document, score in self.score(question, embedding, documents):
+            chunk_shingles = shingles(document.page_content)
+            if any(
+                len(chunk_shingles & other) / len(chunk_shingles)
+                >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                continue
+
+            tokens = estimate_tokens(document.page_content)
+            if used + tokens > self.token_budget:
+                if packed:
+                    # A smaller chunk further down may still fit
+                    continue
+                # Always keep the best chunk, cut down to the budget
+                document = document.model_copy(
+                    update={
+                        "page_content": document.page_content[
+                            : self.token_budget * CHARS_PER_TOKEN
+                        ]
+                    }
+                )
+                tokens = self.token_budget
+
+            packed.append((document, score))
+            kept_shingles.append(chunk_shingles)
+            used += tokens
+        return packed
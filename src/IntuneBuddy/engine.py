@@ -0,0 +1,146 @@
+import signal
+import asyncio
+
+from typing import NamedTuple
+from .config import FALLBACK_RESPONSE
+from .scope import infer_scope
+from .utils import aretry_chain_invoke, astream_chain, chain_inputs, clean_output
+
+
+class Turn(NamedTuple):
+    """A question and what was retrieved for it."""
+
+    question: str
+    docs: list = ()
+    embedding: list = None
+    # (question it was asked as, answer) when it is answered from the cache
+    cached: tuple = None
+    # Scope the question was retrieved within, part of its answer cache key
+    scope: tuple = None
+
+
+async def cancel_on_interrupt(coro):
+    """
+    Run coro, cancelling it instead of exiting when Ctrl-C is pressed.
+
+    Raises asyncio.CancelledError when it was cancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+
+    def interrupt(signum, frame):
+        loop.call_soon_threadsafe(task.cancel)
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        return await task
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+class ChatEngine:
+    """
+    Answer the questions of a chat session on an asyncio event loop.
+
+    Retrieval runs on a worker thread and the answer is streamed from Ollama
+    asynchronously, so a question can be cancelled at any point without
+    ending the session or unloading the models. Cancelling the stream closes
+    the request, which stops the generation in Ollama as well. Answers are
+    added to the answer cache in the background while the next question is
+    retrieved. scope restricts retrieval to part of the documentation, with
+    None it is inferred from each question.
+    """
+
+    def __init__(
+        self,
+        chain,
+        retriever,
+        history,
+        answer_cache=None,
+        model=None,
+        fallback_response=FALLBACK_RESPONSE,
+        scope=None,
+    ):
+        self.chain = chain
+        self.retriever = retriever
+        self.history = history
+        self.answer_cache = answer_cache
+        self.model = model
+        self.fallback_response = fallback_response
+        self.scope = scope
+        self._stores = set()
+
+    async def prepare(self, question):
+        """Return the Turn for a question, with its documents or cached answer."""
+        # Only standalone questions are cached, follow-ups depend on the
+        # conversation so far
+        standalone = self.answer_cache is not None and self.history.is_empty()
+        return await asyncio.to_thread(self._retrieve, question, standalone)
+
+    def _retrieve(self, question, standalone):
+        embedding = None
+        scope = infer_scope(question) if self.scope is None else self.scope
+        if standalone:
+            embedding = self.retriever.embed_query(question)
+            cached = self.answer_cache.lookup(self.model, embedding, scope)
+            if cached:
+                return Turn(question, embedding=embedding, cached=cached, scope=scope)
+        docs = self.retriever.invoke(question, embedding, self.scope)
+        return Turn(question, docs, embedding, scope=scope)
+
+    async def answer(self, turn, on_text=None):
+        """
+        Generate the answer to a prepared Turn.
+
+        The visible text so far is passed to on_text while it streams, without
+        on_text the answer is generated in one go. Returns the answer, the
+        number of generations and the time to the first token.
+        """
+        inputs = chain_inputs(turn.question, turn.docs, self.history.render())
+        if on_text is None:
+            # One generation, only repeated if the model answers with the fallback
+            result, generations = await aretry_chain_invoke(
+                self.chain, inputs, self.fallback_response
+            )
+            return result, generations, None
+
+        raw, first_token = await astream_chain(
+            self.chain, inputs, lambda text: on_text(clean_output(text))
+        )
+        result = clean_output(raw)
+        generations = 1
+        if result == self.fallback_response:
+            result, retries = await aretry_chain_invoke(
+                self.chain, inputs, self.fallback_response, max_retries=4
+            )
+            generations += retries
+            on_text(result)
+        return result, generations, first_token
+
+    def record(self, turn, result):
+        """Add an answered turn to the history and the answer cache."""
+        self.history.add(turn.question, result)
+        if (
+            turn.embedding is None
+            or turn.cached is not None
+            or result == self.fallback_response
+        ):
+            return
+        store = asyncio.ensure_future(
+            asyncio.to_thread(
+                self.answer_cache.store,
+                self.model,
+                turn.question,
+                turn.embedding,
+                result,
+                [doc.metadata["source"] for doc in turn.docs],
+                turn.scope,
+            )
+        )
+        self._stores.add(store)
+        store.add_done_callback(self._stores.discard)
+
+    async def close(self):
+        """Wait for answers that are still being added to the cache."""
+        if self._stores:
+            await asyncio.gather(*self._stores, return_exceptions=True)
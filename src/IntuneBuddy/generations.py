@@ -0,0 +1,353 @@
+import os
+import re
+import shutil
+import threading
+
+from contextlib import contextmanager
+from rich import print
+
+from .paths import index_dir, package_dir
+
+# Constants
+POINTER_FILE = "CURRENT"
+# Held by the process that builds a generation, from reading the current
+# generation until the build is activated or discarded
+LOCK_FILE = "build.lock"
+GENERATION_PREFIX = "gen-"
+GENERATION_PATTERN = re.compile(r"^gen-(\d+)$")
+# Older generations kept next to the current one, so a reader that opened
+# the previous generation before a switch can keep using it
+KEEP_GENERATIONS = 1
+# The files of the index, in the order the layout before generations is
+# moved into the first generation, chroma_db last as it marks the index
+# as present
+GENERATION_FILES = [
+    "file_index.json",
+    "chunk_manifest.json",
+    "index_state.json",
+    "lexical_index.db",
+    "readonly_index",
+    "chroma_db",
+]
+
+_generations = None
+_generations_lock = threading.Lock()
+
+
+class GenerationLocked(Exception):
+    """Another process is building a generation."""
+
+
+class GenerationConflict(Exception):
+    """The generation a build was copied from is no longer the current one."""
+
+
+def _lock_file(f):
+    """Lock an open file without waiting, raises OSError when it is locked already."""
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock_file(f):
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Generation:
+    """
+    One version of the index: the Chroma store and the files that describe it.
+
+    base is the generation a build was copied from.
+    """
+
+    def __init__(self, directory, base=None):
+        self.directory = directory
+        self.base = base
+
+    def __eq__(self, other):
+        return isinstance(other, Generation) and self.directory == other.directory
+
+    def __repr__(self):
+        return f"Generation({self.directory!r})"
+
+    @property
+    def name(self):
+        return os.path.basename(self.directory)
+
+    @property
+    def number(self):
+        return int(GENERATION_PATTERN.match(self.name).group(1))
+
+    @property
+    def db_location(self):
+        return os.path.join(self.directory, "chroma_db")
+
+    @property
+    def index_file(self):
+        return os.path.join(self.directory, "file_index.json")
+
+    @property
+    def manifest_file(self):
+        return os.path.join(self.directory, "chunk_manifest.json")
+
+    @property
+    def state_file(self):
+        return os.path.join(self.directory, "index_state.json")
+
+    @property
+    def lexical_index_file(self):
+        return os.path.join(self.directory, "lexical_index.db")
+
+    @property
+    def export_dir(self):
+        return os.path.join(self.directory, "readonly_index")
+
+    def exists(self):
+        return os.path.isdir(self.db_location)
+
+
+class GenerationStore:
+    """
+    Versioned generations of the index, switched with a pointer file.
+
+    Each generation is a gen-NNNNNN directory under root. The CURRENT file
+    names the one readers open. A sync builds the next generation next to
+    it and points CURRENT at it with one atomic rename, so readers keep
+    using the old generation while the sync runs and an interrupted sync
+    never leaves a half updated index behind.
+
+    Builds hold the build lock, a file lock other processes see as well,
+    from reading the current generation until the build is activated, so
+    two syncs never build on the same generation. release(generation) is
+    called before a generation is removed, to close the files it has open.
+
+    An index from before generations, found in legacy_dir, is moved into
+    the first generation.
+    """
+
+    def __init__(self, root=index_dir, legacy_dir=None, release=None):
+        self.root = root
+        self.legacy_dir = legacy_dir
+        self.release = release
+        self.pointer_file = os.path.join(root, POINTER_FILE)
+        self.lock_file = os.path.join(root, LOCK_FILE)
+        self._lock = threading.Lock()
+        self._held = None
+
+    def generations(self):
+        """Return every generation directory under root, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(GENERATION_PATTERN.match, os.listdir(self.root))
+            if match
+        )
+        return [self._generation(number) for number in numbers]
+
+    def _generation(self, number):
+        return Generation(os.path.join(self.root, f"{GENERATION_PREFIX}{number:06d}"))
+
+    def current(self):
+        """Return the generation readers should open, or None when there is no index."""
+        with self._lock:
+            self._migrate()
+            return self._read_pointer()
+
+    def _read_pointer(self):
+        try:
+            with open(self.pointer_file, "r") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        generation = Generation(os.path.join(self.root, name))
+        return generation if generation.exists() else None
+
+    @contextmanager
+    def build_lock(self):
+        """
+        Hold the build lock while a generation is built and activated.
+
+        Raises GenerationLocked when another process or thread holds it. The
+        lock is released by the operating system when its holder exits, so
+        a crashed build never blocks the next one.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        f = open(self.lock_file, "a+")
+        with self._lock:
+            try:
+                if self._held is not None:
+                    raise OSError("held by this process")
+                _lock_file(f)
+            except OSError:
+                f.close()
+                raise GenerationLocked("Another sync is building the index.")
+            self._held = f
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held = None
+                _unlock_file(f)
+                f.close()
+
+    def _locked_elsewhere(self):
+        """Return whether a build lock not held by this store is live."""
+        if self._held is not None or not os.path.exists(self.lock_file):
+            return False
+        with open(self.lock_file, "a+") as f:
+            try:
+                _lock_file(f)
+            except OSError:
+                return True
+            _unlock_file(f)
+        return False
+
+    def create(self, copy_from=None):
+        """
+        Create the directory of the next generation.
+
+        With copy_from the files of that generation are copied into it, so
+        a sync only has to apply the changes. The new generation is not
+        visible to readers until it is activated.
+        """
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            existing = self.generations()
+            number = existing[-1].number + 1 if existing else 1
+            generation = self._generation(number)
+            generation.base = copy_from
+            os.makedirs(generation.directory)
+        if copy_from is not None:
+            # Copies the -wal file of the lexical index as well
+            for name in os.listdir(copy_from.directory):
+                source = os.path.join(copy_from.directory, name)
+                target = os.path.join(generation.directory, name)
+                if os.path.isdir(source):
+                    shutil.copytree(source, target)
+                else:
+                    shutil.copy2(source, target)
+        return generation
+
+    def activate(self, generation):
+        """
+        Point readers at generation and remove the generations no longer needed.
+
+        Raises GenerationConflict when the generation the build was copied
+        from is no longer the current one, activating it would undo the
+        changes of the build activated meanwhile.
+        """
+        if not generation.exists():
+            raise ValueError(f"{generation.name} has no vector store to activate.")
+        with self._lock:
+            self._migrate()
+            current = self._read_pointer()
+            if generation.base != current:
+                raise GenerationConflict(
+                    f"{generation.name} was not built on the current generation."
+                )
+            self._write_pointer(generation)
+        self.collect_garbage()
+
+    def discard(self, generation):
+        """
+        Remove a generation that is no longer needed.
+
+        Returns False when files of it are still open, on Windows an open file
+        can't be removed. What is left is removed by a later collection.
+        """
+        if self.release is not None:
+            self.release(generation)
+        try:
+            shutil.rmtree(generation.directory)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[yellow]Could not remove {generation.name} yet: {e}[/yellow]")
+            return False
+        return True
+
+    def collect_garbage(self, keep=KEEP_GENERATIONS):
+        """
+        Remove generations older than the current one and the keep before it.
+
+        Generations newer than the current one are left by builds that were
+        interrupted and are removed as well, unless another process holds
+        the build lock and may still be writing one. Returns the removed
+        generations.
+        """
+        current = self.current()
+        if current is None:
+            return []
+        older = [g for g in self.generations() if g.number < current.number]
+        newer = [g for g in self.generations() if g.number > current.number]
+        if newer and self._locked_elsewhere():
+            newer = []
+        removed = older[: max(len(older) - keep, 0)] + newer
+        return [generation for generation in removed if self.discard(generation)]
+
+    def _migrate(self):
+        """Move an index from before generations into the first generation."""
+        if self.legacy_dir is None or os.path.exists(self.pointer_file):
+            return
+        if not os.path.isdir(os.path.join(self.legacy_dir, "chroma_db")):
+            return
+        os.makedirs(self.root, exist_ok=True)
+        generation = self._generation(1)
+        os.makedirs(generation.directory, exist_ok=True)
+        for name in GENERATION_FILES:
+            for suffix in ("", "-wal", "-shm"):
+                source = os.path.join(self.legacy_dir, name + suffix)
+                if os.path.exists(source):
+                    os.replace(
+                        source, os.path.join(generation.directory, name + suffix)
+                    )
+        self._write_pointer(generation)
+
+    def _write_pointer(self, generation):
+        tmp_path = f"{self.pointer_file}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(generation.name)
+        os.replace(tmp_path, self.pointer_file)
+
+
+def get_generations():
+    """Return the shared GenerationStore of the package."""
+    global _generations
+    with _generations_lock:
+        if _generations is None:
+            # Imported here, the vector module imports this one
+            from .vector import release_generation
+
+            _generations = GenerationStore(
+                index_dir, legacy_dir=package_dir, release=release_generation
+            )
+        return _generations
+
+
+def current_generation():
+    return get_generations().current()
+
+
+def current_index_file():
+    """Return the file index of the current generation, None when there is no index."""
+    generation = current_generation()
+    return generation.index_file if generation else None
+
+
+def vector_store_exists():
+    return current_generation() is not None
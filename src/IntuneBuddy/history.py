@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+
+from .context import CHARS_PER_TOKEN, estimate_tokens
+
+# Constants
+HISTORY_TURNS = 4
+HISTORY_TOKEN_BUDGET = 1000
+SUMMARY_TOKEN_BUDGET = 300
+
+
+def format_turns(turns):
+    return "\n".join(f"User: {question}\nBuddy: {answer}" for question, answer in turns)
+
+
+class ConversationHistory:
+    """
+    Conversation history with a bounded size in the prompt.
+
+    The last turns are kept verbatim up to keep_turns and token_budget. Older
+    turns are folded into a rolling summary by summarizer(summary, turns) on
+    a background thread, until it is done they stay in the prompt as they
+    are, so a turn never waits for the model to summarize. The session is
+    saved as JSON to path after every change when a path is given.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        summarizer=None,
+        keep_turns=HISTORY_TURNS,
+        token_budget=HISTORY_TOKEN_BUDGET,
+    ):
+        self.path = path
+        self.summarizer = summarizer
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary = ""
+        self.turns = []
+        # Turns moved out of the verbatim window, waiting to be summarized
+        self.pending = []
+        self._lock = threading.Lock()
+        self._summarizing = None
+        self._closed = False
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.summary = data.get("summary", "")
+        self.turns = [tuple(turn) for turn in data.get("turns", [])]
+        self.pending = [tuple(turn) for turn in data.get("pending", [])]
+        self._summarize()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "summary": self.summary,
+                "turns": self.turns,
+                "pending": self.pending,
+            }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.turns) + len(self.pending)
+
+    def is_empty(self):
+        return not (self.turns or self.pending or self.summary)
+
+    def last_answer(self):
+        with self._lock:
+            turns = self.pending + self.turns
+        return turns[-1][1] if turns else None
+
+    def add(self, question, answer):
+        """Record a turn and move the oldest turns out of the verbatim window."""
+        with self._lock:
+            self.turns.append((question, answer))
+            while len(self.turns) > 1 and (
+                len(self.turns) > self.keep_turns
+                or estimate_tokens(format_turns(self.turns)) > self.token_budget
+            ):
+                self.pending.append(self.turns.pop(0))
+        self.save()
+        self._summarize()
+
+    def _summarize(self):
+        """Start folding the pending turns into the summary, one run at a time."""
+        if not self.summarizer:
+            return
+        with self._lock:
+            if not self.pending or self._summarizing is not None or self._closed:
+                return
+            # A daemon thread, so quitting never waits for the model
+            self._summarizing = threading.Thread(
+                target=self._run_summarizer,
+                args=(self.summary, list(self.pending)),
+                daemon=True,
+            )
+            self._summarizing.start()
+
+    def _run_summarizer(self, summary, turns):
+        try:
+            new_summary = self.summarizer(summary, format_turns(turns)).strip()
+        except Exception:
+            # Keep the questions so the topic isn't lost when the model fails
+            new_summary = "\n".join(
+                [summary] + [f"The user asked: {question}" for question, _ in turns]
+            ).strip()
+        new_summary = new_summary[-SUMMARY_TOKEN_BUDGET * CHARS_PER_TOKEN :]
+        with self._lock:
+            self._summarizing = None
+            if self._closed:
+                return
+            self.summary = new_summary
+            self.pending = self.pending[len(turns) :]
+        self.save()
+        # Turns may have been moved out while this summary was generated
+        self._summarize()
+
+    def render(self):
+        """Return the history as text for the prompt."""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of the earlier conversation: {self.summary}")
+            if self.pending or self.turns:
+                parts.append(format_turns(self.pending + self.turns))
+            return "\n\n".join(parts)
+
+    def wait(self, timeout=None):
+        """Wait for a running summary to finish."""
+        with self._lock:
+            running = self._summarizing
+        if running is not None:
+            running.join(timeout)
+
+    def close(self):
+        """
+        Save the session and stop summarizing.
+
+        Turns still waiting for a summary are saved as they are and
+        summarized when the session is resumed.
+        """
+        self.save()
+        with self._lock:
+            self._closed = True
@@ -0,0 +1,211 @@
+import os
+import queue
+import hashlib
+import threading
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+from langchain_core.documents import Document
+
+from .chunking import split_markdown
+from .scope import source_metadata
+
+# Setup
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "IntuneDocs")
+BASE_DIRS = [
+    os.path.join(DOCS_DIR, "intune/intune-service"),
+    os.path.join(DOCS_DIR, "autopilot"),
+]
+
+# Constants
+QUEUE_SIZE = 2000
+MAX_IN_FLIGHT = 64
+
+
+class FileDone(NamedTuple):
+    """Marker emitted after the last chunk of a changed file."""
+
+    relative_path: str
+    file_hash: str
+    chunk_hashes: list = None
+    stale_ids: list = ()
+
+
+class _Failure(NamedTuple):
+    error: BaseException
+
+
+_SENTINEL = object()
+
+
+def normalize_path(path):
+    """Normalize file paths to always use forward slashes."""
+    return path.replace("\\", "/")
+
+
+def hash_file(filepath):
+    """Return SHA256 hash of file contents with normalized line endings."""
+    hasher = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        buf = f.read()
+        buf = buf.replace(b"\r\n", b"\n")  # Normalize CRLF to LF
+        hasher.update(buf)
+    return hasher.hexdigest()
+
+
+def iter_markdown_files(base_dirs):
+    """Yield (file_path, relative_path) for every markdown file in base_dirs."""
+    for base_dir in base_dirs:
+        for root, dirs, files in os.walk(base_dir):
+            for filename in files:
+                if filename.endswith(".md"):
+                    file_path = os.path.join(root, filename)
+                    relative_path = normalize_path(
+                        os.path.relpath(file_path, start=base_dir)
+                    )
+                    yield file_path, relative_path
+
+
+def process_file(task):
+    """
+    Hash a file and, if it changed, split it into chunks.
+
+    Runs in a worker process. Returns (relative_path, file_hash, chunks) where
+    chunks are the Chunks of the file, or None when the hash matches the
+    known hash.
+    """
+    file_path, relative_path, known_hash = task
+    with open(file_path, "rb") as f:
+        buf = f.read().replace(b"\r\n", b"\n")  # Normalize CRLF to LF
+    file_hash = hashlib.sha256(buf).hexdigest()
+
+    # ❗️Check hash BEFORE decoding and splitting the file
+    if file_hash == known_hash:
+        return relative_path, file_hash, None
+
+    return relative_path, file_hash, split_markdown(buf.decode("utf-8"))
+
+
+def bounded_map(executor, fn, iterable, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Like executor.map, but only keeps max_in_flight tasks submitted at once so
+    results never pile up faster than the caller consumes them.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def source_tree(file_path, base_dirs):
+    """Return the name of the base dir a file is in, such as "autopilot"."""
+    path = os.path.abspath(file_path)
+    for base_dir in map(os.path.abspath, base_dirs):
+        if os.path.commonpath([base_dir, path]) == base_dir:
+            return os.path.basename(base_dir)
+    return ""
+
+
+def build_documents(relative_path, chunks, tree=""):
+    """Wrap the Chunks of a file in Documents with stable ids."""
+    documents = []
+    for i, chunk in enumerate(chunks):
+        metadata = {
+            "source": relative_path,
+            "type": "intune",
+            **source_metadata(relative_path, tree),
+            **chunk.metadata,
+        }
+        documents.append(
+            Document(
+                page_content=chunk.text,
+                metadata=metadata,
+                id=f"{relative_path}-{i}",
+            )
+        )
+    return documents
+
+
+def _produce(files, base_dirs, file_index, out_queue, stop, max_workers):
+    def put(item):
+        # Block while the queue is full, but give up if the consumer went away
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    # Results come back in task order, so the trees of the tasks in flight
+    # are matched up first in, first out
+    trees = deque()
+
+    def tasks():
+        for file_path, relative_path in files:
+            trees.append(source_tree(file_path, base_dirs))
+            yield file_path, relative_path, file_index.get(relative_path)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for relative_path, file_hash, chunks in bounded_map(
+                executor, process_file, tasks()
+            ):
+                tree = trees.popleft()
+                if stop.is_set():
+                    break
+                if chunks is None:
+                    continue  # File unchanged, skip!
+                for document in build_documents(relative_path, chunks, tree):
+                    put(document)
+                put(FileDone(relative_path, file_hash))
+    except BaseException as e:
+        put(_Failure(e))
+    finally:
+        put(_SENTINEL)
+
+
+def stream_documents(
+    base_dirs=BASE_DIRS,
+    file_index=None,
+    max_workers=None,
+    queue_size=QUEUE_SIZE,
+    files=None,
+):
+    """
+    Stream Documents for every changed markdown file in base_dirs.
+
+    Pass files as (file_path, relative_path) pairs to only check those files
+    instead of walking base_dirs.
+
+    Hashing and splitting run in a process pool fed by a background thread, and
+    results are handed over through a bounded queue so memory stays flat while
+    the caller embeds. A FileDone marker follows the last chunk of each file;
+    only record the hash once those chunks are stored.
+    """
+    file_index = file_index or {}
+    if files is None:
+        files = iter_markdown_files(base_dirs)
+    out_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce,
+        args=(files, base_dirs, file_index, out_queue, stop, max_workers),
+        daemon=True,
+    )
+    producer.start()
+
+    try:
+        while True:
+            item = out_queue.get()
+            if item is _SENTINEL:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,279 @@
+import re
+import math
+import array
+import sqlite3
+import threading
+
+from collections import Counter
+from langchain_core.documents import Document
+from .ingest import FileDone
+from .scope import FACETS
+
+# Constants
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms found in more than this share of the chunks barely change the
+# ranking but have the longest posting lists, so they are skipped
+MAX_DF_RATIO = 0.1
+REBUILD_PAGE_SIZE = 5000
+
+# Compound tokens such as CSP paths, error codes and setting names are kept
+# whole, their alphanumeric parts are indexed as well
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./\\_:\-][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Split text into lowercase terms for the lexical index."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the documentation chunks.
+
+    Postings are stored in a SQLite database next to the vector store, with
+    terms and chunks interned as integers to keep it compact. Chunks are
+    keyed by the same ids as in the vector store, so the index can be updated
+    incrementally with the chunks that a sync adds, changes or removes.
+    The platform, area and tree of each chunk are stored with it, so a
+    search can be restricted to a Scope.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS terms ("
+            "id INTEGER PRIMARY KEY, "
+            "term TEXT NOT NULL UNIQUE, "
+            "df INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "doc INTEGER PRIMARY KEY, "
+            "id TEXT NOT NULL UNIQUE, "
+            "length INTEGER NOT NULL, "
+            "terms BLOB NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for facet in FACETS:
+            if facet not in columns:
+                self._conn.execute(
+                    f"ALTER TABLE chunks ADD COLUMN {facet} TEXT NOT NULL DEFAULT ''"
+                )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term INTEGER NOT NULL, "
+            "doc INTEGER NOT NULL, "
+            "tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._stats = None
+
+    def _delete(self, ids):
+        """Drop chunks and their postings, the term ids of a chunk are kept with it."""
+        df_changes = Counter()
+        for i in range(0, len(ids), 500):
+            batch = ids[i : i + 500]
+            rows = self._conn.execute(
+                "SELECT doc, terms FROM chunks WHERE id IN "
+                f"({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for doc, blob in rows:
+                term_ids = array.array("I", blob)
+                df_changes.update(term_ids)
+                self._conn.executemany(
+                    "DELETE FROM postings WHERE term = ? AND doc = ?",
+                    ((term_id, doc) for term_id in term_ids),
+                )
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE doc = ?", ((doc,) for doc, _ in rows)
+            )
+        self._conn.executemany(
+            "UPDATE terms SET df = df - ? WHERE id = ?",
+            ((count, term_id) for term_id, count in df_changes.items()),
+        )
+
+    def _term_ids(self, terms):
+        """Return a dict of term -> id, adding the terms that are new."""
+        terms = list(terms)
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO terms (term) VALUES (?)", ((t,) for t in terms)
+        )
+        term_ids = {}
+        for i in range(0, len(terms), 500):
+            batch = terms[i : i + 500]
+            rows = self._conn.execute(
+                "SELECT term, id FROM terms WHERE term IN "
+                f"({', '.join('?' * len(batch))})",
+                batch,
+            )
+            term_ids.update(rows)
+        return term_ids
+
+    def add(self, documents):
+        """Index Documents by id, replacing any previous version of a chunk."""
+        counted = []
+        for document in documents:
+            terms = tokenize(document.page_content)
+            facets = [(document.metadata or {}).get(facet, "") for facet in FACETS]
+            counted.append((document.id, len(terms), Counter(terms), facets))
+        if not counted:
+            return
+        with self._lock:
+            self._delete([doc_id for doc_id, _, _, _ in counted])
+            term_ids = self._term_ids(
+                set().union(*(counts.keys() for _, _, counts, _ in counted))
+            )
+            postings = []
+            df_changes = Counter()
+            for doc_id, length, counts, facets in counted:
+                ids = array.array("I", (term_ids[term] for term in counts))
+                doc = self._conn.execute(
+                    f"INSERT INTO chunks (id, length, terms, {', '.join(FACETS)}) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, length, ids.tobytes(), *facets),
+                ).lastrowid
+                postings.extend(
+                    (term_ids[term], doc, tf) for term, tf in counts.items()
+                )
+                df_changes.update(ids)
+            # Inserting in key order keeps the postings B-tree writes sequential
+            postings.sort()
+            self._conn.executemany(
+                "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings
+            )
+            self._conn.executemany(
+                "UPDATE terms SET df = df + ? WHERE id = ?",
+                ((count, term_id) for term_id, count in df_changes.items()),
+            )
+            self._conn.commit()
+            self._stats = None
+
+    def delete(self, ids):
+        """Remove chunk ids from the index."""
+        if not ids:
+            return
+        with self._lock:
+            self._delete(list(ids))
+            self._conn.commit()
+            self._stats = None
+
+    def count(self):
+        with self._lock:
+            return self._collection_stats()[0]
+
+    def _collection_stats(self):
+        if self._stats is None:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks"
+            ).fetchone()
+            self._stats = (count, total / count if count else 0.0)
+        return self._stats
+
+    def search(self, query, k, scope=None):
+        """Return up to k (chunk id, BM25 score) pairs, best first, within scope."""
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            count, avg_length = self._collection_stats()
+            if not count:
+                return []
+            rows = self._conn.execute(
+                f"SELECT id, df FROM terms WHERE term IN ({', '.join('?' * len(terms))})",
+                terms,
+            ).fetchall()
+            idf = {
+                term_id: math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for term_id, df in rows
+                if 0 < df <= max(1, count * MAX_DF_RATIO)
+            }
+            if not idf:
+                return []
+            # Score in SQLite so only the top k rows come back to Python
+            cases = " ".join("WHEN ? THEN ?" for _ in idf)
+            params = [value for item in idf.items() for value in item]
+            scope_sql, scope_params = _scope_condition(scope)
+            return self._conn.execute(
+                "SELECT c.id, SUM("
+                f"(CASE p.term {cases} END) * p.tf * ? / (p.tf + ? * (? + ? * c.length))"
+                ") AS score FROM postings p JOIN chunks c ON c.doc = p.doc "
+                f"WHERE p.term IN ({', '.join('?' * len(idf))}){scope_sql} "
+                "GROUP BY p.doc ORDER BY score DESC LIMIT ?",
+                [
+                    *params,
+                    BM25_K1 + 1,
+                    BM25_K1,
+                    1 - BM25_B,
+                    BM25_B / avg_length,
+                    *idf,
+                    *scope_params,
+                    k,
+                ],
+            ).fetchall()
+
+    def rebuild(self, vector_store, page_size=REBUILD_PAGE_SIZE):
+        """Index every chunk already in the vector store, e.g. after a download."""
+        offset = 0
+        while True:
+            data = vector_store.get(
+                include=["documents", "metadatas"], limit=page_size, offset=offset
+            )
+            if not data["ids"]:
+                break
+            self.add(
+                Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(
+                    data["ids"], data["documents"], data["metadatas"]
+                )
+            )
+            offset += len(data["ids"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _scope_condition(scope):
+    """Return the SQL condition and parameters restricting chunks to scope."""
+    if not scope:
+        return "", []
+    conditions, params = [], []
+    if scope.platform is not None:
+        # Chunks for every platform have no platform
+        conditions.append("c.platform IN (?, '')")
+        params.append(scope.platform)
+    for facet in ("area", "tree"):
+        if getattr(scope, facet) is not None:
+            conditions.append(f"c.{facet} = ?")
+            params.append(getattr(scope, facet))
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+def index_stream(lexical_index, items):
+    """
+    Add the Documents of an ingestion stream to the lexical index as they pass.
+
+    The chunks of a file are indexed together when its FileDone marker
+    arrives, the stream itself is passed through unchanged.
+    """
+    buffer = []
+    for item in items:
+        if isinstance(item, FileDone):
+            lexical_index.add(buffer)
+            buffer = []
+        else:
+            buffer.append(item)
+        yield item
@@ -0,0 +1,96 @@
+import re
+import threading
+
+from ollama import Client
+
+from .config import KEEP_ALIVE, NUM_CTX, system_template
+from .utils import stop_models
+
+# Constants
+RESIDENCY_POLICIES = ["keep", "unload", "server"]
+DEFAULT_RESIDENCY = "keep"
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def duration_seconds(value):
+    """
+    Return a keep_alive duration such as "30m" or "1h30m" in whole seconds.
+
+    Numbers are seconds already and None stays None. Raises ValueError for
+    anything else.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).strip()
+    parts = DURATION_PATTERN.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        raise ValueError(f"Invalid duration: {value}")
+    return round(sum(float(number) * DURATION_UNITS[unit] for number, unit in parts))
+
+
+class ModelResidency:
+    """
+    Decide how long Ollama keeps the chat and embedding models loaded.
+
+    "keep" keeps them loaded for idle_ttl after the last request, also after
+    the chat ends, so the next session starts warm. "unload" keeps them
+    loaded while chatting and unloads them when the chat ends. "server"
+    leaves it to the OLLAMA_KEEP_ALIVE setting of the Ollama server.
+    """
+
+    def __init__(
+        self,
+        chat_model,
+        embedding_model,
+        policy=DEFAULT_RESIDENCY,
+        idle_ttl=KEEP_ALIVE,
+    ):
+        if policy not in RESIDENCY_POLICIES:
+            raise ValueError(f"Unknown model residency policy: {policy}")
+        self.chat_model = chat_model
+        self.embedding_model = embedding_model
+        self.policy = policy
+        self.idle_ttl = idle_ttl
+        self.error = None
+
+    @property
+    def keep_alive(self):
+        """keep_alive to send with every request, None uses the server setting."""
+        return None if self.policy == "server" else self.idle_ttl
+
+    @property
+    def embedding_keep_alive(self):
+        """keep_alive of the embedding model, which only takes seconds."""
+        return duration_seconds(self.keep_alive)
+
+    def warm_up(self):
+        """
+        Load the chat model on a background thread, so it overlaps opening the index.
+
+        The model is loaded with the options of the chat and evaluates the
+        system prompt, which the first question then finds in Ollama's prompt
+        cache. The embedding model is warmed up by the RetrieverService.
+        Returns the thread.
+        """
+        thread = threading.Thread(target=self._warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        try:
+            Client().chat(
+                model=self.chat_model,
+                messages=[{"role": "system", "content": system_template()}],
+                options={"num_ctx": NUM_CTX, "num_predict": 1},
+                keep_alive=self.keep_alive,
+            )
+        except Exception as e:
+            # Only a head start, the first question loads the model otherwise
+            self.error = e
+
+    def release(self):
+        """Apply the policy when the chat ends, returns the models that failed to stop."""
+        if self.policy != "unload":
+            return []
+        return stop_models(self.chat_model, self.embedding_model)
@@ -0,0 +1,9 @@
+import os
+
+# Setup
+package_dir = os.path.dirname(os.path.abspath(__file__))
+index_dir = os.path.join(package_dir, "index")
+embedding_cache_file = os.path.join(package_dir, "embedding_cache.db")
+answer_cache_file = os.path.join(package_dir, "answer_cache.db")
+sessions_dir = os.path.join(package_dir, "sessions")
+download_dir = os.path.join(package_dir, "downloads")
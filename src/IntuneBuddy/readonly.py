@@ -0,0 +1,433 @@
+import os
+import json
+import mmap
+import shutil
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from .scope import FACETS
+
+# Constants
+EXPORT_PAGE_SIZE = 5000
+# Number of IVF lists probed per query, out of roughly sqrt(chunk count)
+IVF_NPROBE = 16
+# Below this many chunks every vector is scanned instead of clustering
+IVF_MIN_VECTORS = 4096
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+QUANTIZATIONS = ("int8", "binary")
+# A binary scan keeps this many candidates per requested hit for the float16
+# re-ranking
+RERANK_FACTOR = 16
+
+# Masks of the SWAR popcount over 64-bit words, for Hamming distances
+POPCOUNT_MASKS = [
+    np.uint64(mask)
+    for mask in (
+        0x5555555555555555,
+        0x3333333333333333,
+        0x0F0F0F0F0F0F0F0F,
+        0x0101010101010101,
+    )
+]
+
+RELEVANCE_SCORE_FNS = {
+    "l2": VectorStore._euclidean_relevance_score_fn,
+    "cosine": VectorStore._cosine_relevance_score_fn,
+    "ip": VectorStore._max_inner_product_relevance_score_fn,
+}
+
+
+def _nearest_centroids(vectors, centroids, count=1):
+    """Return the indexes of the count closest centroids (L2) for each vector."""
+    # argmin |v - c|^2 == argmax v.c - |c|^2 / 2
+    scores = vectors @ centroids.T - 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    if count == 1:
+        return np.argmax(scores, axis=1)
+    count = min(count, len(centroids))
+    return np.argpartition(-scores, count - 1, axis=1)[:, :count]
+
+
+def _smallest(values, k):
+    """Return the indexes of the k smallest values, smallest first."""
+    k = min(k, len(values))
+    best = np.argpartition(values, k - 1)[:k]
+    return best[np.argsort(values[best], kind="stable")]
+
+
+def train_ivf(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Cluster vectors into nlist IVF lists with k-means on a sample."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=nlist)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def quantize_int8(vectors):
+    """Scale every dimension symmetrically to [-127, 127], returns (codes, scale)."""
+    scale = np.ones(vectors.shape[1], dtype=np.float32)
+    if len(vectors):
+        scale = np.abs(vectors).max(axis=0) / 127
+        scale = np.where(scale > 0, scale, 1).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def quantize_binary(vectors):
+    """Keep the sign bit of every dimension, packed into 64-bit words."""
+    bits = np.packbits(vectors > 0, axis=-1)
+    padding = -bits.shape[-1] % 8
+    if padding:
+        bits = np.pad(bits, [(0, 0)] * (bits.ndim - 1) + [(0, padding)])
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+def popcount(words):
+    """Count the set bits of every 64-bit word."""
+    m1, m2, m4, h01 = POPCOUNT_MASKS
+    words = words - ((words >> np.uint64(1)) & m1)
+    words = (words & m2) + ((words >> np.uint64(2)) & m2)
+    words = (words + (words >> np.uint64(4))) & m4
+    return (words * h01) >> np.uint64(56)
+
+
+def _read_collection(vector_store, page_size):
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        data = vector_store.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not len(data["ids"]):
+            break
+        ids.extend(data["ids"])
+        documents.extend(data["documents"])
+        metadatas.extend(data["metadatas"])
+        embeddings.extend(data["embeddings"])
+        offset += len(data["ids"])
+    return ids, documents, metadatas, embeddings
+
+
+def export_index(
+    vector_store,
+    directory,
+    space="l2",
+    quantization=None,
+    page_size=EXPORT_PAGE_SIZE,
+):
+    """
+    Export a Chroma collection to a read-only IVF index in directory.
+
+    The vectors are written as a float32 .npy matrix ordered by IVF list, so
+    each list is a contiguous slice when the matrix is memory-mapped. Chunk
+    texts and metadata go to a JSONL file with a row offset table and the
+    ids to ids.json. The export is written next to directory and swapped in
+    once complete, so processes reading the previous export keep their
+    mapped files. Returns the number of exported chunks.
+
+    With quantization="int8" the float matrix is replaced by int8 codes and
+    per-dimension scales, a quarter of the size. "binary" replaces it with
+    the sign bits, a 32nd of the size, and float16 vectors, half of it: the
+    IVF lists are scanned by Hamming distance over the bits and only the
+    float16 rows of the best candidates are read to re-rank them.
+    """
+    if quantization not in (None, *QUANTIZATIONS):
+        raise ValueError(f"Unknown quantization '{quantization}'.")
+    ids, documents, metadatas, embeddings = _read_collection(vector_store, page_size)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if not ids:
+        vectors = vectors.reshape(0, 0)
+
+    if len(ids) >= IVF_MIN_VECTORS:
+        nlist = int(np.sqrt(len(ids)))
+        centroids = train_ivf(vectors, nlist)
+        assignment = np.concatenate(
+            [
+                _nearest_centroids(vectors[i : i + 4096], centroids)
+                for i in range(0, len(vectors), 4096)
+            ]
+        )
+    else:
+        centroids = vectors.mean(axis=0, keepdims=True) if len(ids) else vectors[:0]
+        assignment = np.zeros(len(ids), dtype=np.int64)
+    order = np.argsort(assignment, kind="stable")
+    lists = np.concatenate(
+        [[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))]
+    )
+
+    tmp_dir = f"{directory}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    if quantization == "int8":
+        codes, scale = quantize_int8(vectors[order])
+        np.save(os.path.join(tmp_dir, "int8.npy"), codes)
+        np.save(os.path.join(tmp_dir, "scale.npy"), scale)
+    elif quantization == "binary":
+        np.save(os.path.join(tmp_dir, "binary.npy"), quantize_binary(vectors[order]))
+        np.save(os.path.join(tmp_dir, "float16.npy"), vectors[order].astype(np.float16))
+    else:
+        matrix = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, "vectors.npy"),
+            mode="w+",
+            dtype=np.float32,
+            shape=vectors.shape,
+        )
+        matrix[:] = vectors[order]
+        matrix.flush()
+        del matrix
+    # Norms of the float vectors keep L2 distances exact up to the dot product
+    np.save(
+        os.path.join(tmp_dir, "norms.npy"),
+        np.einsum("ij,ij->i", vectors, vectors)[order],
+    )
+    np.save(os.path.join(tmp_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp_dir, "lists.npy"), lists.astype(np.int64))
+
+    offsets = [0]
+    with open(os.path.join(tmp_dir, "chunks.jsonl"), "wb") as f:
+        for row in order:
+            line = json.dumps(
+                {
+                    "id": ids[row],
+                    "document": documents[row],
+                    "metadata": metadatas[row] or {},
+                },
+                ensure_ascii=False,
+            ).encode("utf-8")
+            f.write(line + b"\n")
+            offsets.append(offsets[-1] + len(line) + 1)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    with open(os.path.join(tmp_dir, "ids.json"), "w") as f:
+        json.dump([ids[row] for row in order], f)
+
+    # Facet columns in row order, so a Scope filter is a NumPy mask
+    with open(os.path.join(tmp_dir, "facets.json"), "w") as f:
+        json.dump(
+            {
+                facet: [(metadatas[row] or {}).get(facet, "") for row in order]
+                for facet in FACETS
+            },
+            f,
+        )
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "count": len(ids),
+                "dim": vectors.shape[1],
+                "space": space,
+                "quantization": quantization,
+            },
+            f,
+        )
+
+    old_dir = f"{directory}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(ids)
+
+
+def export_exists(directory):
+    return os.path.exists(os.path.join(directory, "meta.json"))
+
+
+def export_quantization(directory):
+    """Return the quantization of an existing export."""
+    with open(os.path.join(directory, "meta.json"), "r") as f:
+        return json.load(f).get("quantization")
+
+
+class ReadOnlyVectorStore:
+    """
+    Vector store served from an export_index directory.
+
+    The vector matrix and chunk file are memory-mapped, so opening is cheap
+    and the pages are shared by every process serving the same export. A
+    query scans the nprobe closest IVF lists with NumPy, skipping the rows
+    a metadata filter excludes. Implements the part of the Chroma interface
+    used by HybridRetriever, filters support equality, $in, $nin and $and on the
+    facet metadata.
+    """
+
+    def __init__(self, directory, embeddings, nprobe=IVF_NPROBE):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.space = self.meta["space"]
+        self.quantization = self.meta.get("quantization")
+        self.norms = np.load(os.path.join(directory, "norms.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        self.lists = np.load(os.path.join(directory, "lists.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.scale = None
+        if self.quantization == "int8":
+            self.vectors = np.load(os.path.join(directory, "int8.npy"), mmap_mode="r")
+            self.scale = np.load(os.path.join(directory, "scale.npy"))
+        elif self.quantization == "binary":
+            self.vectors = np.load(
+                os.path.join(directory, "float16.npy"), mmap_mode="r"
+            )
+            self.bits = np.load(os.path.join(directory, "binary.npy"), mmap_mode="r")
+        else:
+            self.vectors = np.load(
+                os.path.join(directory, "vectors.npy"), mmap_mode="r"
+            )
+        self._chunks_file = open(os.path.join(directory, "chunks.jsonl"), "rb")
+        self._chunks = (
+            mmap.mmap(self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.meta["count"]
+            else b""
+        )
+        self._rows = None
+        self._facets = None
+
+    def _select_relevance_score_fn(self):
+        return RELEVANCE_SCORE_FNS[self.space]
+
+    def _chunk(self, row):
+        return json.loads(self._chunks[self.offsets[row] : self.offsets[row + 1]])
+
+    def _document(self, row):
+        chunk = self._chunk(row)
+        return Document(
+            page_content=chunk["document"], metadata=chunk["metadata"], id=chunk["id"]
+        )
+
+    def _distances(self, query, rows):
+        """Chroma style distances of query to rows, a slice or index array."""
+        if self.scale is None:
+            # float16 re-ranking vectors are widened, float32 ones are not copied
+            dots = self.vectors[rows].astype(np.float32, copy=False) @ query
+        else:
+            # Dequantize by folding the int8 scales into the query
+            dots = self.vectors[rows].astype(np.float32) @ (query * self.scale)
+        if self.space == "l2":
+            # Chroma reports squared L2 distances
+            return self.norms[rows] + query @ query - 2 * dots
+        if self.space == "cosine":
+            norms = np.sqrt(self.norms[rows]) * np.linalg.norm(query)
+            return 1 - dots / np.where(norms, norms, 1)
+        return 1 - dots
+
+    def _hamming_distances(self, query_bits, rows):
+        return popcount(np.bitwise_xor(self.bits[rows], query_bits)).sum(
+            axis=1, dtype=np.int32
+        )
+
+    def _filter_mask(self, where):
+        """Return a row mask for a Chroma style filter, None when it can't be applied."""
+        if self._facets is None:
+            path = os.path.join(self.directory, "facets.json")
+            if not os.path.exists(path):
+                # Exported before facets, served unfiltered until the next sync
+                self._facets = {}
+            else:
+                with open(path, "r") as f:
+                    self._facets = {
+                        facet: np.asarray(values)
+                        for facet, values in json.load(f).items()
+                    }
+        if "$and" in where:
+            masks = [self._filter_mask(condition) for condition in where["$and"]]
+            if any(mask is None for mask in masks):
+                return None
+            return np.logical_and.reduce(masks)
+        ((facet, condition),) = where.items()
+        if facet not in self._facets:
+            return None
+        if isinstance(condition, dict) and "$nin" in condition:
+            return ~np.isin(self._facets[facet], condition["$nin"])
+        values = condition["$in"] if isinstance(condition, dict) else [condition]
+        return np.isin(self._facets[facet], values)
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k=4, filter=None
+    ):
+        """Return the k nearest (document, distance) pairs, closest first."""
+        if not self.meta["count"]:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        binary = self.quantization == "binary"
+        if binary:
+            query_bits = quantize_binary(query)
+        mask = self._filter_mask(filter) if filter else None
+
+        probes = _nearest_centroids(query[None, :], self.centroids, self.nprobe)[0]
+        rows, distances = [], []
+        for probe in probes:
+            start, end = int(self.lists[probe]), int(self.lists[probe + 1])
+            if start >= end:
+                continue
+            list_rows = np.arange(start, end)
+            # Contiguous slices read less than index arrays, only the
+            # filtered rows need one
+            selected = slice(start, end)
+            if mask is not None:
+                list_rows = list_rows[mask[start:end]]
+                if not len(list_rows):
+                    continue
+                selected = list_rows
+            rows.append(list_rows)
+            if binary:
+                distances.append(self._hamming_distances(query_bits, selected))
+            else:
+                distances.append(self._distances(query, selected))
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        distances = np.concatenate(distances)
+
+        if binary:
+            # Re-rank the best candidates of the Hamming scan against their
+            # float16 rows, the only rows of that matrix that are read
+            candidates = _smallest(distances, k * RERANK_FACTOR)
+            rows = rows[candidates]
+            distances = self._distances(query, rows)
+
+        best = _smallest(distances, k)
+        return [(self._document(rows[i]), float(distances[i])) for i in best]
+
+    def get(self, ids=None, include=None, **kwargs):
+        """Return the chunks with the given ids, in the format of Chroma's get."""
+        if self._rows is None:
+            with open(os.path.join(self.directory, "ids.json"), "r") as f:
+                self._rows = {
+                    chunk_id: row for row, chunk_id in enumerate(json.load(f))
+                }
+        rows = [self._rows[i] for i in ids or [] if i in self._rows]
+        found = [self._chunk(row) for row in rows]
+        result = {
+            "ids": [chunk["id"] for chunk in found],
+            "documents": [chunk["document"] for chunk in found],
+            "metadatas": [chunk["metadata"] for chunk in found],
+        }
+        if include and "embeddings" in include:
+            vectors = self.vectors[rows].astype(np.float32)
+            result["embeddings"] = (
+                vectors if self.scale is None else vectors * self.scale
+            )
+        return result
+
+    def close(self):
+        if self.meta["count"]:
+            self._chunks.close()
+        self._chunks_file.close()
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from langchain_core.documents import Document
+
+from .scope import Scope, infer_scope
+
+# Constants
+RETRIEVER_K = 8
+SCORE_THRESHOLD = 0.4
+# Number of hits taken from each of the vector and lexical searches before fusion
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked lists of ids with reciprocal rank fusion.
+
+    Returns (id, score) pairs, best first. Only ranks are used, so the
+    relevance scores of the vector search and BM25 don't have to be comparable.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def vector_hits(
+    vector_store,
+    embedding,
+    k=RETRIEVER_K,
+    score_threshold=SCORE_THRESHOLD,
+    scope=None,
+):
+    """Return the (document, relevance score) pairs above score_threshold within scope."""
+    relevance_score_fn = vector_store._select_relevance_score_fn()
+    hits = vector_store.similarity_search_by_vector_with_relevance_scores(
+        embedding, k=k, filter=scope.where() if scope else None
+    )
+    scored = [(doc, relevance_score_fn(distance)) for doc, distance in hits]
+    return [(doc, score) for doc, score in scored if score >= score_threshold]
+
+
+class HybridRetriever:
+    """
+    Retriever that fuses vector search with the BM25 lexical index.
+
+    Exact tokens such as CSP paths, error codes and setting names often score
+    below the vector threshold, the lexical index still finds them. Both
+    searches use the one query embedding, the chunks only found lexically
+    are read back from the vector store by id. A Scope restricts both
+    searches to part of the documentation before they rank.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        lexical_index=None,
+        k=RETRIEVER_K,
+        score_threshold=SCORE_THRESHOLD,
+        candidates=HYBRID_CANDIDATES,
+    ):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.k = k
+        self.score_threshold = score_threshold
+        self.candidates = candidates
+
+    def search(self, query, embedding, scope=None):
+        """Return up to k (document, fused score) pairs for an embedded query."""
+        dense = vector_hits(
+            self.vector_store,
+            embedding,
+            k=self.candidates,
+            score_threshold=self.score_threshold,
+            scope=scope,
+        )
+        if self.lexical_index is None:
+            return dense[: self.k]
+
+        lexical = self.lexical_index.search(query, self.candidates, scope)
+        documents = {doc.id: doc for doc, _ in dense}
+        fused = reciprocal_rank_fusion(
+            [[doc.id for doc, _ in dense], [chunk_id for chunk_id, _ in lexical]]
+        )[: self.k]
+
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in documents]
+        if missing:
+            data = self.vector_store.get(
+                ids=missing, include=["documents", "metadatas"]
+            )
+            for chunk_id, text, metadata in zip(
+                data["ids"], data["documents"], data["metadatas"]
+            ):
+                documents[chunk_id] = Document(
+                    page_content=text, metadata=metadata, id=chunk_id
+                )
+
+        # Chunks that are still in the lexical index but no longer in the
+        # vector store are dropped
+        return [
+            (documents[chunk_id], score)
+            for chunk_id, score in fused
+            if chunk_id in documents
+        ]
+
+    def invoke(self, query, embedding=None, scope=None):
+        """Return the documents for a question, embedding it when needed."""
+        if embedding is None:
+            embedding = self.vector_store.embeddings.embed_query(query)
+        return [doc for doc, _ in self.search(query, embedding, scope)]
+
+
+def search_in_scope(retriever, query, embedding, scope=None):
+    """
+    Return the (document, score) pairs for an embedded question within scope.
+
+    Without a scope the question is searched within the platform it names,
+    or all documentation when that finds nothing. Scope() always searches
+    all documentation.
+    """
+    inferred = scope is None
+    if inferred:
+        scope = infer_scope(query)
+    hits = retriever.search(query, embedding, scope)
+    if not hits and inferred and scope:
+        hits = retriever.search(query, embedding, Scope())
+    return hits
@@ -0,0 +1,237 @@
+import time
+import httpx
+import threading
+
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from rich import print
+
+from .ingest import FileDone
+
+# Constants
+EMBED_WORKERS = 4
+INITIAL_BATCH_SIZE = 64
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 5000
+TARGET_LATENCY = 10.0
+MAX_ATTEMPTS = 2
+RETRY_DELAY = 1.0
+# Batches in a row that fail as a whole before the run is stopped, every
+# batch failing points at the model rather than the chunks
+MAX_CONSECUTIVE_FAILURES = 3
+# Errors reaching Ollama, not about the chunks sent to it
+TRANSPORT_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+
+
+class EmbeddingAborted(Exception):
+    """The embedding model failed in a way bisecting the batch can't work around."""
+
+
+class AdaptiveBatchSizer:
+    """
+    Tune the embedding batch size from observed latency and throughput.
+
+    The size doubles while throughput keeps up with the best seen so far and
+    requests stay under the target latency. Slow requests shrink the size
+    proportionally, and a throughput drop steps back to the best known size.
+    """
+
+    def __init__(
+        self,
+        initial=INITIAL_BATCH_SIZE,
+        minimum=MIN_BATCH_SIZE,
+        maximum=MAX_BATCH_SIZE,
+        target_latency=TARGET_LATENCY,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.size = max(minimum, min(initial, maximum))
+        self.best_size = self.size
+        self.best_throughput = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, size, latency):
+        """Record a successful request of size chunks that took latency seconds."""
+        if size <= 0:
+            return
+        latency = max(latency, 1e-6)
+        throughput = size / latency
+        with self._lock:
+            if throughput > self.best_throughput:
+                self.best_throughput = throughput
+                self.best_size = size
+
+            if latency > self.target_latency:
+                new_size = int(size * self.target_latency / latency)
+            elif throughput >= self.best_throughput * 0.9:
+                new_size = size * 2
+            else:
+                new_size = self.best_size
+            self.size = max(self.minimum, min(new_size, self.maximum))
+
+    def shrink(self):
+        """Halve the batch size after a failed request."""
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+def add_with_bisection(vector_store, documents, sizer=None):
+    """
+    Add documents to the vector store, bisecting failed batches.
+
+    A failing batch is retried once, then split in half until the documents
+    that cannot be embedded are isolated. Returns a list of
+    (document, error) tuples for the documents that could not be added.
+    Errors reaching the model say nothing about the documents, they raise
+    EmbeddingAborted instead of being bisected.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        start = time.perf_counter()
+        try:
+            vector_store.add_documents(
+                documents=documents, ids=[doc.id for doc in documents]
+            )
+            if sizer:
+                sizer.record(len(documents), time.perf_counter() - start)
+            return []
+        except Exception as e:
+            error = e
+            if sizer:
+                sizer.shrink()
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(RETRY_DELAY * attempt)
+
+    if isinstance(error, TRANSPORT_ERRORS):
+        raise EmbeddingAborted(
+            f"The embedding model can't be reached: {error}"
+        ) from error
+    if len(documents) == 1:
+        return [(documents[0], error)]
+
+    middle = len(documents) // 2
+    return add_with_bisection(vector_store, documents[:middle], sizer) + (
+        add_with_bisection(vector_store, documents[middle:], sizer)
+    )
+
+
+class EmbeddingScheduler:
+    """
+    Embed and store a stream of Documents with concurrent workers.
+
+    Batches are cut at the size suggested by the AdaptiveBatchSizer and handed
+    to a thread pool so several embed requests are in flight against Ollama
+    at once. FileDone markers are applied to file_index, and collected in
+    committed, once every chunk of the file has been stored. The run raises
+    EmbeddingAborted when the model can't be reached or max_failures
+    batches in a row fail as a whole, rather than bisecting every batch.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        workers=EMBED_WORKERS,
+        sizer=None,
+        max_failures=MAX_CONSECUTIVE_FAILURES,
+    ):
+        self.vector_store = vector_store
+        self.workers = workers
+        self.sizer = sizer or AdaptiveBatchSizer()
+        self.max_failures = max_failures
+        self.stored = 0
+        self.failed = []
+        self.committed = []
+        self.changed_files = 0
+
+    def run(self, items, file_index, on_progress=None):
+        """Drain items into the vector store, returns the number of indexed files."""
+        self._file_index = file_index
+        self._outstanding = Counter()
+        self._pending_files = {}
+        self._failed_sources = set()
+        self._on_progress = on_progress
+        self._start = time.perf_counter()
+        self._consecutive_failures = 0
+
+        batch_docs = []
+        in_flight = {}
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def submit():
+            batch = list(batch_docs)
+            batch_docs.clear()
+            future = executor.submit(
+                add_with_bisection, self.vector_store, batch, self.sizer
+            )
+            in_flight[future] = batch
+
+        try:
+            for item in items:
+                if isinstance(item, FileDone):
+                    self._pending_files[item.relative_path] = item
+                    self._commit_files([item.relative_path])
+                    continue
+
+                batch_docs.append(item)
+                self._outstanding[item.metadata["source"]] += 1
+                if len(batch_docs) >= self.sizer.size:
+                    submit()
+                    # Keep a small backlog so workers never wait on the stream
+                    while len(in_flight) >= self.workers * 2:
+                        self._harvest(in_flight, FIRST_COMPLETED)
+
+            if batch_docs:
+                submit()
+            while in_flight:
+                self._harvest(in_flight, FIRST_COMPLETED)
+        except BaseException:
+            # Batches not started yet would only fail the same way
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+        for document, error in self.failed:
+            print(f"[red]Error adding {document.id}: {error}[/red]")
+        return self.changed_files
+
+    def rate(self):
+        """Return the number of chunks stored per second so far."""
+        elapsed = time.perf_counter() - self._start
+        return self.stored / elapsed if elapsed > 0 else 0.0
+
+    def _harvest(self, in_flight, return_when):
+        done, _ = wait(in_flight, return_when=return_when)
+        sources = set()
+        for future in done:
+            batch = in_flight.pop(future)
+            failed = future.result()
+            self.failed.extend(failed)
+            if failed and len(failed) == len(batch):
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.max_failures:
+                    raise EmbeddingAborted(
+                        f"{self._consecutive_failures} batches in a row failed: {failed[0][1]}"
+                    )
+            else:
+                self._consecutive_failures = 0
+            self._failed_sources.update(doc.metadata["source"] for doc, _ in failed)
+            self.stored += len(batch) - len(failed)
+            for doc in batch:
+                self._outstanding[doc.metadata["source"]] -= 1
+                sources.add(doc.metadata["source"])
+            if self._on_progress:
+                self._on_progress(len(batch) - len(failed), self.rate())
+        self._commit_files(sources)
+
+    def _commit_files(self, sources):
+        for source in sources:
+            if self._outstanding[source] > 0 or source not in self._pending_files:
+                continue
+            done = self._pending_files.pop(source)
+            del self._outstanding[source]
+            if source in self._failed_sources:
+                continue
+            self._file_index[done.relative_path] = done.file_hash
+            self.committed.append(done)
+            self.changed_files += 1
@@ -0,0 +1,124 @@
+import os
+import re
+
+from typing import NamedTuple
+
+# Constants
+PLATFORMS = ["windows", "macos", "ios", "android", "linux"]
+# Chunk metadata a Scope filters on
+FACETS = ["platform", "area", "tree"]
+# Words in doc file names and questions that name a platform
+PLATFORM_TERMS = {
+    "windows": "windows",
+    "win32": "windows",
+    "win10": "windows",
+    "win11": "windows",
+    "autopilot": "windows",
+    "macos": "macos",
+    "macbook": "macos",
+    "ios": "ios",
+    "ipados": "ios",
+    "iphone": "ios",
+    "ipad": "ios",
+    "android": "android",
+    "aosp": "android",
+    "linux": "linux",
+    "ubuntu": "linux",
+}
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class Scope(NamedTuple):
+    """
+    Part of the documentation to retrieve from, None matches everything.
+
+    platform is one of PLATFORMS, area the top level folder of a doc such as
+    "enrollment" or "apps", and tree the docs tree, "intune-service" or
+    "autopilot". Docs that apply to every platform stay in when a platform
+    is set.
+    """
+
+    platform: str = None
+    area: str = None
+    tree: str = None
+
+    def __bool__(self):
+        return any(value is not None for value in self)
+
+    def __str__(self):
+        return ", ".join(value for value in self if value is not None) or "all"
+
+    def where(self):
+        """Return the Chroma metadata filter, None when nothing is filtered."""
+        conditions = []
+        if self.platform is not None:
+            # Excluding the other platforms keeps the chunks for every platform
+            # and the chunks of a downloaded index, which have no platform
+            # key until a sync splits them again and which $in would drop
+            others = [platform for platform in PLATFORMS if platform != self.platform]
+            conditions.append({"platform": {"$nin": others}})
+        if self.area is not None:
+            conditions.append({"area": self.area})
+        if self.tree is not None:
+            conditions.append({"tree": self.tree})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def platforms_in(text):
+    return {
+        PLATFORM_TERMS[term]
+        for term in TERM_PATTERN.findall(text.lower())
+        if term in PLATFORM_TERMS
+    }
+
+
+def source_metadata(relative_path, tree):
+    """
+    Return the platform, area and tree metadata of a doc file.
+
+    The platform comes from the file name, a doc that names no platform or
+    several applies to all of them and gets "". Autopilot only deploys
+    Windows devices.
+    """
+    if tree == "autopilot":
+        platform = "windows"
+    else:
+        platforms = platforms_in(os.path.basename(relative_path))
+        platform = platforms.pop() if len(platforms) == 1 else ""
+    parts = relative_path.split("/")
+    if tree == "autopilot":
+        area = "autopilot"
+    else:
+        area = parts[0] if len(parts) > 1 else ""
+    return {"platform": platform, "area": area, "tree": tree or ""}
+
+
+def infer_scope(question):
+    """Return the Scope a question is obviously about, only one named platform counts."""
+    platforms = platforms_in(question)
+    if len(platforms) == 1:
+        return Scope(platform=platforms.pop())
+    return Scope()
+
+
+def parse_scope(words):
+    """
+    Parse the words of the scope command into a Scope.
+
+    Platforms and the autopilot tree are recognised by name, any other word
+    is taken as the area. Raises ValueError for more than one area.
+    """
+    values = {}
+    for word in words.lower().split():
+        if word in PLATFORMS:
+            key = "platform"
+        elif word in ("autopilot", "intune-service"):
+            key = "tree"
+        else:
+            key = "area"
+        if key in values:
+            raise ValueError(f"Only one {key} can be given.")
+        values[key] = word
+    return Scope(**values)
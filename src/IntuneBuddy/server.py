@@ -0,0 +1,373 @@
+import json
+import time
+import queue
+import threading
+import traceback
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .batch import BATCH_CONCURRENCY, format_sources
+from .config import FALLBACK_RESPONSE
+from .scope import infer_scope
+from .utils import ThinkFilter, chain_inputs, clean_output, retry_chain_invoke
+
+# Constants
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8080
+# Questions embedded in one call, and how long the first of them waits for more
+EMBED_BATCH_SIZE = 16
+EMBED_BATCH_WAIT = 0.01
+# Requests that may wait for a generation before new ones are turned away
+QUEUE_SIZE = 32
+MAX_BODY_BYTES = 64 * 1024
+# Seconds a request waits for the index to open before it is turned away
+INDEX_WAIT = 30
+
+
+class ServerBusy(Exception):
+    """Raised when the generation queue is full."""
+
+
+class IndexLoading(Exception):
+    """Raised when the index is still being opened."""
+
+
+class EmbeddingBatcher:
+    """
+    Embed the questions of concurrent requests together.
+
+    The first question waits up to max_wait seconds for more to arrive, then
+    up to max_batch of them are embedded with a single embed_queries call, so
+    a burst of requests costs one call to the embedding model.
+    """
+
+    def __init__(
+        self, embed_queries, max_batch=EMBED_BATCH_SIZE, max_wait=EMBED_BATCH_WAIT
+    ):
+        self.embed_queries = embed_queries
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def embed(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self):
+        """Return the next batch, or None once the batcher is closed."""
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Embed what was collected, stop on the next call
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                vectors = self.embed_queries([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class GenerationQueue:
+    """
+    Limit the generations running against Ollama at once.
+
+    Up to concurrency requests generate while at most queue_size more wait
+    for a slot, ServerBusy is raised for the rest so a burst is turned away
+    instead of piling up behind the model.
+    """
+
+    def __init__(self, concurrency=BATCH_CONCURRENCY, queue_size=QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.pending = 0
+        self._slots = threading.Semaphore(concurrency)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            if self.pending >= self.concurrency + self.queue_size:
+                raise ServerBusy()
+            self.pending += 1
+        try:
+            with self._slots:
+                yield
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+
+class AnswerService:
+    """
+    Answer questions for the HTTP server.
+
+    All requests share the one retriever and chain. Question embeddings are
+    batched across requests and generation runs through a bounded queue.
+    Questions without history are answered from and added to the answer
+    cache when one is given.
+    """
+
+    def __init__(
+        self,
+        chain,
+        retriever,
+        model=None,
+        answer_cache=None,
+        concurrency=BATCH_CONCURRENCY,
+        queue_size=QUEUE_SIZE,
+        fallback_response=FALLBACK_RESPONSE,
+        index_wait=INDEX_WAIT,
+    ):
+        self.chain = chain
+        self.retriever = retriever
+        self.model = model
+        self.answer_cache = answer_cache
+        self.fallback_response = fallback_response
+        self.index_wait = index_wait
+        self.generations = GenerationQueue(concurrency, queue_size)
+        self.batcher = EmbeddingBatcher(retriever.embed_queries)
+
+    def status(self):
+        if not self.retriever.is_ready():
+            return "loading"
+        return "error" if self.retriever.error else "ready"
+
+    def search(self, question):
+        """Return the question embedding and its (document, score) hits."""
+        if not self.retriever.wait(self.index_wait):
+            raise IndexLoading()
+        embedding = self.batcher.embed(question)
+        return embedding, self.retriever.search(question, embedding)
+
+    def _cached(self, question, embedding, history):
+        if self.answer_cache is None or history:
+            return None
+        # Questions are searched within the platform they name
+        return self.answer_cache.lookup(self.model, embedding, infer_scope(question))
+
+    def _store(self, question, embedding, history, answer, hits):
+        if self.answer_cache is None or history or answer == self.fallback_response:
+            return
+        self.answer_cache.store(
+            self.model,
+            question,
+            embedding,
+            answer,
+            [doc.metadata["source"] for doc, _ in hits],
+            infer_scope(question),
+        )
+
+    def ask(self, question, history=""):
+        """Return the answer record for a question."""
+        embedding, hits = self.search(question)
+        cached = self._cached(question, embedding, history)
+        if cached:
+            return {
+                "answer": cached[1],
+                "sources": format_sources(hits),
+                "generations": 0,
+                "cached": True,
+            }
+        inputs = chain_inputs(question, [doc for doc, _ in hits], history)
+        with self.generations.slot():
+            answer, generations = retry_chain_invoke(
+                self.chain, inputs, self.fallback_response
+            )
+        self._store(question, embedding, history, answer, hits)
+        return {
+            "answer": answer,
+            "sources": format_sources(hits),
+            "generations": generations,
+            "cached": False,
+        }
+
+    def stream(self, question, history=""):
+        """
+        Yield (event, data) pairs for a streamed answer.
+
+        A "sources" event comes first, then "token" events with the visible
+        text as it is generated and a final "done" event with the full answer,
+        which differs from the tokens when the fallback answer was retried.
+        """
+        embedding, hits = self.search(question)
+        sources = {"sources": format_sources(hits)}
+        cached = self._cached(question, embedding, history)
+        if cached:
+            yield "sources", sources
+            yield "done", {"answer": cached[1], "generations": 0, "cached": True}
+            return
+
+        inputs = chain_inputs(question, [doc for doc, _ in hits], history)
+        with self.generations.slot():
+            yield "sources", sources
+            think_filter = ThinkFilter()
+            raw = []
+            for chunk in self.chain.stream(inputs):
+                raw.append(chunk)
+                text = think_filter.feed(chunk)
+                if text:
+                    yield "token", {"text": text}
+            text = think_filter.flush()
+            if text:
+                yield "token", {"text": text}
+            answer = clean_output("".join(raw))
+            generations = 1
+            if answer == self.fallback_response:
+                answer, retries = retry_chain_invoke(
+                    self.chain, inputs, self.fallback_response, max_retries=4
+                )
+                generations += retries
+        self._store(question, embedding, history, answer, hits)
+        yield "done", {"answer": answer, "generations": generations, "cached": False}
+
+    def close(self):
+        self.batcher.close()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over an AnswerService.
+
+    GET /health returns the state of the index. POST /ask takes
+    {"question": ..., "history": ..., "stream": false} and returns the
+    answer, or server-sent events when stream is true. POST /search takes
+    {"question": ...} and returns the sources without generating an answer.
+    Failures are answered with a generic 500, their traceback is only
+    logged in verbose mode.
+    """
+
+    server_version = "IntuneBuddy"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_request(self):
+        """Return the question and history of the request body, or None after an error response."""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"error": "Request body is too large."})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._send_json(400, {"error": "Request body is not valid JSON."})
+            return None
+        question = body.get("question") if isinstance(body, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            self._send_json(400, {"error": "A question is required."})
+            return None
+        history = body.get("history") or ""
+        if not isinstance(history, str):
+            self._send_json(400, {"error": "history must be a string."})
+            return None
+        return question.strip(), history, bool(body.get("stream"))
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "Not found."})
+            return
+        self._send_json(200, {"status": self.server.service.status()})
+
+    def do_POST(self):
+        if self.path not in ("/ask", "/search"):
+            self._send_json(404, {"error": "Not found."})
+            return
+        request = self._read_request()
+        if request is None:
+            return
+        question, history, stream = request
+        service = self.server.service
+        try:
+            if self.path == "/search":
+                _, hits = service.search(question)
+                self._send_json(200, {"sources": format_sources(hits)})
+            elif stream:
+                self._send_events(service.stream(question, history))
+            else:
+                self._send_json(200, service.ask(question, history))
+        except ServerBusy:
+            self._send_json(
+                503, {"error": "Too many questions are waiting, try again later."}
+            )
+        except IndexLoading:
+            self._send_json(
+                503, {"error": "The documentation index is loading, try again later."}
+            )
+        except Exception:
+            self.log_error("%s", traceback.format_exc())
+            self._send_json(500, {"error": "The question could not be answered."})
+
+    def _write_event(self, event, data):
+        data = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_events(self, events):
+        # Retrieval and waiting for a generation happen before the first
+        # event, so their errors are still sent as a JSON response
+        first = next(events)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            self._write_event(*first)
+            for event, data in events:
+                self._write_event(event, data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Closing the generator closes the request to Ollama, which stops
+            # the generation
+            events.close()
+        except Exception:
+            self.log_error("%s", traceback.format_exc())
+            self._write_event("error", {"error": "The answer failed."})
+
+
+def make_server(service, host=SERVE_HOST, port=SERVE_PORT, verbose=False):
+    """Return a threaded HTTP server answering with service."""
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
@@ -0,0 +1,147 @@
+import threading
+
+from rich import print
+
+from .config import KEEP_ALIVE
+from .models import duration_seconds
+from .retrieval import search_in_scope
+
+
+class RetrieverService:
+    """
+    Lazily initialised retriever over the Intune documentation.
+
+    The vector module is imported, the vector store opened, the embedding
+    model optionally warmed up and the index refreshed on a background
+    thread so the chat prompt can be shown right away. The existing index is
+    served as soon as it is open while a refresh keeps running, so only a
+    query asked before that has to wait. A refresh builds a new generation
+    of the index, which is opened once it has been activated. In read-only
+    mode the exported index is served and never refreshed.
+
+    Retrieved chunks are re-ranked and packed into context_tokens before
+    they are returned. keep_alive is how long Ollama keeps the embedding
+    model loaded, None leaves it to the server.
+    """
+
+    def __init__(
+        self,
+        refresh=True,
+        warm_up=False,
+        read_only=False,
+        quantization=None,
+        context_tokens=None,
+        keep_alive=KEEP_ALIVE,
+    ):
+        self.refresh = refresh and not read_only
+        self.warm_up = warm_up
+        self.read_only = read_only
+        self.quantization = quantization
+        self.context_tokens = context_tokens
+        self.keep_alive = keep_alive
+        self.vector_store = None
+        self.retriever = None
+        self.packer = None
+        self.summary = None
+        self.error = None
+        self._ready = threading.Event()
+        self._refreshed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            from .vector import set_embedding_keep_alive, sync_index
+
+            set_embedding_keep_alive(duration_seconds(self.keep_alive))
+            self._open()
+            self._ready.set()
+            if self.warm_up:
+                self.vector_store.embeddings.warm_up()
+            if self.refresh:
+                # Splitting every file again would re-embed the corpus while
+                # the user chats, that is left to an explicit sync
+                self.summary = sync_index(
+                    self.vector_store, verbose=False, rechunk=False
+                )
+                if self.summary.rechunk_pending:
+                    print(
+                        "\n[yellow]The index was split by an older version, run `intune-buddy sync` to split it again.[/yellow]"
+                    )
+                if self.summary.changed:
+                    # Questions asked meanwhile were served by the old generation
+                    self._open()
+                    print(
+                        f"\n[bright_cyan]🔄 Documentation index refreshed: {self.summary}[/bright_cyan]"
+                    )
+        except Exception as e:
+            self.error = e
+            print(f"\n[red]Failed to prepare the documentation index: {e}[/red]")
+        finally:
+            self._ready.set()
+            self._refreshed.set()
+
+    def _open(self):
+        """Open the current generation of the index and swap it in."""
+        from .context import CONTEXT_TOKEN_BUDGET, RERANK_FETCH_K, ContextPacker
+        from .generations import current_generation
+        from .vector import get_retriever, open_readonly_vector_store, open_vector_store
+
+        generation = current_generation()
+        if self.read_only:
+            vector_store = open_readonly_vector_store(self.quantization, generation)
+        else:
+            vector_store = open_vector_store(generation)
+        retriever = get_retriever(vector_store, k=RERANK_FETCH_K, generation=generation)
+        packer = ContextPacker(
+            vector_store, self.context_tokens or CONTEXT_TOKEN_BUDGET
+        )
+        # A question in flight keeps the objects it already looked up
+        self.vector_store, self.retriever, self.packer = vector_store, retriever, packer
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the index can be queried, raises if it failed to open."""
+        self._ready.wait(timeout)
+        if self.retriever is None and self.error:
+            raise self.error
+        return self.is_ready()
+
+    def wait_refreshed(self, timeout=None):
+        """Wait until the background refresh has finished."""
+        return self._refreshed.wait(timeout)
+
+    def search(self, question, embedding, scope=None):
+        """
+        Return the packed (document, score) pairs for an embedded question.
+
+        Without a scope the question is searched within the platform it
+        names, or all documentation when that finds nothing. Scope() always
+        searches all documentation.
+        """
+        self.wait()
+        retriever, packer = self.retriever, self.packer
+        hits = search_in_scope(retriever, question, embedding, scope)
+        return packer.pack(question, embedding, [doc for doc, _ in hits])
+
+    def invoke(self, question, embedding=None, scope=None):
+        """Retrieve the packed documents, reusing the question embedding when given."""
+        if embedding is None:
+            embedding = self.embed_query(question)
+        return [doc for doc, _ in self.search(question, embedding, scope)]
+
+    def embed_query(self, text):
+        """Embed text with the embedding model of the vector store."""
+        self.wait()
+        return self.vector_store.embeddings.embed_query(text)
+
+    def embed_queries(self, texts):
+        """Embed several questions with one call to the embedding model."""
+        self.wait()
+        return self.vector_store.embeddings.embed_queries(texts)
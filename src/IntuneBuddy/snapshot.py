@@ -0,0 +1,205 @@
+import os
+import shutil
+import hashlib
+import zipfile
+import requests
+
+from rich import print
+from rich.progress import (
+    Progress,
+    BarColumn,
+    DownloadColumn,
+    TransferSpeedColumn,
+    TextColumn,
+    TimeRemainingColumn,
+)
+
+# Constants
+SNAPSHOT_URL = "https://github.com/almenscorner/IntuneBuddy/releases/download/v0.0.1/vector_store.zip"
+MANIFEST_URL = f"{SNAPSHOT_URL}.sha256"
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 30
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot can't be downloaded, verified or installed."""
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_manifest(text):
+    """
+    Parse a manifest in sha256sum format into {path: sha256}.
+
+    Lines are "<sha256>  <path>", paths of the files inside the snapshot are
+    relative to its root, blank lines and # comments are skipped.
+    """
+    hashes = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split(None, 1)
+        if len(parts) != 2 or len(parts[0]) != 64:
+            raise SnapshotError(f"Line {number} of the manifest is not valid.")
+        hashes[parts[1].lstrip("*").strip()] = parts[0].lower()
+    return hashes
+
+
+def fetch_manifest(url, session=requests, timeout=TIMEOUT):
+    """Return the parsed manifest at url, or None when none is published."""
+    response = session.get(url, timeout=timeout)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return parse_manifest(response.text)
+
+
+def download_file(url, path, session=requests, chunk_size=CHUNK_SIZE, timeout=TIMEOUT):
+    """
+    Stream url to path in chunks, resuming a partial download.
+
+    Data is written to path.part, which is kept when the download fails so
+    the next call continues it with an HTTP Range request. The part is only
+    renamed to path once complete.
+    """
+    part_path = f"{path}.part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The part already holds the whole file
+            os.replace(part_path, path)
+            return path
+        response.raise_for_status()
+        if response.status_code != 206:
+            # The server ignored the range, start over
+            offset = 0
+        length = response.headers.get("Content-Length")
+        total = offset + int(length) if length else None
+
+        with Progress(
+            TextColumn("[bright_cyan]Downloading vector store"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+        ) as progress:
+            task = progress.add_task("download", total=total, completed=offset)
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    progress.update(task, advance=len(chunk))
+
+    if total is not None and os.path.getsize(part_path) != total:
+        raise SnapshotError("The download ended early, run again to resume it.")
+    os.replace(part_path, path)
+    return path
+
+
+def extract_snapshot(zip_path, staging_dir):
+    """Extract the snapshot into staging_dir, refusing paths outside of it."""
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    root = os.path.realpath(staging_dir)
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in archive.namelist():
+            target = os.path.realpath(os.path.join(root, name))
+            if os.path.commonpath([root, target]) != root:
+                raise SnapshotError(f"The snapshot contains an unsafe path: {name}")
+        archive.extractall(staging_dir)
+
+
+def verify_files(staging_dir, hashes):
+    """Check the extracted files listed in the manifest."""
+    for name, expected in hashes.items():
+        path = os.path.join(staging_dir, name)
+        if not os.path.isfile(path):
+            raise SnapshotError(f"{name} is missing from the snapshot.")
+        if sha256_file(path) != expected:
+            raise SnapshotError(f"{name} does not match the manifest.")
+
+
+def swap_in(staging_dir, db_location, index_file):
+    """
+    Move the extracted snapshot into place.
+
+    The file index is replaced first and the chroma_db directory last, with
+    one rename each. The vector store only counts as installed once
+    chroma_db exists, so an interrupted install is simply repeated.
+    """
+    for name in ("chroma_db", "file_index.json"):
+        if not os.path.exists(os.path.join(staging_dir, name)):
+            raise SnapshotError(f"{name} is missing from the snapshot.")
+
+    os.replace(os.path.join(staging_dir, "file_index.json"), index_file)
+    old_dir = f"{db_location}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(db_location):
+        os.replace(db_location, old_dir)
+    os.replace(os.path.join(staging_dir, "chroma_db"), db_location)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def install_snapshot(
+    db_location,
+    index_file,
+    download_dir,
+    url=SNAPSHOT_URL,
+    manifest_url=MANIFEST_URL,
+    session=requests,
+):
+    """
+    Download, verify and install a vector store snapshot.
+
+    The zip is checked against the SHA256 manifest published next to it,
+    when there is none only the CRCs of the zip are checked. The snapshot is
+    extracted next to db_location, so the final renames stay on one file
+    system. Raises SnapshotError when the snapshot can't be installed.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    zip_name = os.path.basename(url)
+    zip_path = os.path.join(download_dir, zip_name)
+    staging_dir = os.path.join(os.path.dirname(db_location), ".snapshot-staging")
+
+    hashes = fetch_manifest(manifest_url, session)
+    if hashes is None:
+        print(
+            "[yellow]No checksum manifest is published for this snapshot, only the zip itself is checked.[/yellow]"
+        )
+    elif zip_name not in hashes:
+        raise SnapshotError(f"The manifest has no checksum for {zip_name}.")
+
+    if not os.path.exists(zip_path):
+        download_file(url, zip_path, session)
+
+    if hashes is not None and sha256_file(zip_path) != hashes.pop(zip_name):
+        os.remove(zip_path)
+        raise SnapshotError(
+            f"{zip_name} does not match the manifest, run again to download it again."
+        )
+    if hashes is None:
+        try:
+            with zipfile.ZipFile(zip_path) as archive:
+                corrupt = archive.testzip() is not None
+        except zipfile.BadZipFile:
+            corrupt = True
+        if corrupt:
+            os.remove(zip_path)
+            raise SnapshotError(
+                f"{zip_name} is corrupt, run again to download it again."
+            )
+
+    try:
+        extract_snapshot(zip_path, staging_dir)
+        verify_files(staging_dir, hashes or {})
+        swap_in(staging_dir, db_location, index_file)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    os.remove(zip_path)
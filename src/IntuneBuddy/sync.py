@@ -0,0 +1,160 @@
+import json
+
+from .cache import text_hash
+from .ingest import FileDone
+
+# Constants
+DELETE_BATCH_SIZE = 5000
+
+
+class SyncSummary:
+    """Counts of chunk and file changes made by an incremental sync."""
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.removed_files = 0
+        self.failed = 0
+        # Files split by an older chunker that were left as they are
+        self.rechunk_pending = False
+
+    @property
+    def changed(self):
+        return bool(self.added or self.updated or self.deleted or self.removed_files)
+
+    def __str__(self):
+        return (
+            f"{self.added} added, {self.updated} updated, {self.deleted} deleted chunks"
+            f" ({self.unchanged} unchanged, {self.removed_files} removed files)"
+        )
+
+
+def chunk_id(relative_path, index):
+    return f"{relative_path}-{index}"
+
+
+def chunk_hash(text, metadata):
+    """Hash a chunk with its metadata, so a metadata change is stored as well."""
+    return text_hash(json.dumps([text, metadata or {}], sort_keys=True))
+
+
+def stored_chunk_hashes(vector_store, relative_path):
+    """
+    Rebuild the chunk hashes of a file from the vector store.
+
+    Used for files that have no chunk manifest entry yet, e.g. when the
+    vector store was downloaded or built before manifests existed.
+    """
+    data = vector_store.get(
+        where={"source": relative_path}, include=["documents", "metadatas"]
+    )
+    by_index = {}
+    for doc_id, document, metadata in zip(
+        data["ids"], data["documents"], data["metadatas"]
+    ):
+        suffix = doc_id.rsplit("-", 1)[-1]
+        if suffix.isdigit():
+            by_index[int(suffix)] = chunk_hash(document, metadata)
+    if not by_index:
+        return []
+    return [by_index.get(i) for i in range(max(by_index) + 1)]
+
+
+def diff_file(relative_path, documents, old_hashes, summary):
+    """
+    Diff the new chunks of a file against the hashes of its stored chunks.
+
+    Returns (changed_documents, new_hashes, stale_ids) where stale_ids are the
+    trailing ids left behind when the file now has fewer chunks.
+    """
+    changed = []
+    new_hashes = []
+    for i, document in enumerate(documents):
+        new_hash = chunk_hash(document.page_content, document.metadata)
+        new_hashes.append(new_hash)
+        if i >= len(old_hashes):
+            summary.added += 1
+            changed.append(document)
+        elif old_hashes[i] != new_hash:
+            summary.updated += 1
+            changed.append(document)
+        else:
+            summary.unchanged += 1
+    stale_ids = [
+        chunk_id(relative_path, i) for i in range(len(documents), len(old_hashes))
+    ]
+    return changed, new_hashes, stale_ids
+
+
+def diff_stream(items, chunk_manifest, lookup_old, summary):
+    """
+    Filter an ingestion stream down to the chunks that actually changed.
+
+    The chunks of a file arrive contiguously and are followed by its FileDone
+    marker. The marker is re-emitted with the new chunk hashes and the stale
+    ids to delete once the file is committed.
+    """
+    buffer = []
+    for item in items:
+        if not isinstance(item, FileDone):
+            buffer.append(item)
+            continue
+
+        old_hashes = chunk_manifest.get(item.relative_path)
+        if old_hashes is None:
+            old_hashes = lookup_old(item.relative_path)
+        changed, new_hashes, stale_ids = diff_file(
+            item.relative_path, buffer, old_hashes, summary
+        )
+        yield from changed
+        yield item._replace(chunk_hashes=new_hashes, stale_ids=stale_ids)
+        buffer = []
+
+
+def find_removed_files(file_index, seen_paths):
+    """Return the indexed files that no longer exist in the docs tree."""
+    return sorted(set(file_index) - set(seen_paths))
+
+
+def delete_chunks(vector_store, ids):
+    """Delete chunk ids from the vector store in bulk."""
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        vector_store.delete(ids=ids[i : i + DELETE_BATCH_SIZE])
+
+
+def apply_sync(
+    vector_store,
+    committed,
+    removed,
+    file_index,
+    chunk_manifest,
+    lookup_old,
+    summary,
+    lexical_index=None,
+):
+    """
+    Record committed files in the chunk manifest and delete orphaned chunks.
+
+    Stale trailing chunks of committed files and every chunk of removed files
+    are deleted in bulk from the vector store and the lexical index, and
+    removed files are dropped from both file indexes.
+    """
+    stale_ids = []
+    for done in committed:
+        chunk_manifest[done.relative_path] = done.chunk_hashes
+        stale_ids.extend(done.stale_ids)
+
+    for relative_path in removed:
+        old_hashes = chunk_manifest.pop(relative_path, None)
+        if old_hashes is None:
+            old_hashes = lookup_old(relative_path)
+        stale_ids.extend(chunk_id(relative_path, i) for i in range(len(old_hashes)))
+        file_index.pop(relative_path, None)
+        summary.removed_files += 1
+
+    delete_chunks(vector_store, stale_ids)
+    if lexical_index is not None:
+        lexical_index.delete(stale_ids)
+    summary.deleted += len(stale_ids)
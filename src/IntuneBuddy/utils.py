@@ -1,7 +1,10 @@
 import subprocess
 import sys
 import re
+import time
+import asyncio
 
+from concurrent.futures import ThreadPoolExecutor
 from rich import print
 
 
@@ -45,20 +48,77 @@ def ensure_git_installed():
         sys.exit(1)
 
 
-def retry_chain_invoke(chain, inputs, fallback_response, max_retries=5):
-    retries = 0
-    while retries < max_retries:
-        retries += 1
-        result = chain.invoke(inputs)
-        result = clean_output(result)
+def chain_inputs(question, docs, history):
+    """
+    Build the prompt inputs for a question and its retrieved documents.
+    """
+    return {
+        "Intune_docs": "\n\n".join(doc.page_content for doc in docs),
+        "question": question,
+        "history": history,
+        "metadata_source": doc_link(docs[0]) if docs else "",
+    }
+
+
+def doc_link(doc):
+    """Return the documentation path of a chunk, with the #anchor of its section."""
+    source = doc.metadata["source"].removesuffix(".md")
+    anchor = doc.metadata.get("anchor")
+    return f"{source}#{anchor}" if anchor else source
+
+
+def retry_delays(max_retries=5, backoff=0.5, budget=120.0):
+    """
+    Yield the delay in seconds to wait before each generation.
+
+    The first generation runs at once, retries back off exponentially and
+    stop once the next attempt would exceed the wall-clock budget in seconds.
+    """
+    start = time.monotonic()
+    for generation in range(max_retries):
+        delay = backoff * 2 ** (generation - 1) if generation else 0
+        if delay and time.monotonic() - start + delay > budget:
+            return
+        yield delay
+
+
+def retry_chain_invoke(
+    chain, inputs, fallback_response, max_retries=5, backoff=0.5, budget=120.0
+):
+    """
+    Invoke the chain and only generate again while it returns the fallback.
+
+    Returns the result and the number of generations that were run.
+    """
+    generations = 0
+    for delay in retry_delays(max_retries, backoff, budget):
+        if delay:
+            time.sleep(delay)
+        generations += 1
+        result = clean_output(chain.invoke(inputs))
         if result != fallback_response:
-            return result, retries
-    return fallback_response, retries
+            return result, generations
+    return fallback_response, generations
 
 
-def ensure_model_installed(model_name: str):
+async def aretry_chain_invoke(
+    chain, inputs, fallback_response, max_retries=5, backoff=0.5, budget=120.0
+):
+    """Async version of retry_chain_invoke, cancelling it stops the generation."""
+    generations = 0
+    for delay in retry_delays(max_retries, backoff, budget):
+        if delay:
+            await asyncio.sleep(delay)
+        generations += 1
+        result = clean_output(await chain.ainvoke(inputs))
+        if result != fallback_response:
+            return result, generations
+    return fallback_response, generations
+
+
+def list_installed_models():
     """
-    Ensure the specified model is installed.
+    Return the output of `ollama list`.
     """
     try:
         output = subprocess.run(
@@ -67,12 +127,36 @@ def ensure_model_installed(model_name: str):
             capture_output=True,
             text=True,
         )
-    except subprocess.CalledProcessError:
+    except (FileNotFoundError, subprocess.CalledProcessError):
         print(
-            f"[red]Failed to check if {model_name} is installed. Please check your Ollama installation.[/red]"
+            "[red]Failed to list installed models. Please check your Ollama installation.[/red]"
         )
         sys.exit(1)
-    if model_name not in output.stdout:
+    return output.stdout
+
+
+def ensure_model_installed(model_name: str, installed_models: str = None):
+    """
+    Ensure the specified model is installed.
+
+    Pass the output of `ollama list` as installed_models to avoid running it
+    again for every model.
+    """
+    if installed_models is None:
+        try:
+            output = subprocess.run(
+                ["ollama", "list"],
+                check=True,
+                capture_output=True,
+                text=True,
+            )
+        except subprocess.CalledProcessError:
+            print(
+                f"[red]Failed to check if {model_name} is installed. Please check your Ollama installation.[/red]"
+            )
+            sys.exit(1)
+        installed_models = output.stdout
+    if model_name not in installed_models:
         install_cmd = ["ollama", "pull", model_name]
         should_install = input(
             f"\n{model_name} model is not installed. Do you want to install it? (y/n): "
@@ -92,6 +176,29 @@ def ensure_model_installed(model_name: str):
             sys.exit(1)
 
 
+def run_startup_checks(*models):
+    """
+    Check that Git and Ollama work and that the models are installed.
+
+    The Git and Ollama checks run concurrently and `ollama list` is only run
+    once for all models, installing a missing model still asks for
+    confirmation.
+    """
+
+    def check_ollama():
+        ensure_ollama_installed()
+        return list_installed_models()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        git_check = executor.submit(ensure_git_installed)
+        ollama_check = executor.submit(check_ollama)
+        git_check.result()
+        installed_models = ollama_check.result()
+
+    for model in models:
+        ensure_model_installed(model, installed_models)
+
+
 def clean_output(output: str) -> str:
     """
     Cleans the LLM output by removing unwanted patterns and unnecessary greetings.
@@ -115,10 +222,85 @@ def clean_output(output: str) -> str:
     return output.strip()
 
 
+class ThinkFilter:
+    """
+    Strip <think>...</think> blocks from a stream of text chunks.
+
+    Tags can be split across chunks, so a trailing partial tag is held back
+    until the next chunk shows whether it is a tag or plain text.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._thinking = False
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the text that is safe to show."""
+        self._buffer += chunk
+        output = []
+        while True:
+            tag = self.CLOSE_TAG if self._thinking else self.OPEN_TAG
+            index = self._buffer.find(tag)
+            if index == -1:
+                keep = _partial_tag_length(self._buffer, tag)
+                if not self._thinking:
+                    output.append(self._buffer[: len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep :]
+                break
+            if not self._thinking:
+                output.append(self._buffer[:index])
+            self._buffer = self._buffer[index + len(tag) :]
+            self._thinking = not self._thinking
+        return "".join(output)
+
+    def flush(self) -> str:
+        """Return any held back text once the stream has ended."""
+        rest = "" if self._thinking else self._buffer
+        self._buffer = ""
+        return rest
+
+
+def _partial_tag_length(text, tag):
+    """Return the length of the longest prefix of tag that text ends with."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+async def astream_chain(chain, inputs, on_text):
+    """
+    Stream the chain output, calling on_text with the visible text so far.
+
+    Returns the full raw output and the time to the first token in seconds,
+    cancelling it stops the generation.
+    """
+    think_filter = ThinkFilter()
+    start = time.perf_counter()
+    first_token = None
+    raw = []
+    visible = ""
+    async for chunk in chain.astream(inputs):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        raw.append(chunk)
+        text = think_filter.feed(chunk)
+        if text:
+            visible += text
+            on_text(visible)
+    visible += think_filter.flush()
+    on_text(visible)
+    return "".join(raw), first_token
+
+
 def stop_models(*models):
     """
-    Stops the running Ollama model.
+    Unload Ollama models, returns the ones that could not be stopped.
     """
+    failed = []
     for model in models:
         try:
             subprocess.run(
@@ -127,8 +309,10 @@ def stop_models(*models):
                 capture_output=True,
                 text=True,
             )
-        except subprocess.CalledProcessError:
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            # Not worth failing an exit for, Ollama unloads it after its keep_alive
             print(
-                f"[red]Failed to stop {model}. Please check your Ollama installation.[/red]"
+                f"[yellow]Could not stop {model}, Ollama will unload it when idle.[/yellow]"
             )
-            sys.exit(1)
+            failed.append(model)
+    return failed
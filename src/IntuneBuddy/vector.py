@@ -2,16 +2,12 @@ import os
 import subprocess
 import json
 import sys
-import hashlib
+import itertools
+import threading
 import requests
-import shutil
-import zipfile
 
 from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
 from rich import print
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from rich.progress import (
     Progress,
     SpinnerColumn,
@@ -19,22 +15,125 @@ from rich.progress import (
     TextColumn,
     TimeElapsedColumn,
 )
+from .cache import CachedEmbeddings, EmbeddingCache
+from .changes import get_head_commit, git_changes
+from .chunking import CHUNKER_VERSION
+from .config import KEEP_ALIVE
+from .ingest import BASE_DIRS, DOCS_DIR, iter_markdown_files, stream_documents
+from .lexical import LexicalIndex, index_stream
+from .models import duration_seconds
+from .readonly import (
+    ReadOnlyVectorStore,
+    export_exists,
+    export_index,
+    export_quantization,
+)
+from .generations import (
+    GenerationLocked,
+    current_generation,
+    get_generations,
+)
+from .paths import download_dir, embedding_cache_file
+from .retrieval import RETRIEVER_K, HybridRetriever
+from .scheduler import EmbeddingAborted, EmbeddingScheduler
+from .snapshot import SnapshotError, install_snapshot
+from .sync import (
+    SyncSummary,
+    apply_sync,
+    diff_stream,
+    find_removed_files,
+    stored_chunk_hashes,
+)
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-# Setup
-db_location = os.path.join(os.path.dirname(__file__), "chroma_db")
-index_file = os.path.join(os.path.dirname(__file__), "file_index.json")
-embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+# Constants
+EMBEDDING_MODEL = "mxbai-embed-large"
+COLLECTION_NAME = "Intune_docs"
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_embedding_keep_alive = duration_seconds(KEEP_ALIVE)
+_lexical_indexes = {}
+_lexical_index_lock = threading.Lock()
+
+
+def get_embeddings():
+    """Return the shared, cached embedding function, creating it on first use."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings(
+                OllamaEmbeddings(
+                    model=EMBEDDING_MODEL, keep_alive=_embedding_keep_alive
+                ),
+                EmbeddingCache(embedding_cache_file),
+            )
+        return _embeddings
+
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1500,
-    chunk_overlap=100,
-)
+def set_embedding_keep_alive(keep_alive):
+    """Set how many seconds Ollama keeps the embedding model loaded, None leaves it to the server."""
+    global _embedding_keep_alive
+    with _embeddings_lock:
+        _embedding_keep_alive = keep_alive
+        if _embeddings is not None:
+            _embeddings.embeddings.keep_alive = keep_alive
+
+
+def get_lexical_index(generation=None):
+    """Return the shared BM25 lexical index of a generation, opening it on first use."""
+    generation = generation or current_generation()
+    with _lexical_index_lock:
+        if generation.lexical_index_file not in _lexical_indexes:
+            _lexical_indexes[generation.lexical_index_file] = LexicalIndex(
+                generation.lexical_index_file
+            )
+        return _lexical_indexes[generation.lexical_index_file]
+
+
+def release_generation(generation):
+    """Close the lexical index and Chroma files of a generation, so it can be removed."""
+    with _lexical_index_lock:
+        lexical_index = _lexical_indexes.pop(generation.lexical_index_file, None)
+    if lexical_index is not None:
+        lexical_index.close()
+    # Chroma keeps one system per persist directory for the life of the
+    # process. Its registry is internal, so releasing it is best effort and
+    # must not replace the error a failed build is being discarded for.
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+
+        systems = getattr(SharedSystemClient, "_identifier_to_system", None)
+        system = systems.pop(generation.db_location, None) if systems else None
+        if system is not None:
+            system.stop()
+    except Exception as e:
+        print(f"[yellow]Could not release the Chroma files of the index: {e}[/yellow]")
+
+
+def load_json(path):
+    """Load a JSON index file, or return an empty dict if it doesn't exist."""
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_json(path, data, indent=None):
+    """Write a JSON index file atomically so an interrupted write can't corrupt it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
 
 
 def download_vector_store():
-    """Download pre-built vector store from GitHub."""
+    """
+    Download pre-built vector store from GitHub.
+
+    Returns True if the vector store was downloaded, False if it will be built.
+    """
     download = (
         input(
             "\n📦 Vector store not found. Do you want to download it from GitHub? (y/n): "
@@ -43,168 +142,137 @@ def download_vector_store():
         .lower()
     )
     if download == "y":
-        # Paths
-        tmp_dir = (
-            os.path.join(os.path.expanduser("~"), "AppData", "Local", "Temp")
-            if os.name == "nt"
-            else "/tmp"
-        )
-        zip_path = os.path.join(tmp_dir, "IntuneBuddy.zip")
-        extract_dir = os.path.join(tmp_dir, "IntuneBuddy")
-
-        # Download the zip file
-        url = "https://github.com/almenscorner/IntuneBuddy/releases/download/v0.0.1/vector_store.zip"
-        print(f"\n⬇️ Downloading from {url}...")
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(zip_path, "wb") as f:
-            f.write(response.content)
-
-        # Unzip the file
-        print("\n📦 Unzipping...")
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(extract_dir)
-
-        # Move files
-        print("\n📂 Moving files...")
-        shutil.move(
-            os.path.join(extract_dir, "chroma_db"),
-            os.path.join(os.path.dirname(__file__), "chroma_db"),
-        )
-        shutil.move(
-            os.path.join(extract_dir, "file_index.json"),
-            os.path.join(os.path.dirname(__file__), "file_index.json"),
-        )
-
-        # Cleanup
-        print("\n🧹 Cleaning up...")
-        os.remove(zip_path)
-        shutil.rmtree(extract_dir)
+        generations = get_generations()
+        try:
+            with generations.build_lock():
+                if generations.current() is not None:
+                    print("\n✅ Another Intune Buddy process has built the index.\n")
+                    return True
+                _install_snapshot(generations)
+        except GenerationLocked:
+            print(
+                "[red]Another Intune Buddy process is building the index, run Intune Buddy again once it is done.[/red]"
+            )
+            sys.exit(1)
 
         print("\n✅ Vector store downloaded successfully.\n")
+        return True
     else:
         print(
             "\n[yellow]Vector store will be built. This will take a while...[/yellow]\n"
         )
+        return False
+
+
+def _install_snapshot(generations):
+    generation = generations.create()
+    try:
+        install_snapshot(generation.db_location, generation.index_file, download_dir)
+    except (SnapshotError, requests.RequestException, OSError) as e:
+        generations.discard(generation)
+        print(f"[red]Failed to install the vector store: {e}[/red]")
+        print("Run Intune Buddy again to resume the download.")
+        sys.exit(1)
+    generations.activate(generation)
+
+
+def open_vector_store(generation=None):
+    """Open the persistent Chroma collection of a generation, the current one by default."""
+    # Imported here so the read-only mode never loads Chroma
+    from langchain_chroma import Chroma
+
+    generation = generation or current_generation()
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        persist_directory=generation.db_location,
+        embedding_function=get_embeddings(),
+    )
 
 
-if not os.path.exists(db_location):
-    download_vector_store()
-
-vectore_store = Chroma(
-    collection_name="Intune_docs",
-    persist_directory=db_location,
-    embedding_function=embeddings,
-)
-
-# Constants
-BATCH_SIZE = 5000
-
-# Load existing file index (or empty)
-if os.path.exists(index_file):
-    with open(index_file, "r") as f:
-        file_index = json.load(f)
-else:
-    file_index = {}
-
-documents = []
-ids = []
-
-
-def normalize_path(path):
-    """Normalize file paths to always use forward slashes."""
-    return path.replace("\\", "/")
-
-
-def hash_file(filepath):
-    """Return SHA256 hash of file contents with normalized line endings."""
-    hasher = hashlib.sha256()
-    with open(filepath, "rb") as f:
-        buf = f.read()
-        buf = buf.replace(b"\r\n", b"\n")  # Normalize CRLF to LF
-        hasher.update(buf)
-    return hasher.hexdigest()
-
-
-def get_intune_docs():
-    changed_files = 0
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    base_dir = os.path.join(current_dir, "IntuneDocs/intune/intune-service")
-
-    base_dirs = [
-        os.path.join(current_dir, "IntuneDocs/intune/intune-service"),
-        os.path.join(current_dir, "IntuneDocs/autopilot"),
-    ]
-
-    for base_dir in base_dirs:
-        for root, dirs, files in os.walk(base_dir):
-            for filename in files:
-                if filename.endswith(".md"):
-                    file_path = os.path.join(root, filename)
-                    relative_path = normalize_path(
-                        os.path.relpath(file_path, start=base_dir)
-                    )
-                    file_hash = hash_file(file_path)
+def export_vector_store(vector_store, export_dir, quantization=None):
+    """Export the Chroma collection for the read-only mode."""
+    metadata = vector_store._collection.metadata or {}
+    return export_index(
+        vector_store,
+        export_dir,
+        space=metadata.get("hnsw:space", "l2"),
+        quantization=quantization,
+    )
 
-                    # ❗️Check hash BEFORE opening the file
-                    if file_index.get(relative_path) == file_hash:
-                        continue  # File unchanged, skip!
 
-                    changed_files += 1
+def open_readonly_vector_store(quantization=None, generation=None):
+    """
+    Open the exported read-only index.
 
-                    # Only read and split if the file changed
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        raw_text = f.read()
+    The export is created when there is none, and re-created when
+    quantization ("none", "int8" or "binary") differs from the existing one.
+    """
+    generation = generation or current_generation()
+    export_dir = generation.export_dir
+    wanted = None if quantization in (None, "none") else quantization
+    if not export_exists(export_dir) or (
+        quantization is not None and export_quantization(export_dir) != wanted
+    ):
+        print("\n📤 Exporting the vector store for read-only mode...\n")
+        export_vector_store(open_vector_store(generation), export_dir, wanted)
+    return ReadOnlyVectorStore(export_dir, get_embeddings())
 
-                    chunks = text_splitter.split_text(raw_text)
 
-                    for i, chunk in enumerate(chunks):
-                        metadata = {
-                            "source": relative_path,
-                            "type": "intune",
-                        }
+def get_intune_docs(file_index, files=None):
+    """
+    Stream Documents and FileDone markers for every changed doc file.
 
-                        document = Document(
-                            page_content=chunk,
-                            metadata=metadata,
-                            id=f"{relative_path}-{i}",
-                        )
-                        documents.append(document)
-                        ids.append(f"{relative_path}-{i}")
+    When files is given only those (file_path, relative_path) pairs are
+    checked, otherwise the whole docs tree is hashed.
+    """
+    if files is not None and not files:
+        return iter(())
+    return stream_documents(BASE_DIRS, file_index, files=files)
 
-                    # Update hash only AFTER processing the file
-                    file_index[relative_path] = file_hash
 
-    return changed_files
+def add_documents_in_batches(vector_store, items, file_index, show_progress=True):
+    """
+    Drain the ingestion stream into the vector store with concurrent workers.
 
+    File hashes are only recorded in file_index once all chunks of the file
+    have been stored, so a file with a failed chunk is picked up again on the
+    next run. Returns the FileDone markers of the files that were indexed and
+    the (document, error) tuples of the chunks that failed.
+    """
+    scheduler = EmbeddingScheduler(vector_store)
 
-def add_documents_in_batches(vector_store, documents, ids):
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
         BarColumn(),
-        TextColumn("[progress.percentage]{task.completed}/{task.total}"),
+        TextColumn("[progress.percentage]{task.completed} chunks"),
+        TextColumn("{task.fields[rate]:.1f} chunks/s"),
         TimeElapsedColumn(),
+        disable=not show_progress,
     ) as progress:
         task = progress.add_task(
-            "[bright_cyan]Adding content to Vector database...", total=len(documents)
+            "[bright_cyan]Adding content to Vector database...", total=None, rate=0.0
+        )
+        scheduler.run(
+            items,
+            file_index,
+            on_progress=lambda stored, rate: progress.update(
+                task, advance=stored, rate=rate
+            ),
         )
-        for i in range(0, len(documents), BATCH_SIZE):
-            batch_docs = documents[i : i + BATCH_SIZE]
-            batch_ids = ids[i : i + BATCH_SIZE]
-            try:
-                vector_store.add_documents(documents=batch_docs, ids=batch_ids)
-                progress.update(task, advance=len(batch_docs))
-            except Exception as e:
-                print(f"[red]Error adding batch {i // BATCH_SIZE + 1}: {e}[/red]")
-                continue
 
-    print("\n✅ All content have been added to the vector database successfully!\n")
+    if scheduler.failed:
+        print(
+            f"[yellow]{len(scheduler.failed)} chunks could not be added and will be retried on the next run.[/yellow]"
+        )
+    elif show_progress:
+        print("\n✅ All content have been added to the vector database successfully!\n")
+    return scheduler.committed, scheduler.failed
 
 
 def ensure_intunedocs_up_to_date():
     repo_url = "https://github.com/MicrosoftDocs/memdocs.git"
-    docs_dir = os.path.join(os.path.dirname(__file__), "IntuneDocs")
+    docs_dir = DOCS_DIR
 
     if not os.path.exists(docs_dir):
         print("\n📚 IntuneDocs not found. Cloning fresh copy...\n")
@@ -234,25 +302,203 @@ def ensure_intunedocs_up_to_date():
             )
 
 
-# Ensure IntuneDocs is up to date
-ensure_intunedocs_up_to_date()
-
-print("\n🔍 Scanning for changed files...\n")
-changed_files = get_intune_docs()
+def sync_index(vector_store=None, verbose=True, rechunk=True):
+    """
+    Bring the index up to date with the IntuneDocs repository.
+
+    Pulls the docs and looks for changed and removed files in the current
+    generation, vector_store can be an open store of it. Changes are
+    applied to a copy of the current generation, which is activated once it
+    is complete, so readers keep using the current generation meanwhile.
+    With verbose=False nothing but errors is printed, so it can run in the
+    background while the chat prompt is active. Only one process syncs at a
+    time, while another one is syncing this returns an empty SyncSummary
+    right away. When the embedding model can't be used the build is
+    discarded, in the background EmbeddingAborted is raised, otherwise the
+    process exits.
+
+    When the chunker changed every file is split again, which re-embeds
+    most of the corpus. rechunk=False leaves that to a later sync and only
+    indexes the changed files, summary.rechunk_pending tells it was left.
+    Returns the SyncSummary.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    generations = get_generations()
+    try:
+        with generations.build_lock():
+            return _sync(generations, vector_store, log, verbose, rechunk)
+    except GenerationLocked:
+        log(
+            "[yellow]Another Intune Buddy process is syncing the index, skipping this sync.[/yellow]\n"
+        )
+        return SyncSummary()
+    except EmbeddingAborted as e:
+        if not verbose:
+            raise
+        print(f"[red]{e}[/red]")
+        print("[red]The sync was stopped, the index was left as it was.[/red]")
+        sys.exit(1)
+
+
+def _sync(generations, vector_store, log, verbose, rechunk):
+    """Sync the index while holding the build lock."""
+    current = generations.current()
+    if vector_store is not None and current is not None:
+        # Another process may have activated a generation since it was opened
+        if getattr(vector_store, "_persist_directory", None) != current.db_location:
+            vector_store = None
+    if current is not None:
+        vector_store = vector_store or open_vector_store(current)
+        file_index = load_json(current.index_file)
+        chunk_manifest = load_json(current.manifest_file)
+        index_state = load_json(current.state_file)
+    else:
+        file_index, chunk_manifest, index_state = {}, {}, {}
+
+    def lookup_old_chunks(relative_path):
+        # Chunks of the current generation, which the build is a copy of
+        if current is None:
+            return []
+        return stored_chunk_hashes(vector_store, relative_path)
+
+    # Ensure IntuneDocs is up to date
+    ensure_intunedocs_up_to_date()
+
+    # A downloaded vector store comes without a lexical index, build it once
+    # from the stored chunks and keep it in step with every sync after that.
+    # It is only derived from the store, so it is built in place.
+    if current is not None and not get_lexical_index(current).count():
+        get_lexical_index(current).rebuild(vector_store)
+
+    log("\n🔍 Scanning for changed files...\n")
+    # Ask git what changed since the last indexed commit, only hash every file
+    # when there is no usable commit to diff against
+    head_commit = get_head_commit(DOCS_DIR)
+    changes = None
+    # Files split by an older chunker are split again, only the chunks that
+    # come out differently are embedded
+    outdated = bool(file_index) and index_state.get("chunker") != CHUNKER_VERSION
+    rechunk = rechunk and outdated
+    if rechunk:
+        log("✂️ The chunker has changed, splitting every document again...\n")
+    elif head_commit and index_state.get("commit") and file_index:
+        changes = git_changes(DOCS_DIR, BASE_DIRS, index_state["commit"], head_commit)
+
+    def mark_synced(state_file):
+        # Without a readable HEAD the next sync hashes every file instead,
+        # the chunker is still recorded so it doesn't split them all again
+        if head_commit:
+            index_state["commit"] = head_commit
+        # The chunker is only recorded once every file has been split by it
+        if not outdated or rechunk:
+            index_state["chunker"] = CHUNKER_VERSION
+        save_json(state_file, index_state, indent=2)
+
+    summary = SyncSummary()
+    summary.rechunk_pending = outdated and not rechunk
+    items = diff_stream(
+        get_intune_docs(
+            {} if rechunk else file_index, changes.changed if changes else None
+        ),
+        chunk_manifest,
+        lookup_old_chunks,
+        summary,
+    )
+    first_item = next(items, None)
+    if changes:
+        removed = [path for path in changes.removed if path in file_index]
+    else:
+        removed = find_removed_files(
+            file_index,
+            (relative_path for _, relative_path in iter_markdown_files(BASE_DIRS)),
+        )
 
-if documents:
-    print(
-        f"📝 {changed_files} changed documents found, updating, this might take a while... ☕\n"
+    if first_item is None and not removed:
+        log("✅ No changes detected. Vector database is up-to-date.\n")
+        if current is not None:
+            mark_synced(current.state_file)
+        return summary
+
+    build = generations.create(copy_from=current)
+    try:
+        failed = _build_generation(
+            build,
+            itertools.chain([first_item], items) if first_item is not None else (),
+            removed,
+            file_index,
+            chunk_manifest,
+            lookup_old_chunks,
+            summary,
+            log,
+            verbose,
+        )
+        # Only move the commit forward when every change made it into the
+        # index, so failed files are part of the next diff again
+        if not failed:
+            mark_synced(build.state_file)
+    except BaseException:
+        generations.discard(build)
+        raise
+    generations.activate(build)
+
+    summary.failed = len(failed)
+    return summary
+
+
+def _build_generation(
+    build,
+    items,
+    removed,
+    file_index,
+    chunk_manifest,
+    lookup_old_chunks,
+    summary,
+    log,
+    verbose,
+):
+    """Apply the changes of a sync to the build generation, returns the failed chunks."""
+    vector_store = open_vector_store(build)
+    lexical_index = get_lexical_index(build)
+    embeddings = get_embeddings()
+    committed, failed = [], []
+
+    items = index_stream(lexical_index, items)
+    first_item = next(items, None)
+    if first_item is not None:
+        log("📝 Changed documents found, updating, this might take a while... ☕\n")
+        committed, failed = add_documents_in_batches(
+            vector_store,
+            itertools.chain([first_item], items),
+            file_index,
+            show_progress=verbose,
+        )
+        log(f"📝 {len(committed)} changed documents indexed.\n")
+        if embeddings.hits:
+            log(f"♻️ Reused {embeddings.hits} cached embeddings.\n")
+
+    apply_sync(
+        vector_store,
+        committed,
+        removed,
+        file_index,
+        chunk_manifest,
+        lookup_old_chunks,
+        summary,
+        lexical_index,
     )
-    add_documents_in_batches(vectore_store, documents, ids)
-else:
-    print("✅ No changes detected. Vector database is up-to-date.\n")
+    log(f"🔄 Sync summary: {summary}\n")
 
-# Save updated index
-with open(index_file, "w") as f:
-    json.dump(file_index, f, indent=2)
+    save_json(build.index_file, file_index, indent=2)
+    save_json(build.manifest_file, chunk_manifest)
 
-retreiver = vectore_store.as_retriever(
-    search_type="similarity_score_threshold",
-    search_kwargs={"score_threshold": 0.4, "k": 8},
-)
+    # Keep the read-only export in step once it has been created
+    if summary.changed and export_exists(build.export_dir):
+        log("📤 Updating the read-only index export...\n")
+        export_vector_store(
+            vector_store, build.export_dir, export_quantization(build.export_dir)
+        )
+    return failed
+
+
+def get_retriever(vector_store, k=RETRIEVER_K, generation=None):
+    return HybridRetriever(vector_store, get_lexical_index(generation), k=k)
@@ -0,0 +1,136 @@
+import io
+import json
+import pytest
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+from IntuneBuddy.batch import read_questions, run_batch
+from IntuneBuddy.scope import Scope
+
+
+def test_read_questions():
+    lines = [
+        '{"id": "q1", "question": "How do I enroll a Mac?"}\n',
+        "\n",
+        '"What is Autopilot?"\n',
+    ]
+
+    assert list(read_questions(lines)) == [
+        {"id": "q1", "question": "How do I enroll a Mac?"},
+        {"question": "What is Autopilot?", "id": 3},
+    ]
+
+
+@pytest.mark.parametrize("line", ["not json", '{"id": 1}', "[1, 2]"])
+def test_read_questions_rejects_invalid_lines(line):
+    with pytest.raises(ValueError, match="Line 1"):
+        list(read_questions([line]))
+
+
+def test_run_batch_embeds_once_and_keeps_order():
+    retriever = MagicMock()
+    embed_queries = retriever.vector_store.embeddings.embed_queries
+    embed_queries.return_value = [[1.0, 0.0], [0.0, 1.0]]
+    retriever.search.side_effect = [
+        [(Document(page_content="ADE", metadata={"source": "macos.md"}), 0.81234)],
+        [],
+    ]
+    chain = MagicMock()
+    chain.invoke.side_effect = lambda inputs: f"Answer: {inputs['question']}"
+    questions = [{"id": 1, "question": "first"}, {"id": 2, "question": "second"}]
+    output = io.StringIO()
+
+    assert run_batch(chain, retriever, questions, output, concurrency=2) == 2
+
+    embed_queries.assert_called_once_with(["first", "second"])
+    retriever.search.assert_any_call("second", [0.0, 1.0], Scope())
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [record["id"] for record in records] == [1, 2]
+    assert records[0]["answer"] == "Answer: first"
+    assert records[0]["sources"] == [{"source": "macos.md", "score": 0.8123}]
+    assert records[1]["sources"] == []
+    assert not records[0]["cached"]
+
+
+def test_run_batch_records_failed_questions_and_continues():
+    retriever = MagicMock()
+    retriever.vector_store.embeddings.embed_queries.return_value = [[1.0], [0.0]]
+    retriever.search.return_value = []
+
+    def invoke(inputs):
+        if inputs["question"] == "first":
+            raise ConnectionError("Connection reset by Ollama")
+        return "Answer"
+
+    chain = MagicMock()
+    chain.invoke.side_effect = invoke
+    questions = [{"id": 1, "question": "first"}, {"id": 2, "question": "second"}]
+    output = io.StringIO()
+
+    assert run_batch(chain, retriever, questions, output) == 1
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert records[0] == {
+        "id": 1,
+        "question": "first",
+        "error": "Connection reset by Ollama",
+    }
+    assert records[1]["answer"] == "Answer"
+
+
+def test_run_batch_uses_answer_cache():
+    retriever = MagicMock()
+    retriever.vector_store.embeddings.embed_queries.return_value = [[1.0, 0.0]]
+    retriever.search.return_value = []
+    answer_cache = MagicMock()
+    answer_cache.lookup.return_value = ("first", "Cached answer")
+    chain = MagicMock()
+    output = io.StringIO()
+
+    run_batch(
+        chain,
+        retriever,
+        [{"id": 1, "question": "first"}],
+        output,
+        model="gemma3:12b",
+        answer_cache=answer_cache,
+    )
+
+    chain.invoke.assert_not_called()
+    answer_cache.lookup.assert_called_once_with("gemma3:12b", [1.0, 0.0], Scope())
+    record = json.loads(output.getvalue())
+    assert record["answer"] == "Cached answer"
+    assert record["cached"]
+
+
+def test_run_batch_searches_like_the_chat():
+    retriever = MagicMock()
+    retriever.vector_store.embeddings.embed_queries.return_value = [[1.0], [0.0]]
+    retriever.search.return_value = [
+        (Document(page_content="ADE", metadata={"source": "a.md"}), 0.9)
+    ]
+    answer_cache = MagicMock()
+    answer_cache.lookup.return_value = None
+    chain = MagicMock()
+    chain.invoke.return_value = "Answer"
+    questions = [{"question": "Reset an iPad"}, {"question": "What is Intune?"}]
+
+    run_batch(chain, retriever, questions[:1], io.StringIO())
+    run_batch(
+        chain,
+        retriever,
+        questions[1:],
+        io.StringIO(),
+        answer_cache=answer_cache,
+        scope=Scope(area="enrollment"),
+    )
+
+    # The platform is inferred without a scope, a given scope is used as is
+    assert [c.args[2] for c in retriever.search.call_args_list] == [
+        Scope(platform="ios"),
+        Scope(area="enrollment"),
+    ]
+    # Answers are cached within the scope they were searched in
+    answer_cache.lookup.assert_called_once_with(None, [1.0], Scope(area="enrollment"))
+    assert answer_cache.store.call_args.args[-1] == Scope(area="enrollment")
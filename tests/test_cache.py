@@ -0,0 +1,196 @@
+import json
+import os
+import sqlite3
+import pytest
+from unittest.mock import MagicMock
+
+from IntuneBuddy.cache import AnswerCache, CachedEmbeddings, EmbeddingCache, text_hash
+from IntuneBuddy.scope import Scope
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embedding_cache.db"))
+    yield cache
+    cache.close()
+
+
+def fake_embeddings():
+    embeddings = MagicMock()
+    embeddings.model = "mxbai-embed-large"
+    embeddings.embed_documents.side_effect = lambda texts: [
+        [float(len(text)), 0.5] for text in texts
+    ]
+    return embeddings
+
+
+def test_cache_round_trip(cache):
+    cache.put_many("model", [(text_hash("a"), [1.0, 2.5])])
+
+    assert cache.get_many("model", [text_hash("a"), text_hash("b")]) == {
+        text_hash("a"): [1.0, 2.5]
+    }
+    assert cache.get_many("other-model", [text_hash("a")]) == {}
+
+
+def test_cache_persists(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    first = EmbeddingCache(path)
+    first.put_many("model", [("key", [0.25])])
+    first.close()
+
+    second = EmbeddingCache(path)
+    assert second.get_many("model", ["key"]) == {"key": [0.25]}
+    second.close()
+
+
+def test_cached_embeddings_only_embeds_misses(cache):
+    embeddings = fake_embeddings()
+    cached = CachedEmbeddings(embeddings, cache)
+
+    assert cached.embed_documents(["one", "three"]) == [[3.0, 0.5], [5.0, 0.5]]
+    assert cached.embed_documents(["three", "four", "four"]) == [
+        [5.0, 0.5],
+        [4.0, 0.5],
+        [4.0, 0.5],
+    ]
+
+    embeddings.embed_documents.assert_called_with(["four"])
+    assert (cached.hits, cached.misses) == (2, 3)
+
+
+def test_cached_embeddings_keyed_by_model(cache):
+    embeddings = fake_embeddings()
+    CachedEmbeddings(embeddings, cache).embed_documents(["one"])
+
+    CachedEmbeddings(embeddings, cache, model="other-model").embed_documents(["one"])
+
+    assert embeddings.embed_documents.call_count == 2
+
+
+@pytest.fixture
+def answer_cache(tmp_path):
+    index_file = tmp_path / "file_index.json"
+    index_file.write_text(json.dumps({"enrollment/macos.md": "hash-1"}))
+    cache = AnswerCache(str(tmp_path / "answer_cache.db"), str(index_file))
+    yield cache
+    cache.close()
+
+
+def test_answer_cache_hit_on_similar_question(answer_cache):
+    answer_cache.store(
+        "gemma3:12b",
+        "How do I enroll a Mac?",
+        [1.0, 0.0],
+        "Use ADE.",
+        ["enrollment/macos.md"],
+    )
+
+    assert answer_cache.lookup("gemma3:12b", [0.99, 0.05]) == (
+        "How do I enroll a Mac?",
+        "Use ADE.",
+    )
+    assert answer_cache.lookup("gemma3:12b", [0.0, 1.0]) is None
+    assert answer_cache.lookup("gemma3:4b", [1.0, 0.0]) is None
+
+
+def test_answer_cache_keyed_by_scope(answer_cache):
+    answer_cache.store(
+        "gemma3:12b",
+        "Enroll an iPhone with ADE",
+        [1.0, 0.0],
+        "Use an enrollment profile for iOS.",
+        ["enrollment/macos.md"],
+        Scope(platform="ios"),
+    )
+
+    assert answer_cache.lookup("gemma3:12b", [1.0, 0.0], Scope("macos")) is None
+    assert answer_cache.lookup("gemma3:12b", [1.0, 0.0]) is None
+    assert answer_cache.lookup("gemma3:12b", [1.0, 0.0], Scope("ios")) == (
+        "Enroll an iPhone with ADE",
+        "Use an enrollment profile for iOS.",
+    )
+
+
+def test_answer_cache_adds_scope_to_old_databases(tmp_path):
+    path = str(tmp_path / "answer_cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE answers (id INTEGER PRIMARY KEY, model TEXT NOT NULL, "
+        "version TEXT NOT NULL, question TEXT NOT NULL, embedding BLOB NOT NULL, "
+        "answer TEXT NOT NULL, sources TEXT NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+
+    cache = AnswerCache(path, str(tmp_path / "file_index.json"))
+    cache.store("gemma3:12b", "q", [1.0, 0.0], "a", [], Scope("ios"))
+    assert cache.lookup("gemma3:12b", [1.0, 0.0], Scope("ios")) == ("q", "a")
+    cache.close()
+
+
+def test_answer_cache_invalidated_by_source_change(answer_cache):
+    answer_cache.store(
+        "gemma3:12b",
+        "How do I enroll a Mac?",
+        [1.0, 0.0],
+        "Use ADE.",
+        ["enrollment/macos.md"],
+    )
+    with open(answer_cache.index_file, "w") as f:
+        json.dump({"enrollment/macos.md": "hash-2"}, f)
+    # Make sure the changed index is picked up even on coarse mtime clocks
+    os.utime(answer_cache.index_file, (0, 0))
+
+    assert answer_cache.lookup("gemma3:12b", [1.0, 0.0]) is None
+    with open(answer_cache.index_file, "w") as f:
+        json.dump({"enrollment/macos.md": "hash-1"}, f)
+    assert answer_cache.lookup("gemma3:12b", [1.0, 0.0]) is None
+
+
+def test_answer_cache_follows_index_generation(tmp_path):
+    files = {}
+    for name, source_hash in [("gen-1", "hash-1"), ("gen-2", "hash-2")]:
+        files[name] = tmp_path / f"{name}.json"
+        files[name].write_text(json.dumps({"enrollment/macos.md": source_hash}))
+    current = ["gen-1"]
+    cache = AnswerCache(
+        str(tmp_path / "answer_cache.db"), lambda: str(files[current[0]])
+    )
+    cache.store(
+        "gemma3:12b", "Enroll a Mac?", [1.0, 0.0], "Use ADE.", ["enrollment/macos.md"]
+    )
+    assert cache.lookup("gemma3:12b", [1.0, 0.0]) is not None
+
+    # The new generation changed the source file
+    current[0] = "gen-2"
+    assert cache.lookup("gemma3:12b", [1.0, 0.0]) is None
+    cache.close()
+
+
+def test_query_embeddings_cached_by_normalized_text(cache):
+    embeddings = fake_embeddings()
+    cached = CachedEmbeddings(embeddings, cache)
+
+    assert cached.embed_query("How do I enroll a Mac?") == [22.0, 0.5]
+    assert cached.embed_query("  how do I  enroll a mac? ") == [22.0, 0.5]
+
+    embeddings.embed_documents.assert_called_once_with(["How do I enroll a Mac?"])
+    assert (cached.query_hits, cached.query_misses) == (1, 1)
+    # Queries are kept apart from chunks with the same text
+    assert (
+        cache.get_many("mxbai-embed-large", [text_hash("How do I enroll a Mac?")]) == {}
+    )
+
+
+def test_query_embeddings_persist_and_evict(cache):
+    embeddings = fake_embeddings()
+    cached = CachedEmbeddings(embeddings, cache, query_cache_size=1)
+    cached.embed_queries(["one", "three", "one"])
+    assert len(cached._queries) == 1
+    embeddings.embed_documents.assert_called_once_with(["one", "three"])
+
+    fresh = CachedEmbeddings(embeddings, cache)
+    assert fresh.embed_queries(["three", "one"]) == [[5.0, 0.5], [3.0, 0.5]]
+    assert embeddings.embed_documents.call_count == 1
+    assert fresh.query_hits == 2
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import pytest
+
+from IntuneBuddy.changes import (
+    DocChanges,
+    get_head_commit,
+    git_changes,
+    parse_name_status,
+)
+
+
+def git(repo_dir, *args):
+    subprocess.run(
+        ["git", "-C", str(repo_dir), *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def commit_all(repo_dir, message):
+    git(repo_dir, "add", "-A")
+    git(repo_dir, "commit", "-q", "-m", message)
+    return get_head_commit(str(repo_dir))
+
+
+@pytest.fixture
+def docs_repo(tmp_path):
+    repo_dir = tmp_path / "IntuneDocs"
+    service_dir = repo_dir / "intune" / "intune-service"
+    autopilot_dir = repo_dir / "autopilot"
+    service_dir.mkdir(parents=True)
+    autopilot_dir.mkdir(parents=True)
+    git(repo_dir, "init", "-q")
+    git(repo_dir, "config", "user.email", "buddy@example.com")
+    git(repo_dir, "config", "user.name", "Buddy")
+
+    (service_dir / "enroll.md").write_text("# Enroll\n")
+    (service_dir / "remove-me.md").write_text("# Remove me\n")
+    (service_dir / "old-name.md").write_text("# Renamed page\n\nSame content.\n")
+    (autopilot_dir / "overview.md").write_text("# Autopilot\n")
+    (repo_dir / "README.md").write_text("# memdocs\n")
+    first = commit_all(repo_dir, "first")
+    return repo_dir, [str(service_dir), str(autopilot_dir)], first
+
+
+def test_parse_name_status():
+    output = "M\0a.md\0R095\0old.md\0new.md\0D\0gone.md\0"
+    assert parse_name_status(output) == [
+        ("M", None, "a.md"),
+        ("R", "old.md", "new.md"),
+        ("D", None, "gone.md"),
+    ]
+
+
+def test_get_head_commit_outside_repo(tmp_path):
+    assert get_head_commit(str(tmp_path)) is None
+
+
+def test_git_changes_no_changes(docs_repo):
+    repo_dir, base_dirs, first = docs_repo
+
+    assert git_changes(str(repo_dir), base_dirs, first, first) == DocChanges([], [])
+
+
+def test_git_changes_detects_all_statuses(docs_repo):
+    repo_dir, base_dirs, first = docs_repo
+    service_dir = repo_dir / "intune" / "intune-service"
+    (service_dir / "enroll.md").write_text("# Enroll\n\nUpdated.\n")
+    (service_dir / "remove-me.md").unlink()
+    os.rename(service_dir / "old-name.md", service_dir / "new-name.md")
+    (repo_dir / "autopilot" / "new-page.md").write_text("# New\n")
+    (repo_dir / "README.md").write_text("# memdocs\n\nOutside base dirs.\n")
+    second = commit_all(repo_dir, "second")
+
+    changes = git_changes(str(repo_dir), base_dirs, first, second)
+
+    assert sorted(relative_path for _, relative_path in changes.changed) == [
+        "enroll.md",
+        "new-name.md",
+        "new-page.md",
+    ]
+    assert (
+        os.path.join(base_dirs[1], "new-page.md"),
+        "new-page.md",
+    ) in changes.changed
+    assert sorted(changes.removed) == ["old-name.md", "remove-me.md"]
+
+
+def test_git_changes_unknown_commit(docs_repo):
+    repo_dir, base_dirs, _ = docs_repo
+
+    assert git_changes(str(repo_dir), base_dirs, "0" * 40) is None
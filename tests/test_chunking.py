@@ -0,0 +1,109 @@
+from IntuneBuddy.chunking import (
+    CHUNK_SIZE,
+    heading_anchor,
+    parse_front_matter,
+    split_markdown,
+    split_sections,
+)
+
+DOC = """---
+title: Enroll macOS devices in Intune
+description: "How to enroll Macs."
+ms.date: 03/14/2025
+ms.topic: how-to
+---
+
+# Enroll macOS devices
+
+[!INCLUDE [banner](../includes/banner.md)]
+
+Intune supports several enrollment methods. <!-- TODO: add screenshots -->
+
+## Prerequisites
+
+- An Apple MDM push certificate.
+
+## Automated Device Enrollment (ADE)
+
+### Create an enrollment profile
+
+Go to **Devices** > **macOS**.
+
+```bash
+# Not a heading
+sudo profiles renew -type enrollment
+```
+"""
+
+
+def test_parse_front_matter():
+    front_matter, body = parse_front_matter(DOC)
+
+    assert front_matter["title"] == "Enroll macOS devices in Intune"
+    assert front_matter["description"] == "How to enroll Macs."
+    assert front_matter["ms.date"] == "03/14/2025"
+    assert body.lstrip().startswith("# Enroll macOS devices")
+
+
+def test_parse_front_matter_without_front_matter():
+    assert parse_front_matter("# Title\n\nText") == ({}, "# Title\n\nText")
+
+
+def test_heading_anchor():
+    assert heading_anchor("Automated Device Enrollment (ADE)") == (
+        "automated-device-enrollment-ade"
+    )
+    assert heading_anchor("Step 1 - Get the [Apple](https://apple.com) token") == (
+        "step-1---get-the-apple-token"
+    )
+    assert heading_anchor("Custom heading {#custom}") == "custom"
+
+
+def test_split_sections_ignores_headings_in_code():
+    sections = list(split_sections("## A\ntext\n```\n# comment\n```\n## B\nmore"))
+
+    assert [(path, anchor) for path, anchor, _ in sections] == [
+        ([], ""),
+        ([(2, "A")], "a"),
+        ([(2, "B")], "b"),
+    ]
+    assert "# comment" in sections[1][2]
+
+
+def test_split_markdown_records_sections():
+    chunks = split_markdown(DOC)
+
+    assert [chunk.metadata["heading"] for chunk in chunks] == [
+        "Enroll macOS devices",
+        "Enroll macOS devices > Prerequisites",
+        "Enroll macOS devices > Automated Device Enrollment (ADE) > Create an enrollment profile",
+    ]
+    assert chunks[2].metadata == {
+        "title": "Enroll macOS devices in Intune",
+        "ms_date": "03/14/2025",
+        "heading": "Enroll macOS devices > Automated Device Enrollment (ADE) > Create an enrollment profile",
+        "anchor": "create-an-enrollment-profile",
+    }
+    # The heading path leads every chunk, front matter and directives are gone
+    assert chunks[1].text == (
+        "Enroll macOS devices > Prerequisites\n\n- An Apple MDM push certificate."
+    )
+    text = "\n".join(chunk.text for chunk in chunks)
+    assert "ms.topic" not in text
+    assert "INCLUDE" not in text
+    assert "TODO" not in text
+    assert "# Not a heading" in text
+
+
+def test_split_markdown_splits_long_sections():
+    paragraph = "Intune manages devices. " * 20
+    chunks = split_markdown("## Long\n\n" + "\n\n".join([paragraph] * 10))
+
+    assert len(chunks) > 1
+    assert all(chunk.text.startswith("Long\n\n") for chunk in chunks)
+    assert all(len(chunk.text) <= CHUNK_SIZE + len("Long\n\n") for chunk in chunks)
+
+
+def test_split_markdown_title_falls_back_to_first_heading():
+    chunks = split_markdown("# Windows enrollment\n\nText")
+    assert chunks[0].metadata["title"] == "Windows enrollment"
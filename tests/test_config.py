@@ -1,4 +1,5 @@
 import json
+import string
 
 from unittest.mock import patch, mock_open
 from IntuneBuddy.config import (
@@ -13,6 +14,8 @@ from IntuneBuddy.config import (
     get_user_color,
     set_user_color,
     handle_question,
+    system_template,
+    question_template,
 )
 
 
@@ -217,3 +220,18 @@ def test_config_help():
             "config help", "🤖 Buddy:", "Zoey", "😊", "blue"
         )
         assert ("Zoey", "😊", "blue") == (name, emoji, color)
+
+
+def placeholders(template):
+    return {name for _, name, _, _ in string.Formatter().parse(template) if name}
+
+
+def test_system_template_is_static():
+    # Anything that changes per turn would break Ollama's prompt cache
+    assert placeholders(system_template()) == set()
+    assert placeholders(question_template()) == {
+        "history",
+        "Intune_docs",
+        "metadata_source",
+        "question",
+    }
@@ -0,0 +1,85 @@
+import pytest
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+from IntuneBuddy.context import ContextPacker, estimate_tokens, shingles
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+
+
+def doc(doc_id, text):
+    return Document(page_content=text, metadata={"source": doc_id}, id=doc_id)
+
+
+def fake_vector_store(embeddings):
+    vector_store = MagicMock()
+    vector_store.get.return_value = {
+        "ids": list(embeddings),
+        "embeddings": list(embeddings.values()),
+    }
+    return vector_store
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("12345") == 2
+
+
+def test_shingles():
+    assert shingles("a b c") == {("a", "b", "c")}
+    assert len(shingles(" ".join(WORDS))) == len(WORDS) - 4
+
+
+def test_score_combines_similarity_and_overlap():
+    documents = [
+        doc("far.md-0", "Unrelated text about printers."),
+        doc("near.md-0", "Enroll macOS devices with automated device enrollment."),
+        doc("lexical.md-0", "The enroll macos step."),
+    ]
+    vector_store = fake_vector_store(
+        {"far.md-0": [0.0, 1.0], "near.md-0": [1.0, 0.0], "lexical.md-0": [0.0, 1.0]}
+    )
+
+    scored = ContextPacker(vector_store).score(
+        "How to enroll macOS?", [1.0, 0.0], documents
+    )
+
+    assert [d.id for d, _ in scored] == ["near.md-0", "lexical.md-0", "far.md-0"]
+    # "how" is the one question term the chunk lacks
+    assert scored[0][1] == pytest.approx(0.7 + 0.3 * 2 / 3)
+
+
+def test_pack_drops_duplicates_and_respects_budget():
+    text = " ".join(WORDS * 5)
+    documents = [
+        doc("a.md-0", text),
+        doc("a.md-1", text[:-20]),
+        doc("b.md-0", "beta " * 30),
+        doc("c.md-0", "short note"),
+    ]
+    vector_store = fake_vector_store(
+        {
+            "a.md-0": [1.0, 0.0],
+            "a.md-1": [1.0, 0.1],
+            "b.md-0": [0.8, 0.6],
+            "c.md-0": [0.0, 1.0],
+        }
+    )
+    budget = estimate_tokens(text) + 10
+
+    packed = ContextPacker(vector_store, token_budget=budget).pack(
+        "alpha", [1.0, 0.0], documents
+    )
+
+    assert [d.id for d, _ in packed] == ["a.md-0", "c.md-0"]
+
+
+def test_pack_truncates_a_single_oversized_chunk():
+    documents = [doc("a.md-0", "x" * 1000)]
+    packer = ContextPacker(fake_vector_store({"a.md-0": [1.0]}), token_budget=10)
+
+    ((packed, _),) = packer.pack("x", [1.0], documents)
+
+    assert packed.page_content == "x" * 40
+    assert documents[0].page_content == "x" * 1000
@@ -0,0 +1,194 @@
+import os
+import signal
+import asyncio
+import pytest
+
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+
+from IntuneBuddy.engine import ChatEngine, Turn, cancel_on_interrupt
+from IntuneBuddy.history import ConversationHistory
+from IntuneBuddy.scope import Scope
+
+FALLBACK = "Fallback response"
+
+
+class FakeChain:
+    def __init__(self, chunks, answers=()):
+        self.chunks = chunks
+        self.answers = list(answers)
+        self.inputs = []
+
+    async def astream(self, inputs):
+        self.inputs.append(inputs)
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def ainvoke(self, inputs):
+        self.inputs.append(inputs)
+        return self.answers.pop(0)
+
+
+def make_engine(chain, answer_cache=None, cached=None):
+    retriever = MagicMock()
+    retriever.embed_query.return_value = [1.0, 0.0]
+    retriever.invoke.return_value = [
+        Document(page_content="ADE docs", metadata={"source": "enroll/ade.md"})
+    ]
+    if answer_cache is not None:
+        answer_cache.lookup.return_value = cached
+    return ChatEngine(
+        chain,
+        retriever,
+        ConversationHistory(),
+        answer_cache,
+        model="gemma3:12b",
+        fallback_response=FALLBACK,
+    )
+
+
+def test_prepare_retrieves_documents():
+    engine = make_engine(FakeChain([]))
+
+    turn = asyncio.run(engine.prepare("How do I enroll?"))
+
+    assert [doc.metadata["source"] for doc in turn.docs] == ["enroll/ade.md"]
+    # Without an answer cache the question is embedded by the retriever
+    engine.retriever.invoke.assert_called_once_with("How do I enroll?", None, None)
+
+
+def test_prepare_returns_cached_answer():
+    answer_cache = MagicMock()
+    engine = make_engine(FakeChain([]), answer_cache, ("How to enroll?", "Use ADE."))
+
+    turn = asyncio.run(engine.prepare("How do I enroll?"))
+
+    assert turn.cached == ("How to enroll?", "Use ADE.")
+    engine.retriever.invoke.assert_not_called()
+
+
+def test_prepare_looks_up_cache_within_scope():
+    answer_cache = MagicMock()
+    engine = make_engine(FakeChain([]), answer_cache)
+
+    turn = asyncio.run(engine.prepare("Enroll a MacBook with ADE"))
+
+    # The platform the question names is part of the cache key
+    answer_cache.lookup.assert_called_once_with(
+        "gemma3:12b", [1.0, 0.0], Scope(platform="macos")
+    )
+    assert turn.scope == Scope(platform="macos")
+
+    answer_cache.lookup.reset_mock()
+    engine.scope = Scope(area="apps")
+    turn = asyncio.run(engine.prepare("Enroll a MacBook with ADE"))
+
+    answer_cache.lookup.assert_called_once_with(
+        "gemma3:12b", [1.0, 0.0], Scope(area="apps")
+    )
+    engine.retriever.invoke.assert_called_with(
+        "Enroll a MacBook with ADE", [1.0, 0.0], Scope(area="apps")
+    )
+
+
+def test_prepare_skips_cache_for_follow_ups():
+    answer_cache = MagicMock()
+    engine = make_engine(FakeChain([]), answer_cache, ("q", "a"))
+    engine.history.add("How do I enroll?", "Use ADE.")
+
+    turn = asyncio.run(engine.prepare("And on iOS?"))
+
+    assert turn.cached is None
+    answer_cache.lookup.assert_not_called()
+
+
+def test_answer_streams_visible_text():
+    chain = FakeChain(["<think>hmm</think>", "Use ", "ADE."])
+    engine = make_engine(chain)
+    seen = []
+
+    result, generations, first_token = asyncio.run(
+        engine.answer(Turn("How do I enroll?", []), seen.append)
+    )
+
+    assert (result, generations) == ("Use ADE.", 1)
+    assert seen[-1] == "Use ADE."
+    assert first_token >= 0
+
+
+def test_answer_retries_fallback():
+    chain = FakeChain([FALLBACK], answers=["Use ADE."])
+    engine = make_engine(chain)
+    seen = []
+
+    result, generations, _ = asyncio.run(
+        engine.answer(Turn("How do I enroll?", []), seen.append)
+    )
+
+    assert (result, generations) == ("Use ADE.", 2)
+    assert seen[-1] == "Use ADE."
+
+
+def test_answer_without_streaming():
+    engine = make_engine(FakeChain([], answers=["Use ADE."]))
+
+    result, generations, first_token = asyncio.run(
+        engine.answer(Turn("How do I enroll?", []))
+    )
+
+    assert (result, generations, first_token) == ("Use ADE.", 1, None)
+
+
+def test_record_stores_answer_in_background():
+    answer_cache = MagicMock()
+    engine = make_engine(FakeChain([]), answer_cache)
+
+    async def run():
+        turn = await engine.prepare("How do I enroll?")
+        engine.record(turn, "Use ADE.")
+        await engine.close()
+
+    asyncio.run(run())
+
+    assert engine.history.last_answer() == "Use ADE."
+    answer_cache.store.assert_called_once_with(
+        "gemma3:12b",
+        "How do I enroll?",
+        [1.0, 0.0],
+        "Use ADE.",
+        ["enroll/ade.md"],
+        Scope(),
+    )
+
+
+def test_record_skips_fallback_and_cached_answers():
+    answer_cache = MagicMock()
+    engine = make_engine(FakeChain([]), answer_cache)
+
+    async def run():
+        engine.record(Turn("q1", [], [1.0]), FALLBACK)
+        engine.record(Turn("q2", [], [1.0], ("q", "a")), "a")
+        await engine.close()
+
+    asyncio.run(run())
+
+    answer_cache.store.assert_not_called()
+    assert len(engine.history) == 2
+
+
+def test_cancel_on_interrupt_cancels_only_the_task():
+    async def generate():
+        await asyncio.sleep(10)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, os.kill, os.getpid(), signal.SIGINT)
+        with pytest.raises(asyncio.CancelledError):
+            await cancel_on_interrupt(generate())
+        # The session keeps running after the cancelled answer
+        return await cancel_on_interrupt(asyncio.sleep(0, "next"))
+
+    previous = signal.getsignal(signal.SIGINT)
+    assert asyncio.run(run()) == "next"
+    assert signal.getsignal(signal.SIGINT) is previous
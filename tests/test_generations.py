@@ -0,0 +1,185 @@
+import os
+import pytest
+
+from unittest.mock import MagicMock, patch
+from IntuneBuddy.generations import (
+    GenerationConflict,
+    GenerationLocked,
+    GenerationStore,
+)
+from IntuneBuddy.vector import release_generation
+
+
+def build(store, copy_from=None, files=("file_index.json",)):
+    generation = store.create(copy_from)
+    os.makedirs(generation.db_location, exist_ok=True)
+    for name in files:
+        with open(os.path.join(generation.directory, name), "w") as f:
+            f.write(generation.name)
+    return generation
+
+
+def test_no_index(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    assert store.current() is None
+    assert store.collect_garbage() == []
+
+
+def test_build_is_not_visible_until_activated(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    first = build(store)
+    store.activate(first)
+
+    second = build(store, copy_from=first)
+    assert store.current() == first
+
+    store.activate(second)
+    assert store.current() == second
+    assert second.number == first.number + 1
+
+
+def test_create_copies_generation(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    first = build(store, files=("file_index.json", "lexical_index.db-wal"))
+    with open(os.path.join(first.db_location, "chroma.sqlite3"), "w") as f:
+        f.write("chunks")
+    store.activate(first)
+
+    second = store.create(copy_from=first)
+
+    with open(os.path.join(second.db_location, "chroma.sqlite3")) as f:
+        assert f.read() == "chunks"
+    with open(second.index_file) as f:
+        assert f.read() == first.name
+    assert os.path.exists(os.path.join(second.directory, "lexical_index.db-wal"))
+
+
+def test_activate_requires_vector_store(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    with pytest.raises(ValueError):
+        store.activate(store.create())
+
+
+def test_garbage_collection_keeps_previous_generation(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    generations = []
+    for _ in range(4):
+        generations.append(build(store, copy_from=store.current()))
+        store.activate(generations[-1])
+
+    assert store.generations() == generations[-2:]
+
+
+def test_garbage_collection_removes_abandoned_builds(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    current = build(store)
+    store.activate(current)
+    abandoned = build(store, copy_from=current)
+
+    assert store.collect_garbage() == [abandoned]
+    assert not os.path.exists(abandoned.directory)
+    assert store.current() == current
+
+
+def test_discard(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    generation = store.create()
+    store.discard(generation)
+    assert store.generations() == []
+
+
+def test_migrates_legacy_layout(tmp_path):
+    (tmp_path / "chroma_db").mkdir()
+    (tmp_path / "file_index.json").write_text("{}")
+    (tmp_path / "lexical_index.db").write_text("bm25")
+    (tmp_path / "answer_cache.db").write_text("answers")
+    store = GenerationStore(str(tmp_path / "index"), legacy_dir=str(tmp_path))
+
+    generation = store.current()
+
+    assert generation.name == "gen-000001"
+    assert generation.exists()
+    assert os.path.exists(generation.index_file)
+    assert os.path.exists(generation.lexical_index_file)
+    assert not (tmp_path / "chroma_db").exists()
+    # Caches shared by every generation stay where they are
+    assert (tmp_path / "answer_cache.db").exists()
+
+
+def test_build_lock_excludes_a_second_build(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    # A second store on the same root stands in for another process
+    other = GenerationStore(str(tmp_path / "index"))
+
+    with store.build_lock():
+        with pytest.raises(GenerationLocked):
+            with other.build_lock():
+                pass
+        with pytest.raises(GenerationLocked):
+            with store.build_lock():
+                pass
+
+    with other.build_lock():
+        pass
+
+
+def test_overlapping_builds(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    other = GenerationStore(str(tmp_path / "index"))
+    first = build(store)
+    store.activate(first)
+    second = build(store, copy_from=first)
+
+    with other.build_lock():
+        third = build(other, copy_from=first)
+        # The build of the other process is still being written
+        store.activate(second)
+        assert os.path.exists(third.directory)
+
+        # Built on a generation that is no longer current
+        with pytest.raises(GenerationConflict):
+            other.activate(third)
+        assert store.current() == second
+
+    assert store.collect_garbage() == [third]
+    assert store.current() == second
+
+
+def test_discard_releases_generation(tmp_path):
+    release = MagicMock()
+    store = GenerationStore(str(tmp_path / "index"), release=release)
+    generation = store.create()
+
+    assert store.discard(generation)
+    release.assert_called_once_with(generation)
+
+
+def test_release_generation_stops_its_chroma_system(tmp_path):
+    generation = GenerationStore(str(tmp_path / "index")).create()
+    system = MagicMock()
+    systems = {generation.db_location: system, "other": MagicMock()}
+
+    with patch(
+        "chromadb.api.shared_system_client.SharedSystemClient._identifier_to_system",
+        systems,
+    ):
+        release_generation(generation)
+
+    system.stop.assert_called_once()
+    assert list(systems) == ["other"]
+
+
+def test_release_generation_survives_chroma_internals_changing(tmp_path):
+    generation = GenerationStore(str(tmp_path / "index")).create()
+
+    with patch("chromadb.api.shared_system_client.SharedSystemClient", spec=[]):
+        release_generation(generation)
+
+
+def test_discard_keeps_generation_in_use(tmp_path):
+    store = GenerationStore(str(tmp_path / "index"))
+    generation = store.create()
+
+    with patch("shutil.rmtree", side_effect=PermissionError("in use")):
+        assert not store.discard(generation)
+    assert store.generations() == [generation]
@@ -0,0 +1,117 @@
+import json
+import threading
+
+from IntuneBuddy.history import SUMMARY_TOKEN_BUDGET, ConversationHistory
+from IntuneBuddy.context import CHARS_PER_TOKEN
+
+
+def test_add_keeps_recent_turns_verbatim():
+    history = ConversationHistory(keep_turns=2)
+    for i in range(3):
+        history.add(f"q{i}", f"a{i}")
+
+    assert history.turns == [("q1", "a1"), ("q2", "a2")]
+    # Without a summarizer the older turns stay in the prompt
+    assert history.pending == [("q0", "a0")]
+    assert history.last_answer() == "a2"
+    assert len(history) == 3
+
+
+def test_add_respects_token_budget():
+    history = ConversationHistory(keep_turns=10, token_budget=20)
+    history.add("first", "x" * 60)
+    history.add("second", "short")
+
+    assert history.turns == [("second", "short")]
+    assert history.pending == [("first", "x" * 60)]
+
+
+def test_summarizer_folds_old_turns_into_summary():
+    calls = []
+
+    def summarizer(summary, turns):
+        calls.append((summary, turns))
+        return "Talked about enrollment."
+
+    history = ConversationHistory(summarizer=summarizer, keep_turns=1)
+    history.add("How do I enroll?", "Use ADE.")
+    history.add("And iOS?", "Use ADE as well.")
+    history.wait()
+
+    assert calls == [("", "User: How do I enroll?\nBuddy: Use ADE.")]
+    assert history.summary == "Talked about enrollment."
+    assert history.pending == []
+    assert history.render() == (
+        "Summary of the earlier conversation: Talked about enrollment.\n\n"
+        "User: And iOS?\nBuddy: Use ADE as well."
+    )
+
+
+def test_turns_stay_in_prompt_while_summarizing():
+    release = threading.Event()
+
+    def summarizer(summary, turns):
+        release.wait(5)
+        return "summary"
+
+    history = ConversationHistory(summarizer=summarizer, keep_turns=1)
+    history.add("q0", "a0")
+    history.add("q1", "a1")
+
+    assert "User: q0" in history.render()
+    release.set()
+    history.wait()
+    assert "User: q0" not in history.render()
+
+
+def test_failed_summary_keeps_questions():
+    def summarizer(summary, turns):
+        raise RuntimeError("model not loaded")
+
+    history = ConversationHistory(summarizer=summarizer, keep_turns=1)
+    history.add("What is Autopilot?", "A deployment service.")
+    history.add("q1", "a1")
+    history.wait()
+
+    assert history.summary == "The user asked: What is Autopilot?"
+    assert history.pending == []
+
+
+def test_summary_is_truncated():
+    history = ConversationHistory(
+        summarizer=lambda summary, turns: "x" * 10_000, keep_turns=1
+    )
+    history.add("q0", "a0")
+    history.add("q1", "a1")
+    history.wait()
+
+    assert len(history.summary) == SUMMARY_TOKEN_BUDGET * CHARS_PER_TOKEN
+
+
+def test_session_is_saved_and_resumed(tmp_path):
+    path = tmp_path / "sessions" / "work.json"
+    history = ConversationHistory(str(path), keep_turns=1)
+    history.add("q0", "a0")
+    history.add("q1", "a1")
+    history.close()
+
+    data = json.loads(path.read_text())
+    assert data["turns"] == [["q1", "a1"]]
+    assert data["pending"] == [["q0", "a0"]]
+
+    # Turns saved before they were summarized are summarized on resume
+    resumed = ConversationHistory(
+        str(path), summarizer=lambda summary, turns: "resumed", keep_turns=1
+    )
+    resumed.wait()
+    assert resumed.summary == "resumed"
+    assert resumed.turns == [("q1", "a1")]
+    assert resumed.last_answer() == "a1"
+
+
+def test_empty_history_renders_nothing():
+    history = ConversationHistory()
+
+    assert history.is_empty()
+    assert history.render() == ""
+    assert history.last_answer() is None
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from IntuneBuddy.ingest import (
+    FileDone,
+    bounded_map,
+    hash_file,
+    normalize_path,
+    process_file,
+    stream_documents,
+)
+
+
+def write_docs(tmp_path):
+    base_dir = tmp_path / "intune-service"
+    (base_dir / "fundamentals").mkdir(parents=True)
+    (base_dir / "fundamentals" / "what-is-intune.md").write_text(
+        "# What is Intune\n\nIntune is a cloud-based endpoint management solution."
+    )
+    (base_dir / "enroll.md").write_text("# Enroll\n\nEnroll devices.")
+    (base_dir / "image.png").write_bytes(b"\x89PNG")
+    return base_dir
+
+
+def test_normalize_path():
+    assert normalize_path("a\\b\\c.md") == "a/b/c.md"
+
+
+def test_process_file_unchanged_skips_split(tmp_path):
+    base_dir = write_docs(tmp_path)
+    file_path = str(base_dir / "enroll.md")
+    known_hash = hash_file(file_path)
+
+    relative_path, file_hash, chunks = process_file(
+        (file_path, "enroll.md", known_hash)
+    )
+
+    assert (relative_path, file_hash, chunks) == ("enroll.md", known_hash, None)
+
+
+def test_process_file_normalizes_line_endings(tmp_path):
+    (tmp_path / "crlf.md").write_bytes(b"line one\r\nline two")
+    (tmp_path / "lf.md").write_bytes(b"line one\nline two")
+
+    _, crlf_hash, crlf_chunks = process_file(
+        (str(tmp_path / "crlf.md"), "crlf.md", None)
+    )
+    _, lf_hash, lf_chunks = process_file((str(tmp_path / "lf.md"), "lf.md", None))
+
+    assert crlf_hash == lf_hash == hash_file(str(tmp_path / "lf.md"))
+    assert crlf_chunks == lf_chunks
+    assert [chunk.text for chunk in lf_chunks] == ["line one\nline two"]
+
+
+def test_bounded_map_keeps_order():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(bounded_map(executor, lambda x: x * 2, range(10), 3))
+    assert results == [x * 2 for x in range(10)]
+
+
+def test_stream_documents_emits_chunks_then_marker(tmp_path):
+    base_dir = write_docs(tmp_path)
+
+    items = list(stream_documents([str(base_dir)], {}, max_workers=2))
+
+    markers = [item for item in items if isinstance(item, FileDone)]
+    documents = [item for item in items if not isinstance(item, FileDone)]
+    assert sorted(marker.relative_path for marker in markers) == [
+        "enroll.md",
+        "fundamentals/what-is-intune.md",
+    ]
+    assert {doc.id for doc in documents} == {
+        "enroll.md-0",
+        "fundamentals/what-is-intune.md-0",
+    }
+    # Every marker follows the chunks of its file
+    for index, item in enumerate(items):
+        if isinstance(item, FileDone):
+            assert items[index - 1].metadata["source"] == item.relative_path
+
+
+def test_stream_documents_skips_unchanged(tmp_path):
+    base_dir = write_docs(tmp_path)
+    file_index = {"enroll.md": hash_file(str(base_dir / "enroll.md"))}
+
+    items = list(stream_documents([str(base_dir)], file_index, max_workers=1))
+
+    assert FileDone("enroll.md", file_index["enroll.md"]) not in items
+    assert all(
+        item.relative_path != "enroll.md"
+        for item in items
+        if isinstance(item, FileDone)
+    )
+    assert len(items) == 2
+
+
+def test_stream_documents_only_checks_given_files(tmp_path):
+    base_dir = write_docs(tmp_path)
+    files = [(str(base_dir / "enroll.md"), "enroll.md")]
+
+    items = list(stream_documents([str(base_dir)], {}, max_workers=1, files=files))
+
+    assert [item.id for item in items[:-1]] == ["enroll.md-0"]
+    assert items[-1].relative_path == "enroll.md"
+
+
+def test_stream_documents_records_section_metadata(tmp_path):
+    base_dir = write_docs(tmp_path)
+    files = [
+        (
+            str(base_dir / "fundamentals" / "what-is-intune.md"),
+            "fundamentals/what-is-intune.md",
+        )
+    ]
+
+    document = next(stream_documents([str(base_dir)], {}, max_workers=1, files=files))
+
+    assert document.metadata == {
+        "source": "fundamentals/what-is-intune.md",
+        "type": "intune",
+        "platform": "",
+        "area": "fundamentals",
+        "tree": "intune-service",
+        "title": "What is Intune",
+        "ms_date": "",
+        "heading": "What is Intune",
+        "anchor": "what-is-intune",
+    }
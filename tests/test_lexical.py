@@ -0,0 +1,134 @@
+import pytest
+from unittest.mock import MagicMock
+
+from langchain_core.documents import Document
+
+from IntuneBuddy.ingest import FileDone
+from IntuneBuddy.lexical import LexicalIndex, index_stream, tokenize
+from IntuneBuddy.scope import Scope
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical_index.db"))
+    yield index
+    index.close()
+
+
+def doc(doc_id, text):
+    return Document(page_content=text, metadata={"source": doc_id}, id=doc_id)
+
+
+CORPUS = [
+    doc(
+        "camera.md-0",
+        "Use ./Device/Vendor/MSFT/Policy/Config/Camera/AllowCamera to block the camera.",
+    ),
+    doc(
+        "errors.md-0",
+        "Enrollment fails with error 0x80180014 when the device is blocked.",
+    ),
+    doc("macos.md-0", "Enroll a Mac with automated device enrollment."),
+    doc("ios.md-0", "Enroll an iPhone with automated device enrollment."),
+    doc("windows.md-0", "Windows Autopilot registers the device."),
+    doc("android.md-0", "Android Enterprise work profile."),
+]
+
+
+def test_tokenize_keeps_compound_tokens():
+    terms = tokenize("Error 0x80180014 in ./Device/Vendor/MSFT/Policy")
+
+    assert "0x80180014" in terms
+    assert "device/vendor/msft/policy" in terms
+    assert {"device", "vendor", "msft", "policy"} <= set(terms)
+
+
+def test_search_finds_exact_tokens(index):
+    index.add(CORPUS)
+
+    assert index.search("0x80180014", 3)[0][0] == "errors.md-0"
+    assert (
+        index.search("./Device/Vendor/MSFT/Policy/Config/Camera/AllowCamera", 3)[0][0]
+        == "camera.md-0"
+    )
+    assert index.search("nothing matches", 3) == []
+
+
+def test_add_replaces_and_delete_removes(index):
+    index.add(CORPUS)
+    index.add([doc("errors.md-0", "Now about something else entirely.")])
+    assert index.search("0x80180014", 3) == []
+
+    index.delete(["camera.md-0"])
+    assert index.count() == len(CORPUS) - 1
+    assert index.search("allowcamera", 3) == []
+
+
+def test_rebuild_from_vector_store(index):
+    vector_store = MagicMock()
+    vector_store.get.side_effect = [
+        {
+            "ids": ["errors.md-0"],
+            "documents": ["error 0x80180014"],
+            "metadatas": [{"platform": "windows"}],
+        },
+        {"ids": ["camera.md-0"], "documents": ["AllowCamera"], "metadatas": [None]},
+        {"ids": [], "documents": [], "metadatas": []},
+    ]
+
+    index.rebuild(vector_store, page_size=1)
+
+    assert index.count() == 2
+    assert index.search("0x80180014", 3, Scope(platform="macos")) == []
+    assert vector_store.get.call_args.kwargs["offset"] == 2
+
+
+def test_index_stream_indexes_each_file(index):
+    items = [
+        CORPUS[1],
+        FileDone("errors.md", "hash"),
+        CORPUS[0],
+        FileDone("camera.md", "hash"),
+    ]
+
+    assert list(index_stream(index, items)) == items
+    assert index.count() == 2
+
+
+def test_search_within_scope(index):
+    index.add(
+        [
+            Document(
+                page_content="Enroll with automated device enrollment.",
+                metadata={"platform": platform, "area": "enrollment"},
+                id=f"{platform or 'all'}.md-0",
+            )
+            for platform in ["macos", "ios", ""]
+        ]
+        # Keep "enroll" below the document frequency cut-off
+        + [doc(f"filler-{i}.md-0", f"Unrelated text {i}.") for i in range(30)]
+    )
+
+    found = {chunk_id for chunk_id, _ in index.search("enroll", 5, Scope("macos"))}
+    # Chunks for every platform are kept
+    assert found == {"macos.md-0", "all.md-0"}
+    assert index.search("enroll", 5, Scope(area="apps")) == []
+    assert len(index.search("enroll", 5, Scope())) == 3
+
+
+def test_facet_columns_added_to_existing_index(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE chunks (doc INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+        "length INTEGER NOT NULL, terms BLOB NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+
+    index = LexicalIndex(path)
+    index.add(CORPUS)
+    assert index.search("0x80180014", 3, Scope(platform="ios"))[0][0] == "errors.md-0"
+    index.close()
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import patch
+
+from IntuneBuddy.config import NUM_CTX
+from IntuneBuddy.models import ModelResidency, duration_seconds
+
+
+def test_keep_alive_per_policy():
+    assert ModelResidency("chat", "embed", "keep", "1h").keep_alive == "1h"
+    assert ModelResidency("chat", "embed", "unload", "1h").keep_alive == "1h"
+    # None lets the Ollama server decide
+    assert ModelResidency("chat", "embed", "server", "1h").keep_alive is None
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ModelResidency("chat", "embed", "forever")
+
+
+@pytest.mark.parametrize("policy", ["keep", "server"])
+def test_release_leaves_models_loaded(policy):
+    with patch("IntuneBuddy.models.stop_models") as mock_stop:
+        assert ModelResidency("chat", "embed", policy).release() == []
+    mock_stop.assert_not_called()
+
+
+def test_release_unloads_models():
+    with patch("IntuneBuddy.models.stop_models", return_value=[]) as mock_stop:
+        ModelResidency("chat", "embed", "unload").release()
+    mock_stop.assert_called_once_with("chat", "embed")
+
+
+def test_warm_up_loads_chat_model_with_chat_options():
+    with patch("IntuneBuddy.models.Client") as mock_client:
+        ModelResidency("chat", "embed", "keep", "30m").warm_up().join()
+
+    kwargs = mock_client.return_value.chat.call_args.kwargs
+    assert kwargs["model"] == "chat"
+    assert kwargs["messages"][0]["role"] == "system"
+    assert kwargs["options"]["num_ctx"] == NUM_CTX
+    assert kwargs["keep_alive"] == "30m"
+
+
+def test_warm_up_failure_is_not_fatal():
+    residency = ModelResidency("chat", "embed")
+    with patch("IntuneBuddy.models.Client") as mock_client:
+        mock_client.return_value.chat.side_effect = ConnectionError("no server")
+        residency.warm_up().join()
+
+    assert isinstance(residency.error, ConnectionError)
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        ("30m", 1800),
+        ("1h30m", 5400),
+        ("45s", 45),
+        ("1.5h", 5400),
+        (-1, -1),
+        (None, None),
+    ],
+)
+def test_duration_seconds(value, seconds):
+    assert duration_seconds(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["soon", "30", "5m later", ""])
+def test_duration_seconds_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        duration_seconds(value)
+
+
+def test_embedding_keep_alive_in_seconds():
+    assert ModelResidency("chat", "embed", "keep", "2h").embedding_keep_alive == 7200
+    assert ModelResidency("chat", "embed", "server", "2h").embedding_keep_alive is None
@@ -0,0 +1,191 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+
+from IntuneBuddy.readonly import (
+    ReadOnlyVectorStore,
+    export_exists,
+    export_index,
+    export_quantization,
+    popcount,
+    quantize_binary,
+    quantize_int8,
+)
+from IntuneBuddy.scope import Scope
+
+
+def fake_collection(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"doc{i}.md-0" for i in range(count)]
+    vector_store = MagicMock()
+
+    def get(include, limit, offset):
+        return {
+            "ids": ids[offset : offset + limit],
+            "documents": [
+                f"text {i}" for i in range(offset, min(count, offset + limit))
+            ],
+            "metadatas": [
+                {"source": f"doc{i}.md"}
+                for i in range(offset, min(count, offset + limit))
+            ],
+            "embeddings": vectors[offset : offset + limit],
+        }
+
+    vector_store.get.side_effect = get
+    return vector_store, vectors
+
+
+@pytest.mark.parametrize("count", [50, 0])
+def test_export_round_trip(tmp_path, count):
+    vector_store, vectors = fake_collection(count)
+    directory = str(tmp_path / "readonly_index")
+
+    assert export_index(vector_store, directory, page_size=16) == count
+    assert export_exists(directory)
+
+    store = ReadOnlyVectorStore(directory, embeddings=MagicMock())
+    if count:
+        query = vectors[7]
+        (doc, distance), *_ = store.similarity_search_by_vector_with_relevance_scores(
+            query, k=3
+        )
+        assert doc.id == "doc7.md-0"
+        assert doc.metadata == {"source": "doc7.md"}
+        assert distance == pytest.approx(0.0, abs=1e-5)
+        assert store.get(ids=["doc3.md-0", "missing"])["documents"] == ["text 3"]
+        embeddings = store.get(ids=["doc3.md-0"], include=["embeddings"])["embeddings"]
+        assert embeddings[0] == pytest.approx(vectors[3])
+    else:
+        assert store.similarity_search_by_vector_with_relevance_scores([0.0] * 8) == []
+    store.close()
+
+
+def test_ivf_matches_exact_search(tmp_path):
+    vector_store, vectors = fake_collection(600, dim=16)
+    directory = str(tmp_path / "readonly_index")
+    with patch("IntuneBuddy.readonly.IVF_MIN_VECTORS", 100):
+        export_index(vector_store, directory, page_size=1000)
+    store = ReadOnlyVectorStore(directory, embeddings=MagicMock(), nprobe=24)
+    assert len(store.centroids) == 24
+
+    query = vectors[0] + 0.1 * vectors[1]
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    expected = [f"doc{i}.md-0" for i in np.argsort(distances)[:5]]
+    hits = store.similarity_search_by_vector_with_relevance_scores(query, k=5)
+
+    assert [doc.id for doc, _ in hits] == expected
+    assert [d for _, d in hits] == pytest.approx(sorted(distances)[:5], rel=1e-4)
+    store.close()
+
+
+def test_export_replaces_previous_export(tmp_path):
+    directory = str(tmp_path / "readonly_index")
+    export_index(fake_collection(10)[0], directory)
+    export_index(fake_collection(20)[0], directory)
+
+    store = ReadOnlyVectorStore(directory, embeddings=MagicMock())
+    assert store.meta["count"] == 20
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["readonly_index"]
+    store.close()
+
+
+def test_quantize_int8_round_trip():
+    vectors = fake_collection(20)[1]
+    codes, scale = quantize_int8(vectors)
+
+    assert codes.dtype == np.int8
+    assert np.abs(codes.astype(np.float32) * scale - vectors).max() <= scale.max() / 2
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_export(tmp_path, quantization):
+    vector_store, vectors = fake_collection(300, dim=64)
+    directory = tmp_path / "readonly_index"
+    export_index(vector_store, str(directory), quantization=quantization)
+
+    assert export_quantization(str(directory)) == quantization
+    # Binary codes are re-ranked against float16 vectors instead of float32
+    assert not (directory / "vectors.npy").exists()
+    assert (directory / "float16.npy").exists() == (quantization == "binary")
+    assert (directory / "int8.npy").exists() == (quantization == "int8")
+    store = ReadOnlyVectorStore(str(directory), embeddings=MagicMock())
+    for i in range(10):
+        (doc, distance), *_ = store.similarity_search_by_vector_with_relevance_scores(
+            vectors[i], k=8
+        )
+        assert doc.id == f"doc{i}.md-0"
+        assert distance == pytest.approx(0.0, abs=0.05)
+    store.close()
+
+
+def test_binary_codes_count_hamming_distances():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 100)).astype(np.float32)
+
+    codes = quantize_binary(vectors)
+    distances = popcount(np.bitwise_xor(codes, codes[0])).sum(axis=1)
+
+    assert codes.dtype == np.uint64 and codes.shape == (20, 2)
+    assert list(distances) == [
+        int(np.sum((vector > 0) != (vectors[0] > 0))) for vector in vectors
+    ]
+
+
+def test_binary_export_reranks_with_float_distances(tmp_path):
+    vector_store, vectors = fake_collection(300, dim=64)
+    export_index(vector_store, str(tmp_path / "float"))
+    export_index(vector_store, str(tmp_path / "binary"), quantization="binary")
+    query = vectors[3] + 0.01
+
+    exact = ReadOnlyVectorStore(str(tmp_path / "float"), embeddings=MagicMock())
+    binary = ReadOnlyVectorStore(str(tmp_path / "binary"), embeddings=MagicMock())
+    expected = exact.similarity_search_by_vector_with_relevance_scores(query, k=4)
+    hits = binary.similarity_search_by_vector_with_relevance_scores(query, k=4)
+
+    assert hits[0][0].id == expected[0][0].id
+    assert hits[0][1] == pytest.approx(expected[0][1], abs=1e-3)
+    exact.close()
+    binary.close()
+
+
+def test_unknown_quantization(tmp_path):
+    with pytest.raises(ValueError):
+        export_index(fake_collection(5)[0], str(tmp_path / "x"), quantization="int4")
+
+
+def test_search_with_filter(tmp_path):
+    vector_store, vectors = fake_collection(50)
+    platforms = ["macos", "ios", ""]
+    get = vector_store.get.side_effect
+
+    def get_with_platforms(include, limit, offset):
+        data = get(include, limit, offset)
+        for i, metadata in enumerate(data["metadatas"], offset):
+            metadata["platform"] = platforms[i % 3]
+        return data
+
+    vector_store.get.side_effect = get_with_platforms
+    directory = str(tmp_path / "readonly_index")
+    export_index(vector_store, directory)
+    store = ReadOnlyVectorStore(directory, embeddings=MagicMock())
+
+    hits = store.similarity_search_by_vector_with_relevance_scores(
+        vectors[1], k=50, filter=Scope("macos").where()
+    )
+
+    assert len(hits) == 33
+    assert {doc.metadata["platform"] for doc, _ in hits} == {"macos", ""}
+    # The nearest ios chunk is filtered out
+    assert "doc1.md-0" not in {doc.id for doc, _ in hits}
+    assert (
+        store.similarity_search_by_vector_with_relevance_scores(
+            vectors[1],
+            k=5,
+            filter=Scope("ios", "apps").where(),
+        )
+        == []
+    )
+    store.close()
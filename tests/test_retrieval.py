@@ -0,0 +1,123 @@
+from unittest.mock import MagicMock
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from IntuneBuddy.readonly import ReadOnlyVectorStore, export_index
+from IntuneBuddy.retrieval import (
+    HybridRetriever,
+    reciprocal_rank_fusion,
+    search_in_scope,
+)
+from IntuneBuddy.scope import Scope
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=1)
+
+    assert [item_id for item_id, _ in fused] == ["a", "c", "b"]
+
+
+def fake_vector_store(hits):
+    vector_store = MagicMock()
+    vector_store._select_relevance_score_fn.return_value = lambda distance: 1 - distance
+    vector_store.similarity_search_by_vector_with_relevance_scores.return_value = hits
+    vector_store.get.return_value = {
+        "ids": ["errors.md-0"],
+        "documents": ["error 0x80180014"],
+        "metadatas": [{"source": "errors.md"}],
+    }
+    return vector_store
+
+
+def test_vector_only_applies_threshold():
+    vector_store = fake_vector_store(
+        [
+            (Document(page_content="a", id="a.md-0"), 0.1),
+            (Document(page_content="b", id="b.md-0"), 0.9),
+        ]
+    )
+
+    docs = HybridRetriever(vector_store, k=8).invoke("question", [1.0])
+
+    assert [d.id for d in docs] == ["a.md-0"]
+    vector_store.embeddings.embed_query.assert_not_called()
+
+
+def test_hybrid_adds_lexical_hits_below_threshold():
+    vector_store = fake_vector_store([(Document(page_content="a", id="a.md-0"), 0.2)])
+    lexical_index = MagicMock()
+    lexical_index.search.return_value = [
+        ("errors.md-0", 7.5),
+        ("a.md-0", 1.0),
+        ("deleted.md-0", 0.5),
+    ]
+
+    hits = HybridRetriever(vector_store, lexical_index).search("0x80180014", [1.0])
+
+    assert [doc.id for doc, _ in hits] == ["a.md-0", "errors.md-0"]
+    assert hits[1][0].metadata == {"source": "errors.md"}
+    vector_store.get.assert_called_once_with(
+        ids=["errors.md-0", "deleted.md-0"], include=["documents", "metadatas"]
+    )
+
+
+def test_scope_filters_both_searches():
+    vector_store = fake_vector_store([])
+    lexical_index = MagicMock()
+    lexical_index.search.return_value = []
+    scope = Scope(platform="macos", area="enrollment")
+
+    HybridRetriever(vector_store, lexical_index).search("enroll", [1.0], scope)
+
+    kwargs = vector_store.similarity_search_by_vector_with_relevance_scores.call_args
+    assert kwargs.kwargs["filter"] == {
+        "$and": [
+            {"platform": {"$nin": ["windows", "ios", "android", "linux"]}},
+            {"area": "enrollment"},
+        ]
+    }
+    lexical_index.search.assert_called_once_with("enroll", 20, scope)
+
+
+def test_scope_keeps_chunks_without_facets(tmp_path):
+    # Chunks of a downloaded index have no facet keys until a sync
+    documents = [
+        Document(page_content="Legacy", metadata={"source": "legacy.md"}, id="legacy"),
+        Document(page_content="iOS", metadata={"platform": "ios"}, id="ios"),
+        Document(page_content="All", metadata={"platform": ""}, id="all"),
+        Document(page_content="macOS", metadata={"platform": "macos"}, id="macos"),
+    ]
+    embeddings = DeterministicFakeEmbedding(size=8)
+    vector_store = Chroma(
+        collection_name="scope",
+        persist_directory=str(tmp_path / "chroma_db"),
+        embedding_function=embeddings,
+    )
+    vector_store.add_documents(documents, ids=[doc.id for doc in documents])
+    export_index(vector_store, str(tmp_path / "readonly_index"))
+    readonly = ReadOnlyVectorStore(str(tmp_path / "readonly_index"), embeddings)
+
+    for store in (vector_store, readonly):
+        hits = store.similarity_search_by_vector_with_relevance_scores(
+            embeddings.embed_query("Enroll"), k=4, filter=Scope("ios").where()
+        )
+        assert {doc.id for doc, _ in hits} == {"legacy", "ios", "all"}
+    readonly.close()
+
+
+def test_search_in_scope_falls_back_to_all_docs():
+    retriever = MagicMock()
+    retriever.search.side_effect = [[], [("doc", 0.9)]]
+
+    assert search_in_scope(retriever, "Reset an iPad", [1.0]) == [("doc", 0.9)]
+    assert [c.args[2] for c in retriever.search.call_args_list] == [
+        Scope(platform="ios"),
+        Scope(),
+    ]
+
+    retriever.search.reset_mock(side_effect=True)
+    retriever.search.return_value = []
+    assert search_in_scope(retriever, "Reset an iPad", [1.0], Scope("ios")) == []
+    retriever.search.assert_called_once_with("Reset an iPad", [1.0], Scope("ios"))
@@ -0,0 +1,129 @@
+import pytest
+from unittest.mock import patch
+from langchain_core.documents import Document
+
+from IntuneBuddy.ingest import FileDone
+from IntuneBuddy.scheduler import (
+    AdaptiveBatchSizer,
+    EmbeddingAborted,
+    EmbeddingScheduler,
+    add_with_bisection,
+)
+
+
+class FakeVectorStore:
+    def __init__(self, bad_ids=(), error=None):
+        self.bad_ids = set(bad_ids)
+        self.error = error
+        self.stored = {}
+        self.calls = 0
+
+    def add_documents(self, documents, ids):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        if self.bad_ids.intersection(ids):
+            raise ValueError("embedding failed")
+        for doc_id, doc in zip(ids, documents):
+            self.stored[doc_id] = doc
+
+
+def make_docs(source, count):
+    return [
+        Document(
+            page_content=f"{source} {i}",
+            metadata={"source": source},
+            id=f"{source}-{i}",
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay():
+    with patch("IntuneBuddy.scheduler.RETRY_DELAY", 0):
+        yield
+
+
+def test_sizer_grows_while_fast():
+    sizer = AdaptiveBatchSizer(initial=16, maximum=100, target_latency=10)
+    sizer.record(16, 1.0)
+    assert sizer.size == 32
+    sizer.record(32, 1.0)
+    sizer.record(64, 1.0)
+    assert sizer.size == 100
+
+
+def test_sizer_shrinks_when_slow():
+    sizer = AdaptiveBatchSizer(initial=64, minimum=8, target_latency=10)
+    sizer.record(64, 40.0)
+    assert sizer.size == 16
+
+
+def test_sizer_steps_back_on_throughput_drop():
+    sizer = AdaptiveBatchSizer(initial=64, target_latency=10)
+    sizer.record(64, 1.0)
+    sizer.record(128, 4.0)
+    assert sizer.size == 64
+
+
+def test_add_with_bisection_isolates_bad_document():
+    docs = make_docs("a.md", 8)
+    store = FakeVectorStore(bad_ids=["a.md-5"])
+
+    failed = add_with_bisection(store, docs)
+
+    assert [doc.id for doc, _ in failed] == ["a.md-5"]
+    assert len(store.stored) == 7
+
+
+def test_add_with_bisection_aborts_when_model_unreachable():
+    store = FakeVectorStore(error=ConnectionError("Failed to connect to Ollama"))
+
+    with pytest.raises(EmbeddingAborted):
+        add_with_bisection(store, make_docs("a.md", 64))
+    # Retried once, never bisected
+    assert store.calls == 2
+
+
+def test_scheduler_aborts_after_consecutive_failed_batches():
+    items = make_docs("a.md", 40) + [FileDone("a.md", "hash-a")]
+    store = FakeVectorStore(error=ValueError("model not found"))
+    file_index = {}
+
+    scheduler = EmbeddingScheduler(
+        store, workers=1, sizer=AdaptiveBatchSizer(initial=8, minimum=8), max_failures=2
+    )
+    with pytest.raises(EmbeddingAborted):
+        scheduler.run(iter(items), file_index)
+
+    assert file_index == {}
+    # Bisecting a batch of 8 makes 30 calls, not every one of the 5 batches ran
+    assert store.calls < 5 * 30
+
+
+def test_scheduler_commits_only_complete_files():
+    items = (
+        make_docs("a.md", 3)
+        + [FileDone("a.md", "hash-a")]
+        + make_docs("b.md", 3)
+        + [FileDone("b.md", "hash-b")]
+        + [FileDone("empty.md", "hash-empty")]
+    )
+    store = FakeVectorStore(bad_ids=["b.md-1"])
+    file_index = {}
+    progress = []
+
+    scheduler = EmbeddingScheduler(
+        store, workers=2, sizer=AdaptiveBatchSizer(initial=2, minimum=1)
+    )
+    changed_files = scheduler.run(
+        iter(items),
+        file_index,
+        on_progress=lambda stored, rate: progress.append(stored),
+    )
+
+    assert file_index == {"a.md": "hash-a", "empty.md": "hash-empty"}
+    assert changed_files == 2
+    assert [doc.id for doc, _ in scheduler.failed] == ["b.md-1"]
+    assert sum(progress) == scheduler.stored == 5
@@ -0,0 +1,48 @@
+import pytest
+
+from IntuneBuddy.scope import Scope, infer_scope, parse_scope, source_metadata
+
+
+def test_source_metadata():
+    assert source_metadata("enrollment/macos-enroll.md", "intune-service") == {
+        "platform": "macos",
+        "area": "enrollment",
+        "tree": "intune-service",
+    }
+    # Docs for several or no platforms apply to all of them
+    assert source_metadata("apps/apps-add-ios-android.md", "intune-service")[
+        "platform"
+    ] == ("")
+    assert source_metadata("index.md", "intune-service") == {
+        "platform": "",
+        "area": "",
+        "tree": "intune-service",
+    }
+    assert source_metadata("requirements.md", "autopilot") == {
+        "platform": "windows",
+        "area": "autopilot",
+        "tree": "autopilot",
+    }
+
+
+def test_infer_scope():
+    assert infer_scope("How do I enroll a MacBook with macOS ADE?") == Scope("macos")
+    assert infer_scope("Can I reset an iPad?") == Scope("ios")
+    # No platform, or more than one, doesn't filter
+    assert not infer_scope("What is a compliance policy?")
+    assert not infer_scope("Compare iOS and Android enrollment")
+
+
+def test_parse_scope():
+    assert parse_scope("macOS enrollment") == Scope("macos", "enrollment")
+    assert parse_scope("autopilot") == Scope(tree="autopilot")
+    assert parse_scope("") == Scope()
+    with pytest.raises(ValueError):
+        parse_scope("apps enrollment")
+
+
+def test_scope_where():
+    assert Scope().where() is None
+    assert Scope(area="apps").where() == {"area": "apps"}
+    assert str(Scope("ios", "apps")) == "ios, apps"
+    assert str(Scope()) == "all"
@@ -0,0 +1,209 @@
+import json
+import threading
+import pytest
+import urllib.request
+import urllib.error
+
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+
+from IntuneBuddy.server import (
+    AnswerService,
+    EmbeddingBatcher,
+    GenerationQueue,
+    ServerBusy,
+    make_server,
+)
+from IntuneBuddy.scope import Scope
+
+
+def fake_retriever():
+    retriever = MagicMock()
+    retriever.error = None
+    retriever.is_ready.return_value = True
+    retriever.embed_queries.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+    retriever.search.return_value = [
+        (Document(page_content="ADE", metadata={"source": "enroll/ade.md"}), 0.91234)
+    ]
+    return retriever
+
+
+@pytest.fixture
+def server():
+    chain = MagicMock()
+    chain.invoke.side_effect = lambda inputs: f"Answer: {inputs['question']}"
+    chain.stream.side_effect = lambda inputs: iter(["<think>x</think>", "Use ", "ADE."])
+    answer_cache = MagicMock()
+    answer_cache.lookup.return_value = None
+    service = AnswerService(
+        chain, fake_retriever(), model="gemma3:12b", answer_cache=answer_cache
+    )
+    server = make_server(service, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def request(server, path, body=None):
+    url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=5) as response:
+            return response.status, response.headers, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read().decode()
+
+
+def test_health(server):
+    status, _, body = request(server, "/health")
+    assert (status, json.loads(body)) == (200, {"status": "ready"})
+
+
+def test_ask(server):
+    status, _, body = request(server, "/ask", {"question": "How do I enroll?"})
+
+    assert status == 200
+    assert json.loads(body) == {
+        "answer": "Answer: How do I enroll?",
+        "sources": [{"source": "enroll/ade.md", "score": 0.9123}],
+        "generations": 1,
+        "cached": False,
+    }
+    server.service.answer_cache.store.assert_called_once()
+
+
+def test_ask_caches_within_the_platform_of_the_question(server):
+    request(server, "/ask", {"question": "Enroll an iPhone with ADE"})
+
+    answer_cache = server.service.answer_cache
+    answer_cache.lookup.assert_called_once_with(
+        "gemma3:12b", [1.0, 0.0], Scope(platform="ios")
+    )
+    assert answer_cache.store.call_args.args[-1] == Scope(platform="ios")
+
+
+def test_ask_with_history_skips_cache(server):
+    status, _, _ = request(
+        server, "/ask", {"question": "And iOS?", "history": "User: enroll?"}
+    )
+
+    assert status == 200
+    server.service.answer_cache.lookup.assert_not_called()
+    server.service.answer_cache.store.assert_not_called()
+
+
+def test_ask_streams_events(server):
+    status, headers, body = request(
+        server, "/ask", {"question": "How do I enroll?", "stream": True}
+    )
+
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: ") :], json.loads(block.split("\n")[1][6:]))
+        for block in body.strip().split("\n\n")
+    ]
+    assert [event for event, _ in events] == ["sources", "token", "token", "done"]
+    assert "".join(data["text"] for event, data in events if event == "token") == (
+        "Use ADE."
+    )
+    assert events[-1][1] == {"answer": "Use ADE.", "generations": 1, "cached": False}
+
+
+def test_search(server):
+    status, _, body = request(server, "/search", {"question": "enroll"})
+
+    assert status == 200
+    assert json.loads(body)["sources"][0]["source"] == "enroll/ade.md"
+    server.service.chain.invoke.assert_not_called()
+
+
+@pytest.mark.parametrize("body", [{}, {"question": "  "}, {"question": 1}])
+def test_ask_requires_question(server, body):
+    status, _, _ = request(server, "/ask", body)
+    assert status == 400
+
+
+def test_unknown_path(server):
+    assert request(server, "/nope")[0] == 404
+
+
+def test_ask_while_index_loads(server):
+    server.service.retriever.wait.return_value = False
+
+    status, _, body = request(server, "/ask", {"question": "How do I enroll?"})
+
+    assert status == 503
+    assert "loading" in json.loads(body)["error"]
+
+
+def test_ask_when_generations_are_busy(server):
+    server.service.generations.queue_size = 0
+    server.service.generations.concurrency = 0
+
+    assert request(server, "/ask", {"question": "How do I enroll?"})[0] == 503
+
+
+def test_ask_hides_unexpected_errors(server):
+    server.service.chain.invoke.side_effect = RuntimeError("/home/admin/secret")
+
+    status, _, body = request(server, "/ask", {"question": "How do I enroll?"})
+
+    assert status == 500
+    assert json.loads(body) == {"error": "The question could not be answered."}
+
+
+def test_ask_logs_traceback_when_verbose(server, capsys):
+    server.verbose = True
+    server.service.chain.invoke.side_effect = RuntimeError("model crashed")
+
+    assert request(server, "/ask", {"question": "How do I enroll?"})[0] == 500
+    assert "RuntimeError: model crashed" in capsys.readouterr().err
+
+
+def test_embedding_batcher_batches_concurrent_questions():
+    calls = []
+
+    def embed_queries(texts):
+        calls.append(sorted(texts))
+        return [[float(len(text))] for text in texts]
+
+    # The batch is sent as soon as it is full, long before max_wait
+    batcher = EmbeddingBatcher(embed_queries, max_batch=3, max_wait=5)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda t=text: results.update({t: batcher.embed(t)}))
+        for text in ["a", "bb", "ccc"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0]}
+    assert calls == [["a", "bb", "ccc"]]
+
+
+def test_embedding_batcher_passes_errors():
+    batcher = EmbeddingBatcher(MagicMock(side_effect=RuntimeError("down")))
+    with pytest.raises(RuntimeError, match="down"):
+        batcher.embed("question")
+    batcher.close()
+
+
+def test_generation_queue_turns_away_when_full():
+    generations = GenerationQueue(concurrency=1, queue_size=0)
+
+    with generations.slot():
+        with pytest.raises(ServerBusy):
+            with generations.slot():
+                pass
+
+    with generations.slot():
+        assert generations.pending == 1
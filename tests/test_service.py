@@ -0,0 +1,141 @@
+import pytest
+from unittest.mock import ANY, MagicMock, patch
+
+from IntuneBuddy.scope import Scope
+from IntuneBuddy.service import RetrieverService
+from IntuneBuddy.sync import SyncSummary
+
+
+def test_service_serves_index_and_refreshes():
+    vector_store = MagicMock()
+    vector_store.embeddings.embed_query.return_value = [1.0]
+    retriever = MagicMock()
+    retriever.search.return_value = [("doc", 0.9), ("other", 0.8)]
+    with patch(
+        "IntuneBuddy.vector.open_vector_store", return_value=vector_store
+    ), patch(
+        "IntuneBuddy.vector.get_retriever", return_value=retriever
+    ) as mock_get_retriever, patch(
+        "IntuneBuddy.vector.sync_index", return_value=SyncSummary()
+    ) as mock_sync, patch(
+        "IntuneBuddy.context.ContextPacker"
+    ) as mock_packer:
+        mock_packer.return_value.pack.return_value = [("doc", 0.9)]
+        service = RetrieverService(context_tokens=500).start()
+        assert service.invoke("How do I enroll a Mac?") == ["doc"]
+        assert service.wait_refreshed(timeout=5)
+
+    mock_sync.assert_called_once_with(vector_store, verbose=False, rechunk=False)
+    mock_get_retriever.assert_called_once_with(vector_store, k=16, generation=ANY)
+    mock_packer.assert_called_once_with(vector_store, 500)
+    retriever.search.assert_called_once_with("How do I enroll a Mac?", [1.0], Scope())
+    mock_packer.return_value.pack.assert_called_once_with(
+        "How do I enroll a Mac?", [1.0], ["doc", "other"]
+    )
+
+
+def test_service_without_refresh():
+    with patch("IntuneBuddy.vector.open_vector_store"), patch(
+        "IntuneBuddy.vector.get_retriever"
+    ), patch("IntuneBuddy.vector.sync_index") as mock_sync:
+        service = RetrieverService(refresh=False).start()
+        assert service.wait_refreshed(timeout=5)
+
+    assert service.is_ready()
+    mock_sync.assert_not_called()
+
+
+def test_service_raises_when_index_cannot_open():
+    with patch(
+        "IntuneBuddy.vector.open_vector_store", side_effect=RuntimeError("broken")
+    ):
+        service = RetrieverService().start()
+        with pytest.raises(RuntimeError):
+            service.invoke("question")
+
+
+def test_service_warm_up():
+    vector_store = MagicMock()
+    with patch(
+        "IntuneBuddy.vector.open_vector_store", return_value=vector_store
+    ), patch("IntuneBuddy.vector.get_retriever"), patch(
+        "IntuneBuddy.vector.sync_index"
+    ):
+        service = RetrieverService(refresh=False, warm_up=True).start()
+        assert service.wait_refreshed(timeout=5)
+
+    vector_store.embeddings.warm_up.assert_called_once_with()
+
+
+def test_service_opens_new_generation_after_refresh():
+    old_store, new_store = MagicMock(), MagicMock()
+    summary = SyncSummary()
+    summary.added = 1
+    with patch(
+        "IntuneBuddy.generations.current_generation", side_effect=["gen-1", "gen-2"]
+    ), patch(
+        "IntuneBuddy.vector.open_vector_store", side_effect=[old_store, new_store]
+    ) as mock_open, patch(
+        "IntuneBuddy.vector.get_retriever"
+    ) as mock_get_retriever, patch(
+        "IntuneBuddy.vector.sync_index", return_value=summary
+    ) as mock_sync, patch(
+        "IntuneBuddy.context.ContextPacker"
+    ):
+        service = RetrieverService().start()
+        assert service.wait_refreshed(timeout=5)
+
+    # The refresh reads the generation that was being served
+    mock_sync.assert_called_once_with(old_store, verbose=False, rechunk=False)
+    assert [c.args for c in mock_open.call_args_list] == [("gen-1",), ("gen-2",)]
+    mock_get_retriever.assert_called_with(new_store, k=16, generation="gen-2")
+    assert service.vector_store is new_store
+
+
+def test_service_infers_scope_and_falls_back():
+    retriever = MagicMock()
+    retriever.search.side_effect = [[], [("doc", 0.9)]]
+    with patch("IntuneBuddy.vector.open_vector_store"), patch(
+        "IntuneBuddy.vector.get_retriever", return_value=retriever
+    ), patch("IntuneBuddy.context.ContextPacker") as mock_packer:
+        mock_packer.return_value.pack.side_effect = lambda q, e, docs: [
+            (doc, 1.0) for doc in docs
+        ]
+        service = RetrieverService(refresh=False).start()
+        assert service.invoke("Reset an iPad", [1.0]) == ["doc"]
+
+    # Nothing was found for iOS, so everything was searched
+    assert [c.args[2] for c in retriever.search.call_args_list] == [
+        Scope(platform="ios"),
+        Scope(),
+    ]
+
+
+def test_service_applies_embedding_keep_alive():
+    with patch("IntuneBuddy.vector.open_vector_store"), patch(
+        "IntuneBuddy.vector.get_retriever"
+    ), patch("IntuneBuddy.vector.set_embedding_keep_alive") as mock_keep_alive:
+        service = RetrieverService(refresh=False, keep_alive="1h").start()
+        assert service.wait(timeout=5)
+
+    mock_keep_alive.assert_called_once_with(3600)
+
+
+def test_embeddings_use_keep_alive():
+    from IntuneBuddy import vector
+
+    with patch.object(vector, "_embeddings", None), patch.object(
+        vector, "_embedding_keep_alive", 1800
+    ), patch("IntuneBuddy.vector.OllamaEmbeddings") as mock_ollama, patch(
+        "IntuneBuddy.vector.EmbeddingCache"
+    ):
+        embeddings = vector.get_embeddings()
+        mock_ollama.assert_called_once_with(
+            model=vector.EMBEDDING_MODEL, keep_alive=1800
+        )
+
+        vector.set_embedding_keep_alive(None)
+        assert embeddings.embeddings.keep_alive is None
+        # The warm-up embeds with the model of the store
+        embeddings.warm_up()
+        embeddings.embeddings.embed_query.assert_called_once_with("Intune")
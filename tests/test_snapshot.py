@@ -0,0 +1,239 @@
+import io
+import os
+import json
+import hashlib
+import zipfile
+import threading
+import pytest
+import requests
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from IntuneBuddy.snapshot import (
+    SnapshotError,
+    download_file,
+    install_snapshot,
+    parse_manifest,
+)
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+SNAPSHOT = make_zip(
+    {
+        "chroma_db/chroma.sqlite3": b"sqlite" * 50000,
+        "file_index.json": json.dumps({"a.md": "hash"}),
+    }
+)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    """Stand-in for the release download, with Range support."""
+
+    files = {}
+    ranges = True
+    # Close the connection after this many bytes of a body
+    fail_after = None
+    requests_seen = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("Range")))
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.ranges:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.fail_after is not None:
+            self.wfile.write(body[: self.fail_after])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    handler = type(
+        "Handler",
+        (SnapshotHandler,),
+        {
+            "files": {
+                "/vector_store.zip": SNAPSHOT,
+                "/vector_store.zip.sha256": (
+                    f"{sha256(SNAPSHOT)}  vector_store.zip\n".encode()
+                ),
+            },
+            "requests_seen": [],
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def install(server, tmp_path, **kwargs):
+    db_location = tmp_path / "chroma_db"
+    index_file = tmp_path / "file_index.json"
+    install_snapshot(
+        str(db_location),
+        str(index_file),
+        str(tmp_path / "downloads"),
+        url=f"{server.base_url}/vector_store.zip",
+        manifest_url=f"{server.base_url}/vector_store.zip.sha256",
+        **kwargs,
+    )
+    return db_location, index_file
+
+
+def test_parse_manifest():
+    digest = "a" * 64
+    text = f"# snapshot\n{digest}  vector_store.zip\n{digest} *chroma_db/x.bin\n"
+
+    assert parse_manifest(text) == {
+        "vector_store.zip": digest,
+        "chroma_db/x.bin": digest,
+    }
+    with pytest.raises(SnapshotError, match="Line 1"):
+        parse_manifest("not a checksum")
+
+
+def test_install_snapshot(server, tmp_path):
+    db_location, index_file = install(server, tmp_path)
+
+    assert (db_location / "chroma.sqlite3").read_bytes() == b"sqlite" * 50000
+    assert json.loads(index_file.read_text()) == {"a.md": "hash"}
+    # Nothing is left behind
+    assert os.listdir(tmp_path / "downloads") == []
+    assert sorted(os.listdir(tmp_path)) == ["chroma_db", "downloads", "file_index.json"]
+
+
+def test_install_snapshot_checks_extracted_files(server, tmp_path):
+    server.RequestHandlerClass.files["/vector_store.zip.sha256"] = (
+        f"{sha256(SNAPSHOT)}  vector_store.zip\n"
+        f"{sha256(b'other')}  chroma_db/chroma.sqlite3\n"
+    ).encode()
+
+    with pytest.raises(SnapshotError, match="chroma_db/chroma.sqlite3"):
+        install(server, tmp_path)
+    assert not (tmp_path / "chroma_db").exists()
+
+
+def test_install_snapshot_rejects_checksum_mismatch(server, tmp_path):
+    server.RequestHandlerClass.files["/vector_store.zip.sha256"] = (
+        f"{sha256(b'other')}  vector_store.zip\n".encode()
+    )
+
+    with pytest.raises(SnapshotError, match="does not match"):
+        install(server, tmp_path)
+    assert not (tmp_path / "chroma_db").exists()
+    assert not (tmp_path / "file_index.json").exists()
+    # The bad download is removed so the next run fetches it again
+    assert os.listdir(tmp_path / "downloads") == []
+
+
+def test_install_snapshot_without_manifest(server, tmp_path):
+    del server.RequestHandlerClass.files["/vector_store.zip.sha256"]
+
+    db_location, _ = install(server, tmp_path)
+
+    assert (db_location / "chroma.sqlite3").exists()
+
+
+def test_install_snapshot_rejects_unsafe_paths(server, tmp_path):
+    unsafe = make_zip({"../outside.txt": b"x", "file_index.json": b"{}"})
+    server.RequestHandlerClass.files["/vector_store.zip"] = unsafe
+    server.RequestHandlerClass.files["/vector_store.zip.sha256"] = (
+        f"{sha256(unsafe)}  vector_store.zip\n".encode()
+    )
+
+    with pytest.raises(SnapshotError, match="unsafe path"):
+        install(server, tmp_path)
+    assert not (tmp_path / "outside.txt").exists()
+
+
+def test_install_snapshot_replaces_existing_store(server, tmp_path):
+    (tmp_path / "chroma_db").mkdir()
+    (tmp_path / "chroma_db" / "stale.bin").write_bytes(b"old")
+
+    db_location, _ = install(server, tmp_path)
+
+    assert os.listdir(db_location) == ["chroma.sqlite3"]
+    assert not (tmp_path / "chroma_db.old").exists()
+
+
+def test_download_resumes_partial_file(server, tmp_path):
+    path = tmp_path / "vector_store.zip"
+    (tmp_path / "vector_store.zip.part").write_bytes(SNAPSHOT[:1000])
+
+    download_file(f"{server.base_url}/vector_store.zip", str(path))
+
+    assert path.read_bytes() == SNAPSHOT
+    assert server.RequestHandlerClass.requests_seen[-1][1] == "bytes=1000-"
+
+
+def test_download_restarts_when_range_is_ignored(server, tmp_path):
+    server.RequestHandlerClass.ranges = False
+    path = tmp_path / "vector_store.zip"
+    (tmp_path / "vector_store.zip.part").write_bytes(b"garbage")
+
+    download_file(f"{server.base_url}/vector_store.zip", str(path))
+
+    assert path.read_bytes() == SNAPSHOT
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    path = tmp_path / "vector_store.zip"
+    url = f"{server.base_url}/vector_store.zip"
+    server.RequestHandlerClass.fail_after = 5000
+
+    with pytest.raises((SnapshotError, requests.RequestException)):
+        download_file(url, str(path), chunk_size=1024)
+    assert not path.exists()
+    partial = (tmp_path / "vector_store.zip.part").stat().st_size
+    assert 0 < partial < len(SNAPSHOT)
+
+    server.RequestHandlerClass.fail_after = None
+    download_file(url, str(path))
+
+    assert path.read_bytes() == SNAPSHOT
+    assert server.RequestHandlerClass.requests_seen[-1][1] == f"bytes={partial}-"
@@ -0,0 +1,197 @@
+import json
+import pytest
+
+from unittest.mock import MagicMock, patch
+
+from IntuneBuddy.chunking import CHUNKER_VERSION, Chunk
+from IntuneBuddy.generations import GenerationStore
+from IntuneBuddy.ingest import FileDone, build_documents
+from IntuneBuddy.sync import (
+    SyncSummary,
+    apply_sync,
+    chunk_hash,
+    diff_file,
+    diff_stream,
+    find_removed_files,
+    stored_chunk_hashes,
+)
+
+
+def chunks(*texts):
+    return [Chunk(text, {}) for text in texts]
+
+
+def hashes(*texts):
+    return [
+        chunk_hash(doc.page_content, doc.metadata)
+        for doc in build_documents("a.md", chunks(*texts))
+    ]
+
+
+def test_diff_file_only_returns_changed_chunks():
+    summary = SyncSummary()
+    documents = build_documents("a.md", chunks("one", "two changed", "three", "four"))
+    old_hashes = hashes("one", "two", "three")
+
+    changed, new_hashes, stale_ids = diff_file("a.md", documents, old_hashes, summary)
+
+    assert [doc.id for doc in changed] == ["a.md-1", "a.md-3"]
+    assert new_hashes == hashes("one", "two changed", "three", "four")
+    assert stale_ids == []
+    assert (summary.added, summary.updated, summary.unchanged) == (1, 1, 2)
+
+
+def test_diff_file_reports_trailing_stale_ids():
+    summary = SyncSummary()
+    documents = build_documents("a.md", chunks("one"))
+    old_hashes = hashes("one", "two", "three")
+
+    changed, _, stale_ids = diff_file("a.md", documents, old_hashes, summary)
+
+    assert changed == []
+    assert stale_ids == ["a.md-1", "a.md-2"]
+
+
+def test_diff_stream_uses_lookup_for_unknown_files():
+    summary = SyncSummary()
+    items = build_documents("a.md", chunks("one", "two")) + [FileDone("a.md", "hash-a")]
+    lookup_old = MagicMock(return_value=hashes("one"))
+
+    result = list(diff_stream(iter(items), {}, lookup_old, summary))
+
+    lookup_old.assert_called_once_with("a.md")
+    assert [item.id for item in result[:-1]] == ["a.md-1"]
+    assert result[-1] == FileDone("a.md", "hash-a", hashes("one", "two"), [])
+
+
+def test_find_removed_files():
+    file_index = {"a.md": "1", "b.md": "2", "c.md": "3"}
+    assert find_removed_files(file_index, iter(["a.md", "c.md"])) == ["b.md"]
+
+
+def test_stored_chunk_hashes():
+    vector_store = MagicMock()
+    vector_store.get.return_value = {
+        "ids": ["a.md-1", "a.md-0"],
+        "documents": ["two", "one"],
+        "metadatas": [{"source": "a.md"}, {"source": "a.md"}],
+    }
+
+    assert stored_chunk_hashes(vector_store, "a.md") == [
+        chunk_hash("one", {"source": "a.md"}),
+        chunk_hash("two", {"source": "a.md"}),
+    ]
+    vector_store.get.assert_called_once_with(
+        where={"source": "a.md"}, include=["documents", "metadatas"]
+    )
+
+
+def test_diff_file_picks_up_metadata_changes():
+    summary = SyncSummary()
+    documents = build_documents("a.md", chunks("one"))
+    old_hashes = [chunk_hash("one", {"source": "a.md", "type": "intune"})]
+
+    changed, _, _ = diff_file("a.md", documents, old_hashes, summary)
+
+    assert changed == documents
+    assert summary.updated == 1
+
+
+def test_apply_sync_deletes_stale_and_removed_chunks():
+    summary = SyncSummary()
+    vector_store = MagicMock()
+    file_index = {"a.md": "new", "gone.md": "old"}
+    chunk_manifest = {"gone.md": ["x", "y"]}
+    committed = [FileDone("a.md", "new", ["h0"], ["a.md-1"])]
+
+    apply_sync(
+        vector_store,
+        committed,
+        ["gone.md"],
+        file_index,
+        chunk_manifest,
+        MagicMock(),
+        summary,
+    )
+
+    vector_store.delete.assert_called_once_with(
+        ids=["a.md-1", "gone.md-0", "gone.md-1"]
+    )
+    assert file_index == {"a.md": "new"}
+    assert chunk_manifest == {"a.md": ["h0"]}
+    assert (summary.deleted, summary.removed_files) == (3, 1)
+
+
+def test_apply_sync_without_changes_does_not_delete():
+    vector_store = MagicMock()
+
+    apply_sync(vector_store, [], [], {}, {}, MagicMock(), SyncSummary())
+
+    vector_store.delete.assert_not_called()
+
+
+@pytest.fixture
+def downloaded_index(tmp_path):
+    """A current generation as a snapshot install leaves it, without index state."""
+    store = GenerationStore(str(tmp_path / "index"))
+    generation = store.create()
+    (tmp_path / "index" / generation.name / "chroma_db").mkdir()
+    with open(generation.index_file, "w") as f:
+        json.dump({"a.md": "hash-a"}, f)
+    store.activate(generation)
+    with patch("IntuneBuddy.vector.get_generations", return_value=store), patch(
+        "IntuneBuddy.vector.ensure_intunedocs_up_to_date"
+    ), patch("IntuneBuddy.vector.open_vector_store"), patch(
+        "IntuneBuddy.vector.get_lexical_index"
+    ), patch(
+        "IntuneBuddy.vector.get_head_commit", return_value="abc"
+    ), patch(
+        "IntuneBuddy.vector.iter_markdown_files", return_value=[("/docs/a.md", "a.md")]
+    ), patch(
+        "IntuneBuddy.vector.get_intune_docs", return_value=iter(())
+    ) as mock_docs:
+        yield generation, mock_docs
+
+
+def test_sync_without_rechunk_keeps_outdated_chunks(downloaded_index):
+    from IntuneBuddy.vector import sync_index
+
+    generation, mock_docs = downloaded_index
+
+    summary = sync_index(verbose=False, rechunk=False)
+
+    # Only changed files are split, by hash against the downloaded file index
+    mock_docs.assert_called_once_with({"a.md": "hash-a"}, None)
+    assert summary.rechunk_pending
+    with open(generation.state_file) as f:
+        assert json.load(f) == {"commit": "abc"}
+
+
+def test_sync_rechunks_outdated_index(downloaded_index):
+    from IntuneBuddy.vector import sync_index
+
+    generation, mock_docs = downloaded_index
+
+    summary = sync_index(verbose=False)
+
+    mock_docs.assert_called_once_with({}, None)
+    assert not summary.rechunk_pending
+    with open(generation.state_file) as f:
+        assert json.load(f) == {"commit": "abc", "chunker": CHUNKER_VERSION}
+
+
+def test_sync_records_chunker_without_head_commit(downloaded_index):
+    from IntuneBuddy.vector import sync_index
+
+    generation, mock_docs = downloaded_index
+
+    # A docs snapshot without .git, or a failed rev-parse
+    with patch("IntuneBuddy.vector.get_head_commit", return_value=None):
+        sync_index(verbose=False)
+        with open(generation.state_file) as f:
+            assert json.load(f) == {"chunker": CHUNKER_VERSION}
+
+        summary = sync_index(verbose=False)
+
+    assert not summary.rechunk_pending
+    assert mock_docs.call_args_list[-1].args == ({"a.md": "hash-a"}, None)
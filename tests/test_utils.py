@@ -1,14 +1,22 @@
+import asyncio
 import subprocess
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from langchain_core.documents import Document
 
 from IntuneBuddy.utils import (
+    aretry_chain_invoke,
+    astream_chain,
+    chain_inputs,
     clean_output,
     ensure_ollama_installed,
     ensure_git_installed,
     ensure_model_installed,
     retry_chain_invoke,
+    run_startup_checks,
     stop_models,
+    ThinkFilter,
 )
 
 
@@ -124,6 +132,108 @@ def test_stop_models_failure():
     with patch(
         "subprocess.run", side_effect=subprocess.CalledProcessError(1, "ollama")
     ):
-        with pytest.raises(SystemExit) as e:
-            stop_models(model_name)
-        assert e.value.code == 1
+        assert stop_models(model_name, "other_model") == [model_name, "other_model"]
+
+
+def test_ensure_model_installed_with_installed_models():
+    with patch("subprocess.run") as mock_run:
+        ensure_model_installed("test_model", "test_model:latest\n")
+        mock_run.assert_not_called()
+
+
+def test_run_startup_checks_lists_models_once():
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value = MagicMock(stdout="gemma3:12b\nmxbai-embed-large\n")
+        run_startup_checks("gemma3:12b", "mxbai-embed-large")
+
+        commands = [call.args[0] for call in mock_run.call_args_list]
+        assert commands.count(["ollama", "list"]) == 1
+        assert ["git", "--version"] in commands
+        assert ["ollama", "-v"] in commands
+
+
+def test_retry_chain_invoke_retries_only_on_fallback():
+    chain = MagicMock()
+    chain.invoke.side_effect = ["Fallback response", "Valid response"]
+
+    with patch("time.sleep") as mock_sleep:
+        result, generations = retry_chain_invoke(
+            chain, {"key": "value"}, "Fallback response", backoff=0.5
+        )
+
+    assert (result, generations) == ("Valid response", 2)
+    mock_sleep.assert_called_once_with(0.5)
+
+
+def test_retry_chain_invoke_stops_at_budget():
+    chain = MagicMock()
+    chain.invoke.return_value = "Fallback response"
+
+    with patch("time.sleep"):
+        result, generations = retry_chain_invoke(
+            chain, {}, "Fallback response", max_retries=5, backoff=10, budget=15
+        )
+
+    # The first retry waits 10s, the second would wait 20s and exceed the budget
+    assert (result, generations) == ("Fallback response", 2)
+
+
+def test_aretry_chain_invoke_retries_only_on_fallback():
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(side_effect=["Fallback response", "Valid response"])
+
+    with patch("asyncio.sleep") as mock_sleep:
+        result, generations = asyncio.run(
+            aretry_chain_invoke(chain, {}, "Fallback response", backoff=0.5)
+        )
+
+    assert (result, generations) == ("Valid response", 2)
+    mock_sleep.assert_called_once_with(0.5)
+
+
+def test_think_filter_strips_tags_split_across_chunks():
+    think_filter = ThinkFilter()
+    chunks = ["<thi", "nk>hidden</th", "ink>Intune ", "answer <", "b>bold</b>"]
+
+    visible = "".join(think_filter.feed(chunk) for chunk in chunks)
+    visible += think_filter.flush()
+
+    assert visible == "Intune answer <b>bold</b>"
+
+
+def test_think_filter_drops_unclosed_think_block():
+    think_filter = ThinkFilter()
+    assert think_filter.feed("Answer<think>still thinking") == "Answer"
+    assert think_filter.flush() == ""
+
+
+def test_astream_chain():
+    async def astream(inputs):
+        for chunk in ["<think>x</think>", "Hello", " world"]:
+            yield chunk
+
+    chain = MagicMock()
+    chain.astream = astream
+    seen = []
+
+    raw, first_token = asyncio.run(astream_chain(chain, {"key": "value"}, seen.append))
+
+    assert raw == "<think>x</think>Hello world"
+    assert seen[-1] == "Hello world"
+    assert first_token >= 0
+
+
+def test_chain_inputs_link_to_section():
+    docs = [
+        Document(
+            page_content="Use ADE.",
+            metadata={"source": "enrollment/macos-enroll.md", "anchor": "ade"},
+        ),
+        Document(page_content="Other.", metadata={"source": "other.md"}),
+    ]
+
+    inputs = chain_inputs("How do I enroll?", docs, "")
+
+    assert inputs["metadata_source"] == "enrollment/macos-enroll#ade"
+    assert inputs["Intune_docs"] == "Use ADE.\n\nOther."
+    assert chain_inputs("Hi", docs[1:], "")["metadata_source"] == "other"